@@ -146,6 +146,13 @@ class TaskAdmin(admin.ModelAdmin):
         return super().response_change(request, obj)
 
 
+class MetricAdmin(admin.ModelAdmin):
+    list_display = ["id", "mission", "repo", "metric", "dimension", "period", "value"]
+    list_filter = ["metric"]
+    search_fields = ("repo", "dimension")
+    raw_id_fields = ["mission", "task"]
+
+
 class TaskInline(admin.TabularInline):
     model = Task
     fields = ["name", "category", "parent", "url", "order", "reporting"]
@@ -350,3 +357,4 @@ admin_site.register(User, UserAdmin)
 admin_site.register(Integration, IntegrationAdmin)
 admin_site.register(MissionEvaluation, MissionEvaluationAdmin)
 admin_site.register(RawData, RawDataAdmin)
+admin_site.register(Metric, MetricAdmin)
@@ -1,6 +1,5 @@
 import datetime, json, random, requests
 from bs4 import BeautifulSoup
-from openai import OpenAI
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
@@ -48,6 +47,8 @@ def llm_evaluate_completion(mission):
     problems = []
     if mission.is_test():
         return problems
+    from openai import OpenAI  # deferred, so the web app doesn't import the SDK
+
     client = OpenAI()
     prompt = get_prompt_from_github("evaluate_report")
     completion = client.chat.completions.create(
@@ -1,5 +1,5 @@
+import os
 from django.apps import AppConfig
-import pluggy
 
 pm = None
 
@@ -12,53 +12,22 @@ class MissionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "missions"
 
+    # plugins are declared in missions.registry and imported on first use,
+    # so web, manage.py, and worker startup don't pay for every vendor SDK
     def ready(self):
         global pm
         from missions import hookspecs
-        from .plugins import (
-            linear,
-            github,
-            figma,
-            jira,
-            notion,
-            monday,
-            sentry,
-            slack,
-            harvest,
-            openai,
-            anthropic,
-            gemini,
-            mistral,
-            quantify,
-            agent,
-            fetch,
-            evals,
-            scrape,
-            bing,
-            nemotron,
-            # Import other files with plugins here
-        )
+        from missions.registry import PluginRegistry
 
-        pm = pluggy.PluginManager("YamLLMs")
-        pm.add_hookspecs(hookspecs)
-        pm.register(github)
-        pm.register(jira)
-        pm.register(linear)
-        pm.register(notion)
-        pm.register(figma)
-        pm.register(monday)
-        pm.register(sentry)
-        pm.register(slack)
-        pm.register(harvest)
-        pm.register(openai)
-        pm.register(gemini)
-        pm.register(anthropic)
-        pm.register(mistral)
-        pm.register(quantify)
-        pm.register(agent)
-        pm.register(fetch)
-        pm.register(evals)
-        pm.register(scrape)
-        pm.register(bing)
-        pm.register(nemotron)
-        # Add other plugins here
+        pm = PluginRegistry("YamLLMs", hookspecs)
+        if os.getenv("EAGER_PLUGINS") == "true":
+            pm.load_all()
+
+        # spans around every hook call, and HTTP and ORM calls within tasks
+        from missions import tracing
+
+        if tracing.is_tracing():
+            from .plugins import tracing as tracing_hooks
+
+            pm.register(tracing_hooks)
+            tracing.instrument_http()
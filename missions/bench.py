@@ -0,0 +1,173 @@
+import datetime, json, os, platform, resource, tempfile, time
+from contextlib import contextmanager
+from django.db import connection
+from missions import apps as missions_apps, hookspecs, hub, tracing
+from .models import *
+from .plugins import tracing as tracing_hooks
+from .plugins.bench import BENCH_KINDS, BENCH_PREFIX
+from .registry import PLUGINS, PluginSpec, PluginRegistry
+from .util import *
+
+BENCH_SIZES = [10, 1000, 10000]  # PRs, commits, and issues per synthetic connector
+BENCH_PLUGIN = PluginSpec("bench", ["run_api", "chat_llm"], [BENCH_PREFIX, BENCH_MODEL])
+BENCH_METRICS = ["wall_seconds", "queries", "peak_rss_mb", "input_tokens"]
+BENCH_TOLERANCE = 0.2  # flag anything more than 20% worse than the baseline
+BENCH_NOISE_SECONDS = 0.5  # ...but wall time also has to be this much worse
+BENCH_PROMPT = "Summarize the most important activity in this data."
+
+
+def create_bench_mission(size, latency=0.0):
+    mission_info = MissionInfo.objects.create(
+        name="Benchmark mission %s" % size,
+        base_llm=BENCH_MODEL,
+        base_prompt="Write a final report from these reports.",
+        flags={"bench_latency": "%s" % latency},
+    )
+    for idx, kind in enumerate(BENCH_KINDS):
+        TaskInfo.objects.create(
+            mission_info=mission_info,
+            name="Benchmark %s" % kind,
+            base_url="%s%s/%s" % (BENCH_PREFIX, kind, size),
+            base_llm=BENCH_MODEL,
+            base_prompt=BENCH_PROMPT,
+            category=TaskCategory.API,
+            reporting=Reporting.ALWAYS_REPORT,
+            order=idx,
+            flags={"snapshot": "false"},  # measure the fetch every time
+        )
+    return mission_info.create_mission()
+
+
+# the bench plugin and tracing hooks in place of the usual plugins, spans to a file,
+# and no pacing between tasks since nothing external is called
+@contextmanager
+def bench_environment(trace_file):
+    registry = PluginRegistry("YamLLMs", hookspecs, PLUGINS + [BENCH_PLUGIN])
+    registry.register(tracing_hooks)
+    previous = (
+        missions_apps.pm,
+        tracing.TRACING,
+        tracing.TRACE_FILE,
+        hub.PACING_SECONDS,
+    )
+    missions_apps.pm = registry
+    (tracing.TRACING, tracing.TRACE_FILE) = ("file", trace_file)
+    hub.PACING_SECONDS = 0
+    try:
+        yield registry
+    finally:
+        (
+            missions_apps.pm,
+            tracing.TRACING,
+            tracing.TRACE_FILE,
+            hub.PACING_SECONDS,
+        ) = previous
+
+
+def run_benchmark(size, latency=0.0):
+    mission = create_bench_mission(size, latency)
+    queries = [0]
+
+    def count_query(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    trace_file = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+    with bench_environment(trace_file):
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            hub.fulfil_mission(mission.id)
+        wall_seconds = time.perf_counter() - start
+        spans = tracing.get_mission_spans(mission.id)
+    os.remove(trace_file)
+
+    mission.refresh_from_db()
+    phases = get_phases(spans)
+    return {
+        "size": size,
+        "latency": latency,
+        "status": mission.get_status_display(),
+        "tasks": mission.task_set.count(),
+        "wall_seconds": round(wall_seconds, 3),
+        "queries": queries[0],
+        "peak_rss_mb": get_peak_rss_mb(),
+        "input_tokens": sum([p["input_tokens"] for p in phases.values()]),
+        "output_tokens": sum([p["output_tokens"] for p in phases.values()]),
+        "phases": phases,
+    }
+
+
+# per task category: tasks, seconds, queries, and LLM tokens, from the trace spans
+def get_phases(spans):
+    parents = {s["spanId"]: s["parentSpanId"] for s in spans}
+    names = {s["spanId"]: s["name"] for s in spans}
+    phases = {}
+    for s in spans:
+        root = s["spanId"]
+        while parents.get(root):
+            root = parents[root]
+        phase = phases.setdefault(
+            names[root].replace("task ", ""),
+            {
+                "tasks": 0,
+                "seconds": 0,
+                "queries": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+            },
+        )
+        attributes = tracing.from_otlp_attributes(s["attributes"])
+        if root == s["spanId"]:
+            phase["tasks"] += 1
+            elapsed = int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])
+            phase["seconds"] = round(phase["seconds"] + elapsed / 1e9, 3)
+            phase["queries"] += attributes.get("db.queries", 0)
+        phase["input_tokens"] += attributes.get("gen_ai.usage.input_tokens", 0)
+        phase["output_tokens"] += attributes.get("gen_ai.usage.output_tokens", 0)
+    return phases
+
+
+def get_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def run_benchmarks(sizes=BENCH_SIZES, latency=0.0):
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "results": [run_benchmark(size, latency) for size in sizes],
+    }
+
+
+# regressions against a baseline run, matched on size and latency
+def compare_benchmarks(current, baseline, tolerance=BENCH_TOLERANCE):
+    previous = {(r["size"], r["latency"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = previous.get((result["size"], result["latency"]))
+        if not before:
+            continue
+        for metric in BENCH_METRICS:
+            (old, new) = (before.get(metric, 0), result.get(metric, 0))
+            change = (new - old) / old if old else 0
+            regression = change > tolerance
+            if metric == "wall_seconds" and new - old < BENCH_NOISE_SECONDS:
+                regression = False
+            rows.append(
+                {
+                    "size": result["size"],
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 3),
+                    "regression": regression,
+                }
+            )
+    return rows
+
+
+def load_benchmarks(filename):
+    with open(filename) as f:
+        return json.load(f)
@@ -0,0 +1,136 @@
+import hashlib, os, re, tempfile, time, zlib
+from .util import *
+
+# Content-addressed store for source files and diffs, shared across missions:
+# keys are anything that pins the content, like a git blob SHA and the size it's cut
+# to, or a pair of commits
+
+BLOB_STORE = os.getenv("BLOB_STORE", "disk")  # "disk", "redis", or "off"
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(tempfile.gettempdir(), "yamllms-blobs"))
+BLOB_BUDGET_BYTES = int(os.getenv("BLOB_BUDGET_MB", "512")) * 1024 * 1024  # compressed
+BLOB_EVICT_EVERY = 100  # disk puts between checks of the budget
+BLOB_EVICT_TO = 0.9  # of the budget, so eviction doesn't run on every put
+BLOB_KEY = "blob_%s"
+BLOB_LRU_KEY = "blob_lru"  # redis sorted set of blob keys by last use
+BLOB_SIZES_KEY = "blob_sizes"  # redis hash of compressed sizes
+BLOB_BYTES_KEY = "blob_bytes"  # redis running total of those
+SHA_RE = re.compile(r"^[0-9a-f]{40,64}$")
+
+puts_since_eviction = 0
+
+
+def get_blob_path(key):
+    name = key if SHA_RE.match(key) else hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(BLOB_DIR, name[:2], name + ".z")
+
+
+def get_redis():
+    import django_rq  # type: ignore
+
+    return django_rq.get_connection("default")
+
+
+def get_blob(key):
+    if not key or BLOB_STORE not in ["disk", "redis"]:
+        return None
+    try:
+        if BLOB_STORE == "redis":
+            redis = get_redis()
+            data = redis.get(BLOB_KEY % key)
+            if data is None:
+                return None
+            redis.zadd(BLOB_LRU_KEY, {key: time.time()})
+        else:
+            path = get_blob_path(key)
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # eviction goes by modified time
+        return zlib.decompress(data).decode("utf-8")
+    except Exception as ex:
+        log("Error reading blob", key, ex)
+        return None
+
+
+def get_blobs(keys):
+    found = {}
+    for key in set([k for k in keys if k]):
+        content = get_blob(key)
+        if content is not None:
+            found[key] = content
+    return found
+
+
+def put_blob(key, content):
+    if not key or content is None or BLOB_STORE not in ["disk", "redis"]:
+        return
+    data = zlib.compress(content.encode("utf-8"))
+    try:
+        if BLOB_STORE == "redis":
+            put_redis_blob(key, data)
+        else:
+            put_disk_blob(key, data)
+    except Exception as ex:
+        log("Error storing blob", key, ex)
+
+
+def put_redis_blob(key, data):
+    redis = get_redis()
+    if not redis.set(BLOB_KEY % key, data, nx=True):
+        return  # content-addressed, so already there means unchanged
+    redis.hset(BLOB_SIZES_KEY, key, len(data))
+    redis.zadd(BLOB_LRU_KEY, {key: time.time()})
+    if redis.incrby(BLOB_BYTES_KEY, len(data)) <= BLOB_BUDGET_BYTES:
+        return
+    # least recently used first, until back under the budget
+    while int(redis.get(BLOB_BYTES_KEY) or 0) > BLOB_BUDGET_BYTES * BLOB_EVICT_TO:
+        oldest = redis.zrange(BLOB_LRU_KEY, 0, 99)
+        if not oldest:
+            break
+        sizes = redis.hmget(BLOB_SIZES_KEY, oldest)
+        redis.delete(*[BLOB_KEY % k.decode() for k in oldest])
+        redis.zrem(BLOB_LRU_KEY, *oldest)
+        redis.hdel(BLOB_SIZES_KEY, *oldest)
+        redis.decrby(BLOB_BYTES_KEY, sum([int(s or 0) for s in sizes]))
+
+
+def put_disk_blob(key, data):
+    global puts_since_eviction
+    path = get_blob_path(key)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = "%s.%s" % (path, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)  # readers never see a partial blob
+    puts_since_eviction += 1
+    if puts_since_eviction >= BLOB_EVICT_EVERY:
+        puts_since_eviction = 0
+        evict_disk_blobs()
+
+
+def evict_disk_blobs(budget=None):
+    budget = BLOB_BUDGET_BYTES if budget is None else budget
+    blobs = []
+    for directory in os.scandir(BLOB_DIR):
+        if directory.is_dir():
+            for entry in os.scandir(directory.path):
+                stat = entry.stat()
+                blobs.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum([b[1] for b in blobs])
+    if total <= budget:
+        return 0
+    evicted = 0
+    for mtime, size, path in sorted(blobs):
+        if total <= budget * BLOB_EVICT_TO:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            evicted += 1
+        except FileNotFoundError:
+            pass
+    log("Evicted blobs", evicted, "leaving bytes", total)
+    return evicted
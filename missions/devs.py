@@ -0,0 +1,202 @@
+from types import SimpleNamespace
+import numpy as np
+from . import models  # module import, since models import this via the plugins
+from .util import ALL_REPORTS_URL
+
+PR_COUNTS = ["prs_opened", "prs_merged", "prs_closed"]
+
+
+# Columnar store of developer commit activity, built from the "devs" dicts that
+# commit fetch tasks keep in structured_data: dev key -> metadata plus commits
+class CommitStore:
+    def __init__(self):
+        self.keys = []  # dev keys, in the order first seen
+        self.key_ids = {}
+        self.devs = []  # per-dev metadata, everything but the commits
+        self.seen = set()  # (dev id, sha), for dedupe
+        self.authors = []
+        self.shas = []
+        self.days_ago = []
+        self.changes = []
+        self.branches = []
+        self.types = []
+        self.files = []  # tuples of interned file ids
+        self.file_ids = {}
+        self.branch_ids = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_devs(cls, devs):
+        store = cls()
+        for key in devs:
+            store.add_dev(key, devs[key])
+        return store
+
+    # dev data from these tasks and their prerequisites: their ancestors, walking
+    # parents a level at a time, then other dependencies and key context tasks
+    @classmethod
+    def from_tasks(cls, tasks):
+        tasks = list(tasks)
+        found = {t.id: t for t in tasks}
+        parent_ids = {t.parent_id for t in tasks if t.parent_id} - found.keys()
+        while parent_ids:
+            parents = models.Task.objects.filter(id__in=parent_ids)
+            parents = list(parents.only("id", "parent_id", "structured_data"))
+            found.update({t.id: t for t in parents})
+            parent_ids = {t.parent_id for t in parents if t.parent_id} - found.keys()
+        key_context = {}  # per mission
+        for t in tasks:
+            if t.depends_on_urls or t.url == ALL_REPORTS_URL:
+                found.update({d.id: d for d in t.aggregate_dependencies()})
+            if t.category > models.TaskCategory.FETCH_FOR_LLM:
+                if t.mission_id not in key_context:
+                    key_context[t.mission_id] = t.mission.key_context_tasks()
+                found.update({d.id: d for d in key_context[t.mission_id]})
+        store = cls()
+        for t in found.values():  # once each, since PR counts are summed
+            devs = t.structured_data.get("devs", {})
+            for key in devs:
+                store.add_dev(key, devs[key])
+        return store
+
+    def add_dev(self, key, dev):
+        meta = {k: v for k, v in dev.items() if k != "commits"}
+        idx = self.key_ids.get(key)
+        if idx is None:
+            idx = len(self.keys)
+            self.key_ids[key] = idx
+            self.keys.append(key)
+            self.devs.append(meta)
+        else:
+            existing = self.devs[idx]
+            counts = {c: existing.get(c, 0) + meta.get(c, 0) for c in PR_COUNTS}
+            self.devs[idx] = existing | meta | counts
+        for c in dev.get("commits", []):
+            if (idx, c["sha"]) in self.seen:
+                continue
+            self.seen.add((idx, c["sha"]))
+            self.authors.append(idx)
+            self.shas.append(c["sha"])
+            self.days_ago.append(c["days_ago"])
+            self.changes.append(c["changes"])
+            self.branches.append(self.intern(self.branch_ids, c["branch"]))
+            self.types.append(c["type"])
+            self.files.append(tuple(self.intern(self.file_ids, f) for f in c["files"]))
+
+    def intern(self, ids, val):
+        if val not in ids:
+            ids[val] = len(ids)
+        return ids[val]
+
+    # commit dicts per dev, in a single pass over the columns
+    def commits_by_dev(self):
+        branches = list(self.branch_ids)
+        files = list(self.file_ids)
+        commits = [[] for key in self.keys]
+        for i, idx in enumerate(self.authors):
+            commits[idx].append(
+                {
+                    "sha": self.shas[i],
+                    "days_ago": self.days_ago[i],
+                    "branch": branches[self.branches[i]],
+                    "changes": self.changes[i],
+                    "files": [files[f] for f in self.files[i]],
+                    "type": self.types[i],
+                }
+            )
+        return commits
+
+    # back to the structured_data format
+    def to_devs(self):
+        commits = self.commits_by_dev()
+        return {
+            key: self.devs[idx] | {"commits": commits[idx]}
+            for idx, key in enumerate(self.keys)
+        }
+
+    # regroup by dev name, in one pass rather than names x devs
+    def by_name(self):
+        store = CommitStore()
+        commits = self.commits_by_dev()
+        for idx, key in enumerate(self.keys):
+            name = self.devs[idx].get("name")
+            if name:
+                store.add_dev(name, self.devs[idx] | {"commits": commits[idx]})
+        return store
+
+    # normal (non-merge) commits within the window, as arrays
+    def normal_commits(self, since_days=None):
+        mask = np.array([t == "normal" for t in self.types], dtype=bool)
+        if since_days is not None:
+            mask &= np.array(self.days_ago, dtype=float) <= since_days
+        authors = np.array(self.authors, dtype=int)[mask]
+        changes = np.array(self.changes, dtype=float)[mask]
+        branches = np.array(self.branches, dtype=int)[mask]
+        kept = [f for f, keep in zip(self.files, mask) if keep]
+        file_authors = np.repeat(authors, [len(f) for f in kept])
+        files = np.fromiter((f for fs in kept for f in fs), dtype=int)
+        return (authors, changes, branches, file_authors, files)
+
+    # per-dev summaries, as get_dev_summary would compute them, keyed by dev key
+    def summaries(self, since_days=None):
+        n = len(self.keys)
+        (authors, changes, branches, file_authors, files) = self.normal_commits(
+            since_days
+        )
+        commit_counts = np.bincount(authors, minlength=n)
+        change_counts = np.bincount(authors, weights=changes, minlength=n)
+        branch_counts = distinct_counts(authors, branches, n)
+        file_counts = distinct_counts(file_authors, files, n)
+        summaries = {}
+        for idx, key in enumerate(self.keys):
+            dev = self.devs[idx]
+            summaries[key] = get_summary(
+                dev,
+                int(commit_counts[idx]),
+                int(change_counts[idx]),
+                int(file_counts[idx]),
+                int(branch_counts[idx]),
+            )
+        return summaries
+
+    def totals(self, since_days=None):
+        (authors, changes, branches, file_authors, files) = self.normal_commits(
+            since_days
+        )
+        return {
+            "devs": len(self.keys),
+            "commits": len(authors),
+            "changes": int(changes.sum()),
+            "files": len(np.unique(files)),
+            "opened": sum([dev.get("prs_opened", 0) for dev in self.devs]),
+            "merged": sum([dev.get("prs_merged", 0) for dev in self.devs]),
+        }
+
+
+# how many distinct values each group has
+def distinct_counts(groups, values, n):
+    if not len(groups):
+        return np.zeros(n, dtype=int)
+    stride = int(values.max()) + 1
+    pairs = np.unique(groups * stride + values)
+    return np.bincount(pairs // stride, minlength=n)
+
+
+def get_summary(dev, commits, changes, files, branches):
+    vals = {
+        "name": dev.get("name"),
+        "link": dev.get("link", ""),
+        "avatar": dev.get("avatar", ""),
+        "commits": commits,
+        "changes": changes,
+        "files": files,
+        "branches": branches,
+        "pr_branches": len(dev.get("pr_branches", [])),
+        "prs_opened": dev.get("prs_opened", 0),
+        "prs_merged": dev.get("prs_merged", 0),
+        "prs_closed": dev.get("prs_closed", 0),
+        "prs": f"{dev.get('prs_opened', 0)}/{dev.get('prs_merged', 0)}/{dev.get('prs_closed', 0)}",
+    }
+    return SimpleNamespace(**vals)
@@ -126,3 +126,29 @@ def ask_llm(task: Task):
 
     :param task: the task in question
     """
+
+
+@hookspec(firstresult=True)
+def batch_llm_request(task: Task, input: str):
+    """Build a request for a LLM provider's batch API, rather than chatting now
+
+    :param task: the task in question
+    :param input: the new input for the LLM (the prompt prefix is part of the task)
+    """
+
+
+@hookspec(firstresult=True)
+def submit_llm_batch(tasks: list):
+    """Submit the batch requests of a set of tasks, returning the batch ID
+
+    :param tasks: tasks using the same LLM, with requests in extras["batch_request"]
+    """
+
+
+@hookspec(firstresult=True)
+def get_llm_batch_results(task: Task, batch_id: str):
+    """Get the results of a submitted batch, or None if it's still in progress
+
+    :param task: a task in the batch, for its LLM and credentials
+    :param batch_id: the provider's batch ID
+    """
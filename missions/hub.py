@@ -2,12 +2,16 @@ import time
 
 from django_rq import job  # type: ignore
 
+from missions.apps import get_plugin_manager
 from .admin_jobs import evaluate_mission, evaluate_task
 from .models import *
 from .plugins.text_links import *
+from .retrieval import build_mission_index
 from .run import get_customer_missions_since, run
 from .util import *
 
+PACING_SECONDS = 1  # between tasks, to go easy on the external APIs
+
 
 @job("default", timeout=6000)
 def fulfil_mission(mission_id, flags={}):
@@ -66,12 +70,101 @@ def fulfil_mission(mission_id, flags={}):
         for task in mission.task_set.all():
             create_child_tasks_for(task)
 
-    for task in mission.tasks_to_run():
+    continue_mission(mission)
+
+
+# run whatever's left, then finalize, unless LLM tasks are waiting on a batch
+def continue_mission(mission, resuming=False):
+    tasks = mission.tasks_to_run()
+    if resuming:  # don't retry failures every time a batch lands
+        tasks = tasks.filter(status=TaskStatus.CREATED)
+    for task in tasks:
         run_task(task.id)
+    if submit_batches(mission):
+        log("Mission waiting for batch results", mission)
+        return
     finalize_mission(mission.id)
     log("Mission completed", mission)
 
 
+# submit queued batch requests, one batch per LLM; true if anything is outstanding
+# a batch that can't be submitted fails its tasks, rather than leaving them waiting
+def submit_batches(mission):
+    queued = {}
+    for task in mission.task_set.filter(status=TaskStatus.WAITING):
+        if "batch_request" in task.extras:
+            queued.setdefault(task.get_llm(), []).append(task)
+    pm = get_plugin_manager()
+    mission.refresh_from_db()
+    for llm, tasks in queued.items():
+        try:
+            batch_id = pm.hook.submit_llm_batch(tasks=tasks)
+            if not batch_id:
+                raise Exception("No batch API implementation for %s" % llm)
+        except Exception as ex:
+            log("Could not submit batch for", llm, ex)
+            for task in tasks:
+                task.extras.pop("batch_request")
+                task.add_error(ex, "batch submission")
+            continue
+        for task in tasks:
+            task.extras.pop("batch_request")
+            task.extras["batch_id"] = batch_id
+            task.save()
+        mission.extras["batches"] = mission.extras.get("batches", []) + [batch_id]
+        mission.save()  # so a later failure doesn't lose track of this batch
+    if not mission.task_set.filter(status=TaskStatus.WAITING).exists():
+        return False
+    mission.status = Mission.MissionStatus.WAITING
+    mission.save()
+    return True
+
+
+# check on waiting missions, completing tasks from batch results and resuming
+@job("default", timeout=6000)
+def poll_batches():
+    missions = Mission.objects.filter(status=Mission.MissionStatus.WAITING)
+    for mission in missions:
+        poll_mission_batches(mission)
+
+
+def poll_mission_batches(mission):
+    waiting = mission.task_set.filter(status=TaskStatus.WAITING)
+    batches = {}
+    for task in waiting:
+        if task.extras.get("batch_id"):
+            batches.setdefault(task.extras["batch_id"], []).append(task)
+
+    pm = get_plugin_manager()
+    finished = False
+    for batch_id, tasks in batches.items():
+        results = pm.hook.get_llm_batch_results(task=tasks[0], batch_id=batch_id)
+        if results is None:
+            continue
+        finished = True
+        for task in tasks:
+            complete_from_batch(task, results.get("%s" % task.id))
+
+    if finished:
+        mission.status = Mission.MissionStatus.IN_PROCESS
+        mission.save()
+        continue_mission(mission, resuming=True)
+
+
+def complete_from_batch(task, result):
+    task.extras.pop("batch_id", "")
+    if not result or result.get("error"):
+        task.status = TaskStatus.FAILED
+        task.add_error(result.get("error") if result else "Missing from batch results")
+        task.save()
+        return
+    task.response = result["response"]
+    task.extras["llm_used"] = task.get_llm()
+    task.extras["batch_usage"] = result.get("usage")
+    task.mark_complete()
+    post_process(task)  # which runs child tasks, possibly queueing the next batch
+
+
 def create_child_tasks_for(task):
     # for now, this just creates report tasks
     # we do create other tasks in individual invocation methods
@@ -89,6 +182,9 @@ def run_task(task_id, iteration=0):
     if task.status == TaskStatus.COMPLETE:
         log("Task already complete", task)
         return task
+    if task.status == TaskStatus.WAITING:
+        log("Task waiting for batch results", task)
+        return task
 
     if iteration > 10:  # arbitrary paranoia
         task.add_error("Too many recursive iterations")
@@ -118,7 +214,11 @@ def run_task(task_id, iteration=0):
         if prereq.status == TaskStatus.CREATED:
             log("Found unstarted prerequisite, running", prereq)
             run_task(prereq.id, iteration + 1)
-        elif prereq.status in [TaskStatus.FAILED, TaskStatus.IN_PROCESS]:
+        elif prereq.status in [
+            TaskStatus.FAILED,
+            TaskStatus.IN_PROCESS,
+            TaskStatus.WAITING,
+        ]:
             return log("Found incomplete prerequisite, bailing out", prereq)
     task.status = TaskStatus.IN_PROCESS
     task.rendered = ""
@@ -129,7 +229,7 @@ def run_task(task_id, iteration=0):
 
     # just make sure this all happens sequentially, and go easy on the external APIs
     if not task.is_test():
-        time.sleep(1)
+        time.sleep(PACING_SECONDS)
     return task
 
 
@@ -244,6 +344,10 @@ def finalize_mission(mission_id):
         mission.visibility = Visibility.BLOCKED
     mission.rendered = ""
     mission.save()
+    try:
+        build_mission_index(mission)  # for followup questions
+    except Exception as ex:
+        log("Error building retrieval index", mission, ex)
 
     # post-mission actions
     evaluate_mission(mission)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from missions.models import Task, TaskCategory, TaskStatus
+from missions.plugins.quantify import METRIC_QUANTIFIERS, get_quantifier
+from missions.util import QUANTIFY_RISK_URL, log
+
+
+class Command(BaseCommand):
+    help = "Backfill the metrics table from completed quantified report tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mission_id", help="Only this mission")
+        parser.add_argument("--customer_id", help="Only this customer's missions")
+        parser.add_argument("--dry_run", help="Dry run")
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.filter(
+            category=TaskCategory.QUANTIFIED_REPORT, status=TaskStatus.COMPLETE
+        ).exclude(url=QUANTIFY_RISK_URL)
+        if options["mission_id"]:
+            tasks = tasks.filter(mission_id=options["mission_id"])
+        if options["customer_id"]:
+            tasks = tasks.filter(
+                mission__mission_info__customer_id=options["customer_id"]
+            )
+        tasks = tasks.select_related("mission").order_by("mission_id", "id")
+        log("Backfilling metrics for tasks:", tasks.count())
+        if options["dry_run"]:
+            return
+
+        # rerun just the quantifiers that record metrics, which save nothing else,
+        # so the saved responses are kept
+        for task in tasks.iterator(chunk_size=100):
+            try:
+                quantifier = get_quantifier(task)
+                if quantifier and quantifier.__name__ in METRIC_QUANTIFIERS:
+                    quantifier(task)
+            except Exception as ex:
+                log("Error backfilling metrics for", task, ex)
+        log("Backfill complete")
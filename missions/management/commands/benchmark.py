@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from missions.bench import *
+from missions.util import log
+
+
+class Command(BaseCommand):
+    help = "Benchmark missions offline, against synthetic connectors and a fake LLM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", help="Comma-separated item counts per connector")
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Fake LLM seconds"
+        )
+        parser.add_argument("--output", help="Write results as JSON to this file")
+        parser.add_argument("--baseline", help="Compare with results in this file")
+        parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+
+    def handle(self, *args, **options):
+        sizes = BENCH_SIZES
+        if options["sizes"]:
+            sizes = [int(s) for s in options["sizes"].split(",")]
+
+        # in a throwaway test database, never the real one
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(sizes, options["latency"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for result in results["results"]:
+            log("Size", result["size"], {k: result[k] for k in BENCH_METRICS})
+            for phase, values in result["phases"].items():
+                log("  %s" % phase, values)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        if options["baseline"]:
+            rows = compare_benchmarks(
+                results, load_benchmarks(options["baseline"]), options["tolerance"]
+            )
+            for row in rows:
+                flag = "REGRESSION" if row["regression"] else ""
+                log(row["size"], row["metric"], row["baseline"], row["current"], flag)
+            regressions = [r for r in rows if r["regression"]]
+            if regressions:
+                raise CommandError("%s benchmark regressions" % len(regressions))
@@ -0,0 +1,36 @@
+import datetime
+from django.core.management.base import BaseCommand
+from missions.transfer import *
+from missions.util import log
+
+
+class Command(BaseCommand):
+    help = "Export missions, tasks, raw data, and metrics as newline-delimited JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Path to write, gzipped if it ends in .gz")
+        parser.add_argument("--mission_ids", help="Comma-separated mission IDs")
+        parser.add_argument("--since", help="Only missions created since YYYY-MM-DD")
+        parser.add_argument(
+            "--skip_heavy", help="Set true to leave out prompts, responses, raw data"
+        )
+        parser.add_argument("--chunk_size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file = options["file"]
+        if not file:
+            log("No file specified")
+            return
+        mission_ids = None
+        if options["mission_ids"]:
+            mission_ids = [int(i) for i in options["mission_ids"].split(",")]
+        since = None
+        if options["since"]:
+            since = datetime.datetime.strptime(options["since"], "%Y-%m-%d")
+            since = since.replace(tzinfo=datetime.timezone.utc)
+
+        querysets = get_export_querysets(mission_ids, since)
+        counts = export_ndjson(
+            file, querysets, options["skip_heavy"] == "true", options["chunk_size"]
+        )
+        log("Exported", dict(counts), "to", file)
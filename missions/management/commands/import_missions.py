@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from missions.transfer import *
+from missions.util import log
+
+
+class Command(BaseCommand):
+    help = "Import missions, tasks, raw data, and metrics from export_missions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Path to read, gzipped if it ends in .gz")
+        parser.add_argument("--dry_run", help="Set to true to not actually save to DB")
+        parser.add_argument("--batch_size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file = options["file"]
+        if not file:
+            log("No file specified")
+            return
+        dry_run = options["dry_run"] == "true"
+        counts = import_ndjson(file, options["batch_size"], dry_run)
+        log("Would import" if dry_run else "Imported", dict(counts), "from", file)
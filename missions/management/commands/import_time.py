@@ -0,0 +1,83 @@
+import json, statistics, subprocess, sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from missions.util import log
+
+SETUP = "import django; django.setup(); "
+# roughly what each process imports before it can do any work
+ENTRY_POINTS = {
+    "manage": SETUP + "from django.core.management import get_commands; get_commands()",
+    "gunicorn": "import yamllms.wsgi, yamllms.urls",
+    "rqworker": SETUP + "import django_rq, missions.hub",
+}
+TIMER = (
+    "import time; start = time.perf_counter(); %s; print(time.perf_counter() - start)"
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark cold-start import time for manage.py, gunicorn, and rqworker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Runs per entry point")
+        parser.add_argument("--entry", help="Only this entry point")
+        parser.add_argument("--top", type=int, default=0, help="Show N slowest imports")
+        parser.add_argument("--budget", type=float, help="Fail over this many seconds")
+        parser.add_argument("--json", help="Write results to this file")
+
+    def handle(self, *args, **options):
+        entries = [options["entry"]] if options["entry"] else list(ENTRY_POINTS)
+        results = {}
+        for entry in entries:
+            if entry not in ENTRY_POINTS:
+                raise CommandError("Unknown entry point %s" % entry)
+            results[entry] = get_import_times(entry, options["runs"])
+            log(entry, results[entry])
+            if options["top"]:
+                for cumulative, name in get_slowest_imports(entry, options["top"]):
+                    log("  %.3fs %s" % (cumulative, name))
+
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        over = [e for e in results if results[e]["median"] > (options["budget"] or 1e9)]
+        if over:
+            raise CommandError("Over the import time budget: %s" % ", ".join(over))
+
+
+# each run is a fresh interpreter, so nothing is already imported
+def run_entry(entry, *flags):
+    code = TIMER % ENTRY_POINTS[entry]
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=settings.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def get_import_times(entry, runs):
+    times = [
+        float(run_entry(entry).stdout.strip().splitlines()[-1]) for i in range(runs)
+    ]
+    return {
+        "runs": runs,
+        "min": round(min(times), 3),
+        "median": round(statistics.median(times), 3),
+        "max": round(max(times), 3),
+    }
+
+
+# the top-level imports with the highest cumulative time, from python -X importtime
+def get_slowest_imports(entry, n):
+    imports = []
+    for line in run_entry(entry, "-X", "importtime").stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.startswith(" ") and not name.startswith("  "):  # top level only
+            imports.append((int(parts[1]) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:n]
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from missions.hub import poll_batches
+from missions.util import log
+
+
+class Command(BaseCommand):
+    help = "Check LLM batches for waiting missions, and resume those with results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", help="Enqueue the poll as a job")
+
+    def handle(self, *args, **options):
+        if options["queue"]:
+            poll_batches.delay()
+            return log("Queued batch poll")
+        log("Polling batches")
+        poll_batches()
+        log("Batch poll complete")
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from missions.models import MissionInfo
+from missions.apps import get_plugin_manager
 from missions.hub import fulfil_mission
 from missions.util import log
 
@@ -36,3 +37,5 @@ class Command(BaseCommand):
         mission.save()
         fulfil_mission(mission.id)
         log("Mission complete")
+        for route, count in get_plugin_manager().route_counts().items():
+            log("Plugin route", route, count)
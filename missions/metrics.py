@@ -0,0 +1,102 @@
+import datetime
+import numpy as np
+
+DAY_SECONDS = 86400
+
+
+# parse ISO timestamps once, to epoch seconds, NaN where missing or unparseable
+def to_epochs(items, key):
+    epochs = np.full(len(items), np.nan)
+    for idx, item in enumerate(items):
+        iso = item.get(key) if isinstance(item, dict) else item
+        if not iso:
+            continue
+        try:
+            then = datetime.datetime.fromisoformat("%s" % iso)
+        except ValueError:
+            continue
+        if then.tzinfo is None:
+            then = then.replace(tzinfo=datetime.timezone.utc)
+        epochs[idx] = then.timestamp()
+    return epochs
+
+
+# epoch cutoffs for "within N days", matching get_days_since rounding to whole days
+def get_cutoffs(windows, now=None):
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    windows = np.array(windows, dtype=float)
+    return now.timestamp() - (windows + 0.5) * DAY_SECONDS
+
+
+# items sorted newest first by one timestamp, so "within N days" is always a prefix
+# and any per-window count or sum is a searchsorted plus a cumulative lookup
+class Timeline:
+    def __init__(self, items, key, now=None):
+        epochs = to_epochs(items, key)
+        self.order = np.argsort(-epochs, kind="stable")  # NaNs sort last
+        self.items = [items[i] for i in self.order]
+        self.negated = -epochs[self.order]  # ascending, for searchsorted
+        self.now = now
+
+    def __len__(self):
+        return len(self.items)
+
+    # how many items fall within each window of days
+    def counts(self, windows):
+        cutoffs = get_cutoffs(windows, self.now)
+        return np.searchsorted(self.negated, -cutoffs, side="right")
+
+    # the items within a window of days
+    def within(self, days):
+        return self.items[: int(self.counts([days])[0])]
+
+    # per-window sums of a per-item value
+    def sums(self, windows, values):
+        totals = np.concatenate(([0], np.cumsum(self.values(values))))
+        return totals[self.counts(windows)]
+
+    # per-window counts of items matching a predicate
+    def matches(self, windows, predicate):
+        return self.sums(windows, lambda i: 1 if predicate(i) else 0)
+
+    # per-window counts of distinct values
+    def distinct(self, windows, value):
+        seen = set()
+        firsts = []
+        for item in self.items:
+            val = value(item)
+            firsts.append(0 if val in seen else 1)
+            seen.add(val)
+        return self.sums(windows, firsts)
+
+    def values(self, values):
+        if callable(values):
+            return np.array([values(i) for i in self.items], dtype=float)
+        return np.array(values, dtype=float)
+
+
+# outcomes listed newest first: how many since the most recent match
+def runs_since(outcomes, match):
+    hits = np.flatnonzero(np.array(outcomes, dtype=object) == match)
+    return int(hits[0]) if len(hits) else len(outcomes)
+
+
+# per-value counts of a list of outcomes, in one pass
+def tally(outcomes, values):
+    outcomes = np.array(outcomes, dtype=object)
+    return {v: int(np.count_nonzero(outcomes == v)) for v in values}
+
+
+# windows to tabulate, depending on how far back the data goes
+def get_windows(oldest):
+    if oldest > 365:
+        return [7, 30, 90, 365]
+    elif oldest > 90:
+        return [7, 30, 90]
+    elif oldest < 30:
+        return [7, 14]
+    return [7, 14, 30]
+
+
+def get_window_name(days):
+    return f"{days} Days" if days < 365 else "1 Year"
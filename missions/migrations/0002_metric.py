@@ -0,0 +1,64 @@
+# Generated by Django 4.2.15 on 2026-10-19 03:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("missions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Metric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("repo", models.CharField(blank=True, default="", max_length=256)),
+                ("metric", models.CharField(max_length=64)),
+                ("dimension", models.CharField(blank=True, default="", max_length=256)),
+                ("period", models.CharField(blank=True, default="", max_length=32)),
+                ("value", models.FloatField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "mission",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="missions.mission",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="missions.task",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["repo", "metric", "dimension", "period", "mission"],
+                        name="metric_trend_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="metric",
+            constraint=models.UniqueConstraint(
+                fields=("mission", "repo", "metric", "dimension", "period"),
+                name="unique_mission_metric",
+            ),
+        ),
+    ]
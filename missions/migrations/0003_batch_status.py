@@ -0,0 +1,44 @@
+# Generated by Django 4.2.15 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("missions", "0002_metric"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mission",
+            name="status",
+            field=models.IntegerField(
+                choices=[
+                    (0, "Created"),
+                    (-1, "Blocked"),
+                    (-2, "Failed"),
+                    (1, "In Process"),
+                    (2, "Complete"),
+                    (3, "Waiting For Batch"),
+                ],
+                default=0,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="status",
+            field=models.IntegerField(
+                choices=[
+                    (0, "Created"),
+                    (-1, "Fetch Failed"),
+                    (-2, "No Data"),
+                    (-3, "Rejected"),
+                    (-4, "Hidden"),
+                    (1, "In Process"),
+                    (2, "Complete"),
+                    (3, "Waiting For Batch"),
+                ],
+                default=0,
+            ),
+        ),
+    ]
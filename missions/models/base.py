@@ -70,6 +70,7 @@ class TaskStatus(models.IntegerChoices):
     HIDDEN = -4, "Hidden"
     IN_PROCESS = 1, "In Process"
     COMPLETE = 2, "Complete"
+    WAITING = 3, "Waiting For Batch"  # submitted to an LLM batch API
 
 
 class Customer(BaseModel):
@@ -14,6 +14,7 @@ class Mission(BaseModel):
         FAILED = -2, "Failed"
         IN_PROCESS = 1, "In Process"
         COMPLETE = 2, "Complete"
+        WAITING = 3, "Waiting For Batch"  # parked until LLM batch results land
 
     status = models.IntegerField(
         choices=MissionStatus.choices, default=MissionStatus.CREATED
@@ -110,18 +111,28 @@ class Mission(BaseModel):
             if isinstance(repo, list) and len(repo) > 0:
                 return repo[0]
         if not from_task:
-            tasks = self.task_set.all()
-            for t in tasks:
-                task_repo = t.get_repo()
+            # load once, and look up parents among these rather than one by one
+            tasks = {t.id: t for t in self.task_set.all()}
+            for t in tasks.values():
+                task_repo = t.get_repo(tasks)
                 if task_repo:
                     return task_repo
         return None
 
+    # with its customer and project, in one query rather than three
+    def get_mission_info(self):
+        if self.mission_info_id and not Mission.mission_info.is_cached(self):
+            infos = MissionInfo.objects.select_related("customer", "project")
+            self.mission_info = infos.filter(id=self.mission_info_id).first()
+        return self.mission_info
+
     def get_customer(self):
-        return self.mission_info.customer if self.mission_info else None
+        mission_info = self.get_mission_info()
+        return mission_info.customer if mission_info else None
 
     def get_project(self):
-        return self.mission_info.project if self.mission_info else None
+        mission_info = self.get_mission_info()
+        return mission_info.project if mission_info else None
 
     def restricted_tasks(self):
         return self.task_set.filter(visibility=Visibility.RESTRICTED)
@@ -206,7 +217,7 @@ class Mission(BaseModel):
         return self.task_set.filter(category=TaskCategory.LLM_QUESTION).order_by("-id")
 
     def two_phase_reporting_tasks(self):
-        return self.task_set.all().filter(reporting=Reporting.REPORT)
+        return self.task_set.all().filter(reporting=Reporting.ALWAYS_REPORT)
 
     def tldr_task(self):
         return self.task_set.filter(
@@ -152,11 +152,13 @@ class Task(BaseModel):
             )
         return days if previous_mission else days * 2
 
-    def get_repo(self):
+    # tasks, if given, maps ids to already-loaded tasks to find parents in
+    def get_repo(self, tasks=None):
         # flags is primary, structured_data secondary
         repo = self.flags.get("github", self.structured_data.get("repo", None))
-        if not repo and self.parent:
-            repo = self.parent.get_repo()
+        if not repo and self.parent_id:
+            parent = tasks.get(self.parent_id) if tasks else None
+            repo = (parent or self.parent).get_repo(tasks)
         if not repo and self.url and self.url.startswith(GITHUB_PREFIX):
             elements = self.url.split("/")
             repo = "/".join(elements[3:5]) if len(elements) > 4 else None
@@ -210,6 +212,8 @@ class Task(BaseModel):
         ]
 
     def default_ordering_info(self):
+        if Task.parent.is_cached(self):  # e.g. via prefetch_related("parent")
+            return {"url": self.parent.url} if self.parent else None
         return Task.objects.filter(id=self.parent_id).values("url").first()
 
     def get_project(self):
@@ -271,9 +275,7 @@ class Task(BaseModel):
         self.status = TaskStatus.FAILED if failed else self.status
 
     def get_customer(self):
-        if not self.mission.mission_info:
-            return None
-        return self.mission.mission_info.customer
+        return self.mission.get_customer()
 
     def add_error(self, ex, due=None):
         log("Task error", self, ex)
@@ -377,7 +379,7 @@ class Task(BaseModel):
 
     def assemble_prompt(self):
         if (
-            self.reporting == Reporting.REPORT
+            self.reporting == Reporting.ALWAYS_REPORT
             and self.category != TaskCategory.LLM_DECISION
         ):
             return f"{self.prompt or ''}\n\n{self.response or ''}"
@@ -415,22 +417,20 @@ class Task(BaseModel):
     # return responses from the first and last task in the dependency set
     # the first is context, the last the most recent relevant response
     # if there are other LLM reports in between that are not decision inputs, include them too
-    def assemble_prerequisite_inputs(self):
+    def assemble_prerequisite_inputs(self, truncate=True):
         tasks = self.prerequisite_input_tasks()
+        # key context first, so it's part of a prompt prefix that LLM providers can cache
+        context = [t for t in tasks if t.is_key_context()]
+        tasks = context + [t for t in tasks if not t.is_key_context()]
 
         # default overflow behavior: take the longest dataset, cut it in half
         # and simply repeat until we fit into the context window
         # for recency-ordered datasets this usually works surprisingly well!
         # other approaches via plugin are probably desirable for other cases
-        texts = [t.response or t.structured_data or "" for t in tasks]
+        texts = ["%s" % (t.response or t.structured_data or "") for t in tasks]
+        if truncate:
+            texts = truncate_to_fit(texts, self.get_llm(), "\n\n---\n\n")
         text = "\n\n---\n\n".join(texts)
-        while is_too_long(text, self.get_llm()):
-            lengths = [len(t) for t in texts]
-            max_len = max(lengths)
-            max_idx = lengths.index(max_len)
-            long_text = texts[max_idx]
-            texts[max_idx] = long_text[: len(long_text) // 2] + "\n\n(truncated)\n..."
-            text = "\n\n---\n\n".join(texts)
 
         input_data = text
         if len(texts) > 1:
@@ -440,6 +440,8 @@ class Task(BaseModel):
                 input_data += (
                     f"\n# Dataset {idx+1}\n\n## {name}\n\n{texts[idx]}\n\n---\n"
                 )
+                if context and idx == len(context) - 1:
+                    input_data += CACHE_BREAK
         return input_data
 
     # Get the task from the previous mission in the series, if any.
@@ -525,6 +527,29 @@ class Task(BaseModel):
         else:
             RawData.objects.create(task=self, name="Raw data - %s" % self, data=data)
 
+    # quantified numbers as (metric, dimension, period, value) rows, upserted
+    def save_metrics(self, rows):
+        repo = self.get_repo() or ""
+        metrics = [
+            Metric(
+                mission_id=self.mission_id,
+                task_id=self.id,
+                repo=repo,
+                metric=metric,
+                dimension="%s" % dimension,
+                period="%s" % period,
+                value=value,
+            )
+            for (metric, dimension, period, value) in rows
+        ]
+        Metric.objects.bulk_create(
+            metrics,
+            update_conflicts=True,
+            unique_fields=["mission", "repo", "metric", "dimension", "period"],
+            update_fields=["task", "value"],
+        )
+        return metrics
+
 
 # don't fetch the actual data unless we need it
 class RawDataManager(models.Manager):
@@ -548,3 +573,55 @@ class RawData(BaseModel):
     class Meta:
         base_manager_name = "objects"
         verbose_name_plural = "Raw data"
+
+
+class MetricManager(models.Manager):
+    # one metric across missions, oldest first, as (mission_id, value)
+    def trend(self, metric, repo="", dimension="", period="", since=None):
+        metrics = self.filter(repo=repo, metric=metric, dimension=dimension)
+        metrics = metrics.filter(period=period)
+        if since:
+            metrics = metrics.filter(mission__created_at__gte=since)
+        return list(metrics.order_by("mission_id").values_list("mission_id", "value"))
+
+    # a mission's metrics as {dimension: {metric: value}}
+    def for_mission(self, mission_id, metrics, repo="", period=""):
+        rows = self.filter(mission_id=mission_id, repo=repo, metric__in=metrics)
+        rows = rows.filter(period=period)
+        values = {}
+        for dimension, metric, value in rows.values_list(
+            "dimension", "metric", "value"
+        ):
+            values.setdefault(dimension, {})[metric] = value
+        return values
+
+
+# quantified results, narrow and indexed, so trends and diffs don't reparse JSON
+class Metric(models.Model):
+    mission = models.ForeignKey(Mission, on_delete=models.CASCADE)
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True)
+    repo = models.CharField(max_length=256, blank=True, default="")
+    metric = models.CharField(max_length=64)
+    dimension = models.CharField(max_length=256, blank=True, default="")
+    period = models.CharField(max_length=32, blank=True, default="")
+    value = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = MetricManager()
+
+    def __str__(self):
+        return f"{self.metric} {self.dimension} {self.period}: {self.value}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mission", "repo", "metric", "dimension", "period"],
+                name="unique_mission_metric",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["repo", "metric", "dimension", "period", "mission"],
+                name="metric_trend_idx",
+            )
+        ]
@@ -1,17 +1,21 @@
 import json
 import time
 from datetime import timedelta
+from django.core.cache import cache
 
 from missions import plugins
 from missions.apps import get_plugin_manager
 
-from ..models import Task, TaskCategory, TaskStatus
+from ..models import Mission, Task, TaskCategory, TaskStatus
 from ..prompts import get_prompt_from_github
 from ..util import *
 from .github import *
 
 MAX_AGENT_ITERATIONS = 8
 MAX_AGENT_FILES = 32
+CATALOG_FIELDS = ["id", "name", "url", "category", "created_at"]
+CATALOG_KEY = "agent_catalog_%s_%s_%s"  # mission, dataset depth, categories
+CATALOG_SECONDS = 60 * 60 * 24  # previous missions' datasets don't change
 
 
 @plugins.hookimpl
@@ -94,16 +98,6 @@ def answer_agent(task):
     question = task.flags.get("agent_question")
     last_question = task.flags.get("report_question") or question
 
-    # get all the previous datasets for this mission
-    dataset_depth = task.flags.get("dataset_depth", 10)
-    tasks = list(task.mission.task_set.filter(status=TaskStatus.COMPLETE))
-    previous = task.mission.previous
-    depth = 0
-    while previous and depth < dataset_depth:
-        tasks += list(previous.task_set.filter(status=TaskStatus.COMPLETE))
-        previous = previous.previous
-        depth += 1
-
     # fetches only
     exclude = task.flags.get("exclude_categories", "default")
     if exclude == "agent":
@@ -116,7 +110,11 @@ def answer_agent(task):
         ]
     if task.flags.get("include_quantified"):
         valid_categories.append(TaskCategory.QUANTIFIED_REPORT)
-    datasets = [t for t in tasks if t.category in valid_categories]
+
+    # all the previous datasets for this mission, without their contents
+    dataset_depth = task.flags.get("dataset_depth", 10)
+    datasets = get_dataset_catalog(task.mission_id, valid_categories)
+    datasets += get_previous_catalog(task.mission, valid_categories, dataset_depth)
 
     # include/exclude urls
     if task.flags.get("include_exclude_urls"):
@@ -127,15 +125,12 @@ def answer_agent(task):
         else:
             datasets = [t for t in datasets if (t.url or "").lower() not in urls]
 
-    tools = set()
-    for t in datasets:
-        source = source_from_task(t)
-        if source:
-            tools.add(source["name"])
-
     # previous analysis
     previous_ids = dep.structured_data.get("previous_sources", []) if dep else []
-    previous_tasks = [Task.objects.get(id=p) for p in previous_ids]
+    previous_by_id = Task.objects.only(*CATALOG_FIELDS).in_bulk(
+        [int(p) for p in previous_ids]
+    )
+    previous_tasks = [previous_by_id[int(p)] for p in previous_ids]
     datasets = [t for t in datasets if t.id not in previous_ids]
     previous_files = dep.structured_data.get("previous_files", [])
     max_iterations = task.flags.get("max_iterations", MAX_AGENT_ITERATIONS)
@@ -148,12 +143,7 @@ def answer_agent(task):
     if not files:
         log("listing files from repo", task.get_repo())
         repo = get_gh_repo(task)
-        main = repo.get_branch(repo.default_branch)
-        tree = repo.get_git_tree(main.commit.sha, recursive=True)
-        paths = get_tree_paths(tree, max_files=2048)
-        # return the 64 largest files
-        paths = sorted(paths, key=lambda x: x[1], reverse=True)[:MAX_AGENT_FILES]
-        files = [p[0] for p in paths]
+        files = [p[0] for p in get_tree_index(repo).largest(MAX_AGENT_FILES)]
 
     data_type = dep.structured_data.get("next_data_type", "task")
     data_id = dep.structured_data.get("next_data_id", "")
@@ -179,7 +169,7 @@ def answer_agent(task):
         else:
             log("Fetching task", data_id)
             task_id = int(data_id)
-            data_task = Task.objects.get(id=task_id)
+            data_task = Task.objects.only("response", *CATALOG_FIELDS).get(id=task_id)
             data_to_analyze = data_task.response
             new_previous_ids = previous_ids + [data_id]
             data_line = task_to_line_for_llm(data_task)
@@ -188,7 +178,6 @@ def answer_agent(task):
         log("No data ID to fetch from", dep, dep.structured_data)
 
     # analyze the new data in light of the old data
-    previous_tasks = [Task.objects.get(id=p) for p in previous_ids]
     today = datetime.datetime.now().date().strftime("%Y-%m-%d")
     base_prompt = task.flags.get("base_prompt", "detective-2")
     base_prompt = get_prompt_from_github(base_prompt)
@@ -390,6 +379,37 @@ def get_issue_for(key, data):
     return "Issue not found"
 
 
+# completed tasks' ids, names, urls, categories, and dates, for listing to the LLM
+def get_dataset_catalog(mission_id, categories):
+    tasks = Task.objects.filter(
+        mission_id=mission_id, status=TaskStatus.COMPLETE, category__in=categories
+    )
+    return [SimpleNamespace(**t) for t in tasks.values(*CATALOG_FIELDS)]
+
+
+# previous missions' catalogs, cached, since every agent iteration lists them again
+def get_previous_catalog(mission, categories, depth):
+    key = CATALOG_KEY % (mission.id, depth, "-".join(["%s" % c for c in categories]))
+    try:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    except Exception as ex:
+        log("Error reading dataset catalog", ex)
+    catalog = []
+    previous_id = mission.previous_id
+    while previous_id and depth > 0:
+        catalog += get_dataset_catalog(previous_id, categories)
+        previous = Mission.objects.filter(id=previous_id).values("previous_id")
+        previous_id = previous[0]["previous_id"] if previous else None
+        depth -= 1
+    try:
+        cache.set(key, catalog, CATALOG_SECONDS)
+    except Exception as ex:
+        log("Error caching dataset catalog", ex)
+    return catalog
+
+
 def task_to_line_for_llm(task):
     when = task.created_at.strftime("%Y-%m-%d")
     return "ID %s - %s on %s " % (task.id, task.name, when)
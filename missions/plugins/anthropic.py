@@ -1,5 +1,6 @@
-import os
+import json, os
 
+import httpx
 from anthropic import Anthropic
 
 from missions import plugins
@@ -10,6 +11,7 @@ from ..util import *
 # https://cloud.google.com/docs/authentication/provide-credentials-adc#how-to
 
 MAX_CLAUDE_TOKENS = 4096
+CLAUDE_CACHE_CONTROL = {"type": "ephemeral"}  # prompt caching breakpoint
 
 
 @plugins.hookimpl
@@ -22,6 +24,67 @@ def chat_llm(task, input, tool_key):
     return None
 
 
+@plugins.hookimpl
+def batch_llm_request(task, input):
+    if task.get_llm() not in CLAUDE_MODELS:
+        return None
+    input = (input or "").strip()
+    task_prompt = (task.prompt or "").strip()
+    content = get_claude_content(
+        task_prompt, get_sized_prompt(task, input, cacheable=True)
+    )
+    task.extras["task_prompt"] = task_prompt
+    task.extras["final_prompt"] = "".join([c["text"] for c in content])
+    return {
+        "custom_id": "%s" % task.id,
+        "params": {
+            "max_tokens": MAX_CLAUDE_TOKENS,
+            "messages": [{"role": "user", "content": content}],
+            "model": task.get_llm(),
+        },
+    }
+
+
+@plugins.hookimpl
+def submit_llm_batch(tasks):
+    if tasks[0].get_llm() not in CLAUDE_MODELS:
+        return None
+    anthropic = get_anthropic()
+    body = {"requests": [t.extras["batch_request"] for t in tasks]}
+    batch = anthropic.post("/v1/messages/batches", body=body, cast_to=httpx.Response)
+    batch = batch.json()
+    log("Submitted Anthropic batch", batch["id"], "requests", len(tasks))
+    return batch["id"]
+
+
+@plugins.hookimpl
+def get_llm_batch_results(task, batch_id):
+    if task.get_llm() not in CLAUDE_MODELS:
+        return None
+    anthropic = get_anthropic()
+    path = "/v1/messages/batches/%s" % batch_id
+    batch = anthropic.get(path, cast_to=httpx.Response).json()
+    log("Anthropic batch", batch_id, "status", batch["processing_status"])
+    if batch["processing_status"] != "ended":
+        return None
+    content = anthropic.get(batch["results_url"], cast_to=httpx.Response).text
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        result = row["result"]
+        if result["type"] != "succeeded":
+            results[row["custom_id"]] = {"error": "%s" % result.get("error", result)}
+            continue
+        message = result["message"]
+        results[row["custom_id"]] = {
+            "response": message["content"][0]["text"],
+            "usage": message.get("usage"),
+        }
+    return results
+
+
 def get_anthropic():
     client = Anthropic(
         # This is the default and can be omitted
@@ -30,18 +93,43 @@ def get_anthropic():
     return client
 
 
+# key context shared by sibling tasks first, as a cache breakpoint, then the task's
+# own instructions and data
+def get_claude_content(task_prompt, sized_input):
+    (context, data) = split_cacheable(sized_input)
+    content = []
+    if context:
+        text = "<KeyContext>\n" + context.strip() + "\n</KeyContext>\n"
+        content.append(
+            {"type": "text", "text": text, "cache_control": CLAUDE_CACHE_CONTROL}
+        )
+    content.append(
+        {
+            "type": "text",
+            "text": "\n<Instructions>\n" + task_prompt + "\n</Instructions>\n",
+        }
+    )
+    content.append(
+        {"type": "text", "text": "\n<Information>\n" + data + "\n</Information>\n"}
+    )
+    return content
+
+
+def record_cache_usage(task, message):
+    usage = message.usage
+    task.extras["cache_read_tokens"] = getattr(usage, "cache_read_input_tokens", 0) or 0
+    task.extras["cache_write_tokens"] = (
+        getattr(usage, "cache_creation_input_tokens", 0) or 0
+    )
+    task.extras["uncached_input_tokens"] = usage.input_tokens
+
+
 def chat_claude(task, input):
     input = (input or "").strip()
     task_prompt = (task.prompt or "").strip()
-    sized_input = get_sized_prompt(task, input)
-    final_prompt = (
-        "<Instructions>\n"
-        + task_prompt
-        + "\n</Instructions>\n"
-        + "\n<Information>\n"
-        + sized_input
-        + "\n</Information>\n"
-    )
+    sized_input = get_sized_prompt(task, input, cacheable=True)
+    content = get_claude_content(task_prompt, sized_input)
+    final_prompt = "".join([c["text"] for c in content])
     task.extras["task_prompt"] = task_prompt
     task.extras["final_prompt"] = final_prompt
     log("final prompt length", len(final_prompt))
@@ -52,11 +140,12 @@ def chat_claude(task, input):
         messages=[
             {
                 "role": "user",
-                "content": final_prompt,
+                "content": content,
             }
         ],
         model=task.get_llm(),
     )
+    record_cache_usage(task, message)
     task.response = message.content[0].text
     return task.response
 
@@ -64,15 +153,8 @@ def chat_claude(task, input):
 def chat_claude_json(task, input, tool_key):
     input = (input or "").strip()
     task_prompt = (task.prompt or "").strip()
-    sized_input = get_sized_prompt(task, input)
-    final_prompt = (
-        "<Instructions>\n"
-        + task_prompt
-        + "\n</Instructions>\n"
-        + "\n<Information>\n"
-        + sized_input
-        + "\n</Information>\n"
-    )
+    sized_input = get_sized_prompt(task, input, cacheable=True)
+    content = get_claude_content(task_prompt, sized_input)
     if tool_key:
         tools = get_openai_functions_for(tool_key)
         tool_prompt = "\n<OutputFormat/>"
@@ -83,7 +165,8 @@ def chat_claude_json(task, input, tool_key):
         tool_prompt += "\n```json\n%s\n```\n" % example_json
         tool_prompt += "\nNote that all of those fields are mandatory and must be followed exactly.\n"
         tool_prompt += "\n</OutputFormat/>"
-        final_prompt += tool_prompt
+        content.append({"type": "text", "text": tool_prompt})
+    final_prompt = "".join([c["text"] for c in content])
 
     task.extras["task_prompt"] = task_prompt
     task.extras["final_prompt"] = final_prompt
@@ -95,11 +178,12 @@ def chat_claude_json(task, input, tool_key):
         messages=[
             {
                 "role": "user",
-                "content": final_prompt,
+                "content": content,
             }
         ],
         model=task.get_llm(),
     )
+    record_cache_usage(task, message)
     task.response = message.content[0].text
     return task.response
 
@@ -0,0 +1,113 @@
+import datetime, random, time
+from ..util import *
+from missions import plugins
+
+BENCH_PREFIX = BASE_PREFIX + "/bench/"  # e.g. /bench/pulls/1000
+BENCH_KINDS = ["pulls", "commits", "issues"]
+BENCH_DAYS = 90  # synthetic items are spread over this many days
+BENCH_WORDS = """the a fix add update remove refactor test build deploy cache query index
+parser plugin mission task report token model latency memory leak crash error timeout
+retry config schema migration endpoint client server worker queue github jira slack
+""".split()
+
+# Synthetic connector and fake LLM for benchmarking missions offline
+
+
+@plugins.hookimpl
+def run_api(task):
+    if task.url and task.url.startswith(BENCH_PREFIX):
+        (kind, count) = task.url.replace(BENCH_PREFIX, "").split("/")[:2]
+        return fetch_bench_items(task, kind, int(count))
+    return None
+
+
+@plugins.hookimpl
+def chat_llm(task, input, tool_key):
+    if task.get_llm() == BENCH_MODEL:
+        return chat_bench(task, input)
+    return None
+
+
+def get_bench_items(kind, count, now=None, seed=0):
+    rng = random.Random("%s-%s-%s" % (kind, count, seed))
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    devs = ["dev%s" % i for i in range(max(count // 50, 3))]
+    items = []
+    for idx in range(count):
+        created = now - datetime.timedelta(seconds=rng.randint(0, BENCH_DAYS * 86400))
+        item = {
+            "number": idx + 1,
+            "title": " ".join(rng.choices(BENCH_WORDS, k=rng.randint(3, 9))),
+            "body": " ".join(rng.choices(BENCH_WORDS, k=rng.randint(10, 120))),
+            "author": rng.choice(devs),
+            "created_at": created.isoformat(),
+            "state": rng.choice(["open", "closed"]),
+            "comments": rng.randint(0, 12),
+        }
+        if kind == "commits":
+            item["sha"] = "%040x" % rng.getrandbits(160)
+            item["changes"] = rng.randint(1, 400)
+            item["branch"] = rng.choice(["main", "dev", "feature-%s" % (idx % 7)])
+            item["files"] = ["src/%s.py" % rng.choice(BENCH_WORDS) for f in range(3)]
+        items.append(item)
+    return items
+
+
+def render_bench_item(kind, item):
+    r = h4("#%s %s" % (item["number"], item["title"]))
+    r += "By %s at %s, %s, %s comments\n" % (
+        item["author"],
+        item["created_at"],
+        item["state"],
+        item["comments"],
+    )
+    if kind == "commits":
+        r += "%s on %s, %s changes to %s\n" % (
+            item["sha"][:7],
+            item["branch"],
+            item["changes"],
+            ", ".join(item["files"]),
+        )
+    return r + item["body"] + "\n"
+
+
+# dev commit activity in the format commit fetch tasks keep in structured_data
+def get_bench_devs(items, now):
+    devs = {}
+    for item in items:
+        dev = devs.setdefault(item["author"], {"name": item["author"], "commits": []})
+        created = datetime.datetime.fromisoformat(item["created_at"])
+        dev["commits"].append(
+            {
+                "sha": item["sha"],
+                "days_ago": (now - created).days,
+                "branch": item["branch"],
+                "changes": item["changes"],
+                "files": item["files"],
+                "type": "normal",
+            }
+        )
+    return devs
+
+
+def fetch_bench_items(task, kind, count):
+    if kind not in BENCH_KINDS:
+        raise Exception("Unknown benchmark connector %s" % kind)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    items = get_bench_items(kind, count, now)
+    task.response = h2("Benchmark %s" % kind) + h3("Count: %s" % count)
+    task.response += "".join([render_bench_item(kind, i) for i in items])
+    task.structured_data = {"counts": {kind: count}}
+    if kind == "commits":
+        task.structured_data["devs"] = get_bench_devs(items, now)
+    task.save()
+    return task
+
+
+def chat_bench(task, input):
+    sized_input = get_sized_prompt(task, input)
+    time.sleep(float(task.mission.flags.get("bench_latency", 0)))
+    return "Benchmark report on %s characters of input:\n%s" % (
+        len(sized_input),
+        sized_input[:1000],
+    )
@@ -2,13 +2,12 @@ import time, os, requests
 from ..util import *
 from missions import plugins
 
-BING_ENDPOINT = "https://api.bing.microsoft.com/"
 BING_NEWS_SEARCH_ENDPOINT = "https://api.bing.microsoft.com/v7.0/news/search"
 
 
 @plugins.hookimpl
 def run_api(task):
-    if task.url and task.url.startswith(BING_ENDPOINT):
+    if task.url and task.url.startswith(BING_API):
         return bing_news_fact_check(task)
 
 
@@ -1,5 +1,5 @@
 import json, openai
-from .github import get_gh_repo, get_gh_file, get_gh_pr
+from .github import get_gh_repo, get_gh_files, get_gh_pr
 from ..prompts import get_prompt_from_github
 from ..util import *
 from ..models import Task, TaskCategory, Reporting
@@ -113,22 +113,25 @@ def run_llm_file_fetch(task):
     repo = get_gh_repo(task)
 
     task.response = ""
+    to_fetch = []
     for finfo in file_list:
         key = "path" if "path" in finfo else "url" if "url" in finfo else "name"
         path = finfo.get(key)
-        filename = path.replace(GITHUB_PREFIX, "")
         if path.startswith("http") and not path.startswith(GITHUB_PREFIX):
             log("Cannot fetch files from", path)
             continue
+        to_fetch.append(finfo)
 
-        try:
-            log(f"Fetching file {filename} from {path}")
-            filedata = get_gh_file(repo, finfo)
-            fetched_filenames.append(finfo)
-            log("fetched file with lines", len(filedata.splitlines()))
-        except Exception as ex:
-            log("could not fetch file", path, "due to", ex)
+    # all at once, resolved against the repo tree
+    fetched = get_gh_files(repo, to_fetch)
+    for finfo, (path, filedata) in zip(to_fetch, fetched):
+        key = "path" if "path" in finfo else "url" if "url" in finfo else "name"
+        filename = finfo.get(key).replace(GITHUB_PREFIX, "")
+        if filedata is None:
+            log("could not fetch file", filename, "resolved to", path)
             continue
+        fetched_filenames.append(finfo)
+        log("fetched file with lines", len(filedata.splitlines()))
 
         # append the file content to the prompt
         content = "\n\n" + get_file_intro(filename, filedata)
@@ -1,7 +1,8 @@
 import os
 import google.generativeai as genai  # type: ignore
-from google.generativeai.generative_models import GenerativeModel  # type: ignore
+from ..models import TaskCategory
 from ..prompts import get_prompt_from_github
+from ..retrieval import get_question_inputs
 from ..util import *
 from missions import plugins
 
@@ -18,6 +19,8 @@ def chat_llm(task, input, tool_key):
 @plugins.hookimpl
 def ask_llm(task):
     log("Checking gemini")
+    if task.category == TaskCategory.LLM_QUESTION:
+        return ask_gemini(task, get_question_inputs(task))
     return ask_gemini(task)
 
 
@@ -37,8 +40,7 @@ def chat_gemini(task, prompt):
 
     gemini = get_gemini(task.get_llm())
     log("Asking Gemini, prompt length", len(sized_prompt))
-    model = GenerativeModel(task.get_llm())
-    log("token length", model.count_tokens(sized_prompt))
+    log("token length", task.extras["input_tokens"])
     response = gemini.generate_content(final_prompt)
     log("gemini response", response.text)
     return response.text
@@ -46,7 +48,6 @@ def chat_gemini(task, prompt):
 
 # Accumulate all of the mission's fetch tasks, then ask with prompt and final report
 def ask_gemini(task, input_tasks=[]):
-
     # by default, look at all of a mission's fetch tasks
     if not input_tasks:
         input_tasks = task.mission.key_context_tasks() + task.mission.fetch_tasks()
@@ -81,13 +82,8 @@ def ask_gemini(task, input_tasks=[]):
     text = "\n\n---\n\n".join(texts)
     task.llm = GEMINI_1_5_PRO
     task.save()
-    while is_too_long(input_data + text, task.get_llm()):
-        lengths = [len(t) for t in texts]
-        max_len = max(lengths)
-        max_idx = lengths.index(max_len)
-        long_text = texts[max_idx]
-        texts[max_idx] = long_text[: len(long_text) // 2] + "\n\n(truncated)\n..."
-        text = "\n\n---\n\n".join(texts)
+    texts = truncate_to_fit(texts, task.get_llm(), "\n\n---\n\n", input_data)
+    text = "\n\n---\n\n".join(texts)
 
     sized_prompt = get_sized_prompt(task, input_data + text)
     task.extras["system_prompt"] = task.prompt
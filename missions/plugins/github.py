@@ -1,9 +1,11 @@
-import base64, datetime, os, requests
+import base64, bisect, datetime, heapq, os, requests
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
 import github
+from ..blobs import get_blob, get_blobs, put_blob
 from ..models import GITHUB_PREFIX
 from ..util import *
 from missions import plugins
@@ -35,6 +37,11 @@ BRANCH_HYDRATE_DAYS = 60  # how many days before we ignore side branches
 MAX_PR_BODY_LENGTH = 16000
 OBSOLETE_CLOSED_PR_DAYS = 180
 MAX_FILES_TO_SHOW = 32
+TREE_INDEX_CACHE_SECONDS = 60 * 60 * 24 * 7  # trees are immutable per commit SHA
+MAX_FETCH_FILE_BYTES = 128 * 1024  # longer files are cut before line truncation
+FILE_BLOB_KEY = "%s:%d"  # git blob SHA and the cap, since stored content is cut to it
+FILE_BATCH_SIZE = 50  # blobs per GraphQL query
+FILE_FETCH_WORKERS = 8  # concurrent blob API calls, if GraphQL fails
 
 # https://docs.github.com/en/apps/creating-github-apps/authenticating-with-a-github-app/about-authentication-with-a-github-app
 # https://docs.github.com/en/apps/creating-github-apps/authenticating-with-a-github-app/authenticating-as-a-github-app-installation
@@ -593,7 +600,12 @@ def get_gh_pr(task, repo, number, diffs=True):
     # Full files diff (note this will be truncated at prompt time if too long)
     # mini-hack: diffs not available via PyGitHub, get via HTTPS
     if diffs and not task.github_metadata_only():
-        raw = get_pr_diff(task, pr)
+        # the diff between two commits never changes
+        key = "diff_%s_%s" % (pr.base.sha, pr.head.sha)
+        raw = get_blob(key)
+        if raw is None:
+            raw = get_pr_diff(task, pr)
+            put_blob(key, raw or None)
         if raw:
             task.response += PR_DIFF_PROMPT % raw
 
@@ -728,36 +740,109 @@ def get_gh_readme(task, repo):
     task.response += h2("README") + readme
 
     r = h2("Repo files (name, size in bytes)")
-    main = repo.get_branch(repo.default_branch)
-    tree = repo.get_git_tree(main.commit.sha, recursive=True)
-    paths = get_tree_paths(tree)
-    r += "\n".join([f"{p[0]} {p[1]}" for p in paths])
+    index = get_tree_index(repo)
+    r += "\n".join([f"{p[0]} {p[1]}" for p in index.paths()])
     task.response += r
 
 
+# compact, cacheable index of a repo tree at a given commit: parallel path/size/sha
+# lists of every file, so any of them can be looked up, while listings leave out
+# empty files and those in EXCLUDE_FROM_TREE
+class TreeIndex:
+    def __init__(self, sha, paths, sizes, shas):
+        self.sha = sha
+        self.path_list = paths
+        self.sizes = sizes
+        self.shas = shas
+        self.positions = {p: i for i, p in enumerate(paths)}
+        self.listed = [
+            i
+            for i, p in enumerate(paths)
+            if sizes[i] and not EXCLUDE_FROM_TREE_RE.search(p)
+        ]
+        self.sorted_paths = sorted([paths[i] for i in self.listed])
+
+    @classmethod
+    def from_tree(cls, tree, sha=None):
+        paths, sizes, shas = [], [], []
+        stack = [tree]
+        while stack:
+            current = stack.pop()
+            for t in current.tree:
+                if hasattr(t, "tree"):
+                    stack.append(t.tree)  # Push the nested tree onto the stack
+                elif t.path:
+                    paths.append(t.path)
+                    sizes.append(t.size or 0)
+                    shas.append(getattr(t, "sha", None))
+        return cls(sha or getattr(tree, "sha", None), paths, sizes, shas)
+
+    @classmethod
+    def from_dict(cls, vals):
+        return cls(vals["sha"], vals["paths"], vals["sizes"], vals["shas"])
+
+    def to_dict(self):
+        return {
+            "sha": self.sha,
+            "paths": self.path_list,
+            "sizes": self.sizes,
+            "shas": self.shas,
+        }
+
+    def __len__(self):
+        return len(self.path_list)
+
+    def paths(self, max_files=512):
+        return [(self.path_list[i], self.sizes[i]) for i in self.listed[:max_files]]
+
+    def largest(self, n):
+        idxs = heapq.nlargest(n, self.listed, key=self.sizes.__getitem__)
+        return [(self.path_list[i], self.sizes[i]) for i in idxs]
+
+    def under(self, directory):
+        prefix = directory.strip("/") + "/" if directory.strip("/") else ""
+        start = bisect.bisect_left(self.sorted_paths, prefix)
+        found = []
+        for path in self.sorted_paths[start:]:
+            if not path.startswith(prefix):
+                break
+            found.append(path)
+        return found
+
+    def exists(self, path):
+        return path.strip("/") in self.positions
+
+    def size_of(self, path):
+        idx = self.positions.get(path.strip("/"))
+        return None if idx is None else self.sizes[idx]
+
+    def sha_of(self, path):
+        idx = self.positions.get(path.strip("/"))
+        return None if idx is None else self.shas[idx]
+
+
+def get_tree_index(repo, sha=None):
+    if not sha:
+        sha = repo.get_branch(repo.default_branch).commit.sha
+    cache_key = "gh_tree_index_%s" % sha
+    try:
+        cached = cache.get(cache_key)
+        if cached:
+            return TreeIndex.from_dict(cached)
+    except Exception:
+        log("Error reading cached tree index", sha)
+    tree = repo.get_git_tree(sha, recursive=True)
+    index = TreeIndex.from_tree(tree, sha)
+    try:
+        cache.set(cache_key, index.to_dict(), TREE_INDEX_CACHE_SECONDS)
+    except Exception:
+        log("Error caching tree index", sha)
+    return index
+
+
 # limit to 512 files by default
 def get_tree_paths(tree, max_files=512):
-    paths = []
-    stack = [tree]
-    lines = 0
-    exclusions = EXCLUDE_FROM_TREE
-    while stack and lines < max_files:
-        current = stack.pop()
-        for t in current.tree:
-            if hasattr(t, "tree"):
-                stack.append(t.tree)  # Push the nested tree onto the stack
-            elif t.path:
-                exclude = False
-                for e in exclusions:
-                    if e in t.path or t.path.endswith(e) or not t.size:
-                        exclude = True
-                        break
-                if not exclude:
-                    paths.append((t.path, t.size))
-                    lines += 1
-            if lines >= max_files:
-                break
-    return paths
+    return TreeIndex.from_tree(tree).paths(max_files)
 
 
 def render_commit(commit):
@@ -1000,9 +1085,12 @@ def get_gh_commits(task, repo):
     task.save()
 
     if devs:
+        from ..devs import CommitStore  # deferred, it imports numpy
+
         r += "\n\n" + h3(f"Developer commit activity within {max_days} days")
+        summaries = CommitStore.from_devs(devs).summaries()
         for name in devs:
-            dev = get_dev_summary(devs[name])
+            dev = summaries[name]
             r += h4(name)
             r += f"{dev.commits} commits with {dev.changes} changes across {dev.files} files and {dev.branches} branches.\n"
             r += f"\nPRs: {dev.prs} open / merged / closed-unmerged across {dev.pr_branches} branches\n"
@@ -1012,24 +1100,125 @@ def get_gh_commits(task, repo):
     task.save()
 
 
-def get_gh_file(repo, finfo, retry=0):
-    url = finfo.get("url", finfo.get("path", finfo.get("name")))
-    if retry == 1 or retry == 3:
-        url = finfo.get("name")
-    if not url.startswith("http") and not url.startswith("/"):
-        url = "/" + url
-    if retry == 2 or retry == 3:
-        url = repo.full_name.split("/")[-1] + url
-    path = url.replace(GITHUB_PREFIX, "/")
-    if path.startswith(f"/{repo.full_name}"):
-        path = path.replace(f"/{repo.full_name}", "")
+# the forms a requested file name might take: full URLs, blob URLs, names, and
+# paths with or without the repo name in front
+def get_path_candidates(repo, finfo):
+    candidates = []
+    repo_name = repo.full_name.split("/")[-1]
+    for key in ["url", "path", "name"]:
+        path = (finfo.get(key) or "").replace(GITHUB_PREFIX, "").strip("/")
+        if path.startswith(repo.full_name + "/"):
+            path = path[len(repo.full_name) + 1 :]
+            if path.startswith("blob/") or path.startswith("tree/"):
+                path = "/".join(path.split("/")[2:])  # drop the branch
+        candidates += [path, repo_name + "/" + path]
+        if path.startswith(repo_name + "/"):
+            candidates.append(path[len(repo_name) + 1 :])
+    return list(dict.fromkeys([c for c in candidates if c]))
+
+
+def resolve_file_path(index, repo, finfo):
+    for path in get_path_candidates(repo, finfo):
+        if index.exists(path):
+            return path
+    return None
+
+
+# decode only as much of a base64 blob as we will keep; None for binary files
+def decode_capped(content, cap=MAX_FETCH_FILE_BYTES):
+    encoded = "".join(content.split())[: (cap + 2) // 3 * 4]
+    data = base64.b64decode(encoded)[:cap]
+    return None if b"\0" in data else data.decode("utf-8", errors="ignore")
+
+
+# many files at once, from one GraphQL object(expression:) query per batch
+def get_gh_blobs_graphql(repo, sha, paths):
+    fields = "\n".join(
+        [
+            'f%s: object(expression: "%s:%s") { ... on Blob { text isBinary } }'
+            % (i, sha, p.replace("\\", "\\\\").replace('"', '\\"'))
+            for i, p in enumerate(paths)
+        ]
+    )
+    query = (
+        "query($owner: String!, $name: String!) { repository(owner: $owner, name: $name) { %s } }"
+        % fields
+    )
+    (owner, name) = repo.full_name.split("/")
+    headers, data = repo._requester.graphql_query(query, {"owner": owner, "name": name})
+    found = data["data"]["repository"]
+    contents = {}
+    for i, p in enumerate(paths):
+        blob = found.get("f%s" % i) or {}
+        if blob.get("isBinary"):
+            contents[p] = None
+        elif blob.get("text") is not None:  # GitHub leaves out very large texts
+            contents[p] = blob["text"][:MAX_FETCH_FILE_BYTES]
+    return contents
+
+
+# for files the tree index doesn't hold, e.g. past GitHub's truncated tree limit
+def get_gh_contents(repo, finfo):
+    for path in get_path_candidates(repo, finfo):
+        try:
+            found = repo.get_contents(path)
+        except Exception:
+            continue
+        if isinstance(found, list):
+            continue  # a directory
+        content = decode_capped(found.content or "")
+        put_blob(get_file_blob_key(found.sha), content)
+        return (path, content)
+    return (None, None)
+
+
+def get_file_blob_key(sha):
+    return FILE_BLOB_KEY % (sha, MAX_FETCH_FILE_BYTES) if sha else None
+
+
+def get_gh_blob(repo, blob_sha):
     try:
-        content = repo.get_contents(path).content
-        # log("Content fetched", path)
-        return base64.b64decode(content).decode("utf-8")
-    except Exception:
-        if retry < 3:
-            return get_gh_file(repo, finfo, retry + 1)
+        return decode_capped(repo.get_git_blob(blob_sha).content)
+    except Exception as ex:
+        log("Error fetching blob", blob_sha, ex)
+        return None
+
+
+# resolve requested files against the repo tree, then fetch the ones not already
+# in the blob store in batches, and any the tree doesn't hold one by one; returns
+# the path and size-capped content, or None for each, in request order
+def get_gh_files(repo, finfos, index=None):
+    index = index or get_tree_index(repo)
+    paths = [resolve_file_path(index, repo, finfo) for finfo in finfos]
+    unresolved = {
+        i: get_gh_contents(repo, f) for i, f in enumerate(finfos) if not paths[i]
+    }
+    keys = {p: get_file_blob_key(index.sha_of(p)) for p in paths if p}
+    stored = get_blobs(keys.values())
+    contents = {p: stored[key] for p, key in keys.items() if key in stored}
+    wanted = sorted(set([p for p in paths if p and p not in contents]))
+    for i in range(0, len(wanted), FILE_BATCH_SIZE):
+        batch = wanted[i : i + FILE_BATCH_SIZE]
+        try:
+            contents.update(get_gh_blobs_graphql(repo, index.sha, batch))
+        except Exception as ex:
+            log("Error fetching files via GraphQL, using the blob API", ex)
+        missing = [p for p in batch if p not in contents]
+        if missing:
+            with ThreadPoolExecutor(max_workers=FILE_FETCH_WORKERS) as executor:
+                shas = [index.sha_of(p) for p in missing]
+                blobs = executor.map(lambda s: get_gh_blob(repo, s), shas)
+                contents.update(dict(zip(missing, blobs)))
+        for p in batch:
+            put_blob(keys[p], contents.get(p))
+    return [(p, contents.get(p)) if p else unresolved[i] for i, p in enumerate(paths)]
+
+
+def get_gh_file(repo, finfo):
+    (path, content) = get_gh_files(repo, [finfo])[0]
+    if content is None:
+        raise Exception("File not found: %s" % finfo)
+    return content
 
 
 def get_repo_avatar(repo):
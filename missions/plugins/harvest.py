@@ -1,5 +1,7 @@
 import datetime, os, requests, time
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
+from requests.adapters import HTTPAdapter
 from ..util import *
 
 HARVEST_ID_URL = "https://id.getharvest.com/api/v2"
@@ -8,6 +10,13 @@ HARVEST_ID_URL = "https://id.getharvest.com/api/v2"
 
 
 DERELICT_DAYS = 365
+HARVEST_PAGE_SIZE = 2000  # the Harvest v2 maximum
+HARVEST_MAX_WORKERS = 4  # Harvest allows 100 requests per 15 seconds
+DEFAULT_HOURS_DAYS = 30  # window when there's no cadence to go by
+FORECAST_AHEAD_DAYS = 60
+
+HARVEST_SESSION = requests.Session()
+HARVEST_SESSION.mount("https://", HTTPAdapter(pool_maxsize=HARVEST_MAX_WORKERS))
 
 
 from missions import plugins
@@ -86,12 +95,7 @@ def get_harvest(task, integration=None):
     return SimpleNamespace(**d)
 
 
-def fetch(harvest, endpoint, forecast=False, id=False):
-    if hasattr(harvest, "is_test") and harvest.is_test:
-        return harvest.fetch(endpoint)
-    base = FORECAST_API if forecast else HARVEST_API
-    base = HARVEST_ID_URL if id else base
-    url = f"{base}/{endpoint}"
+def get_json(harvest, url, forecast=False, id=False):
     headers = {
         "Accept": "application/json",
         "Authorization": "Bearer " + harvest.token,
@@ -101,11 +105,18 @@ def fetch(harvest, endpoint, forecast=False, id=False):
         headers["Harvest-Account-Id"] = "%s" % harvest.harvest_account_id
     if forecast:
         headers["Forecast-Account-Id"] = "%s" % harvest.forecast_account_id
-    r = requests.get(url, headers=headers)
+    r = HARVEST_SESSION.get(url, headers=headers)
     if r.status_code != 200:
         raise Exception(f"Failed to fetch {url}: {r.text}")
-    vals = r.json()
-    # TODO pagination?
+    return r.json()
+
+
+def fetch(harvest, endpoint, forecast=False, id=False):
+    if hasattr(harvest, "is_test") and harvest.is_test:
+        return harvest.fetch(endpoint)
+    base = FORECAST_API if forecast else HARVEST_API
+    base = HARVEST_ID_URL if id else base
+    vals = get_json(harvest, f"{base}/{endpoint}", forecast=forecast, id=id)
     # namespacing dicts may be in the "seemed like a good idea at the time" category
     if isinstance(vals, dict) and len(vals) == 1:
         vals = list(vals.values())[0]
@@ -114,6 +125,42 @@ def fetch(harvest, endpoint, forecast=False, id=False):
     return SimpleNamespace(**vals)
 
 
+# every page of a Harvest list endpoint, as plain dicts
+def fetch_records(harvest, endpoint, key, **params):
+    params["per_page"] = HARVEST_PAGE_SIZE
+    query = "&".join([f"{k}={v}" for k, v in params.items()])
+    endpoint = f"{endpoint}?{query}"
+    if hasattr(harvest, "is_test") and harvest.is_test:
+        return getattr(harvest.fetch(endpoint), key)
+
+    url = f"{HARVEST_API}/{endpoint}"
+    first = get_json(harvest, url)
+    records = first[key]
+    next_url = (first.get("links") or {}).get("next")
+    total_pages = first.get("total_pages") or 1
+    if next_url and "page=" in next_url and "cursor=" not in next_url:
+        # numbered pages, so we know them all up front
+        urls = [f"{url}&page={page}" for page in range(2, total_pages + 1)]
+        with ThreadPoolExecutor(max_workers=HARVEST_MAX_WORKERS) as executor:
+            for page in executor.map(lambda u: get_json(harvest, u), urls):
+                records += page[key]
+    else:
+        while next_url:
+            page = get_json(harvest, next_url)
+            records += page[key]
+            next_url = (page.get("links") or {}).get("next")
+    return records
+
+
+# fetch from the start of the earlier week quantify_hours shows, or further back per cadence
+def get_hours_window(task):
+    today = datetime.date.today()
+    cadence = task.cadence_days()
+    days = cadence * 2 if cadence else DEFAULT_HOURS_DAYS
+    days = max(days, today.weekday() + 14)
+    return (today - datetime.timedelta(days=days), today)
+
+
 def get_accounts(harvest):
     accounts = fetch(harvest, "accounts", id=True)
     return accounts
@@ -127,8 +174,7 @@ def get_harvest_projects(integration):
         ]
     harvest = get_harvest(None, integration)
     try:
-        projects = fetch(harvest, "projects")
-        return projects if isinstance(projects, list) else projects.projects
+        return fetch_records(harvest, "projects", "projects")
     except Exception as ex:
         log(f"Failed to get Harvest projects: {ex}")
         return []
@@ -157,6 +203,13 @@ def fetch_forecast_projects(task, harvest):
         clients = [c for c in clients if c.name == target_client]
     clients_by_id = {c.id: c for c in clients}
 
+    (start, end) = get_hours_window(task)
+    end = end + datetime.timedelta(days=FORECAST_AHEAD_DAYS)
+    args = "start_date=%s&end_date=%s" % (start.isoformat(), end.isoformat())
+    assignments = {}
+    for a in fetch(harvest, "assignments?%s" % args, forecast=True):
+        assignments.setdefault(a.project_id, []).append(a)
+
     projects = fetch(harvest, "projects", forecast=True)
     projects = [p for p in projects if not p.archived]
     target_projects = task.get_project_value("forecast_projects")
@@ -191,7 +244,11 @@ def fetch_forecast_projects(task, harvest):
             r += f"\n\n### Client: {client.name}\n"
             for project in projects:
                 r += render_forecast_project(
-                    harvest, project, people, placeholders, quants=quants
+                    project,
+                    people,
+                    placeholders,
+                    assignments.get(project.id, []),
+                    quants=quants,
                 )
 
     r += "\n" + h3("Previous Projects")
@@ -200,7 +257,7 @@ def fetch_forecast_projects(task, harvest):
         if projects:
             r += "\n" + h3(f"Client: {client.name}")
             for project in projects:
-                r += render_forecast_project(harvest, project, quants=quants)
+                r += render_forecast_project(project, quants=quants)
 
     task.response = r
     task.structured_data = quants
@@ -220,7 +277,9 @@ def is_project_active(project):
     return False
 
 
-def render_forecast_project(harvest, project, people=None, holders=None, quants={}):
+def render_forecast_project(
+    project, people=None, holders=None, assignments=[], quants={}
+):
     log("Rendering", project.name)
     r = "\n" + h4(f"Project: {project.name}")
     r += f"\nStart date: %s" % get_days_ago(project.start_date)
@@ -237,12 +296,6 @@ def render_forecast_project(harvest, project, people=None, holders=None, quants=
         for milestone in project.milestones:
             r += f"\n- {milestone.name} ({get_days_ago(milestone.date)})"
     if people and holders:
-        args = f"project_id={project.id}"
-        start = datetime.datetime.now() - datetime.timedelta(days=30)
-        args += "&start_date=%s" % start.strftime("%Y-%m-%d")
-        end = datetime.datetime.now() + datetime.timedelta(days=60)
-        args += "&end_date=%s" % end.strftime("%Y-%m-%d")
-        assignments = fetch(harvest, "assignments?%s" % args, forecast=True)
         r += h5("Assignments")
         for a in assignments:
             r += f"\n- {a.start_date} to {a.end_date}"
@@ -281,8 +334,8 @@ def fetch_harvest_projects(task, harvest):
     quants = {}
 
     r = h2("Harvest People")
-    users = fetch(harvest, "users?is_active=true")
-    for user in users.users:
+    users = fetch_records(harvest, "users", "users", is_active="true")
+    for user in users:
         user = SimpleNamespace(**user)
         r += f"\n- {user.first_name} {user.last_name} ({', '.join(user.roles)})"
         if user.is_contractor:
@@ -297,11 +350,9 @@ def fetch_harvest_projects(task, harvest):
     if target_projects:
         log("Target projects:", target_projects)
 
-    cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=30)
-    cutoff = cutoff.strftime("%Y-%m-%d")
-    projects = fetch(harvest, "projects?is_active=true")
+    projects = fetch_records(harvest, "projects", "projects", is_active="true")
     clients = {}
-    for project in projects.projects:
+    for project in projects:
         if (
             target_projects
             and project["name"] not in target_projects
@@ -315,19 +366,58 @@ def fetch_harvest_projects(task, harvest):
             clients[id] = {"name": project["client"]["name"], "projects": []}
         client = clients[id]
         client["projects"].append(project)
+
+    # account-wide lists, fetched concurrently and grouped by project
+    (start, end) = get_hours_window(task)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        fetches = [
+            executor.submit(
+                fetch_records,
+                harvest,
+                "time_entries",
+                "time_entries",
+                **{"from": start.isoformat(), "to": end.isoformat()},
+            ),
+            executor.submit(
+                fetch_records,
+                harvest,
+                "user_assignments",
+                "user_assignments",
+                is_active="true",
+            ),
+            executor.submit(
+                fetch_records,
+                harvest,
+                "task_assignments",
+                "task_assignments",
+                is_active="true",
+            ),
+        ]
+        (entries, people, tasks) = [group_by_project(f.result()) for f in fetches]
+
     for cid, client in clients.items():
         r += h3(f"Client: {client['name']}")
         for project in client["projects"]:
             id = project["id"]
-            entries = fetch(harvest, f"time_entries?project_id={id}&from={cutoff}")
-            people = fetch(harvest, f"projects/{id}/user_assignments?is_active=true")
-            tasks = fetch(harvest, f"projects/{id}/task_assignments?is_active=true")
-            r += render_harvest_project(project, people, tasks, entries, quants)
+            r += render_harvest_project(
+                project,
+                people.get(id, []),
+                tasks.get(id, []),
+                entries.get(id, []),
+                quants,
+            )
         r += "\n\n"
     task.response = r
     task.structured_data = quants
 
 
+def group_by_project(records):
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record["project"]["id"], []).append(record)
+    return grouped
+
+
 def render_harvest_project(project, people, tasks, entries, quants={}):
     project = SimpleNamespace(**project)
     log("Rendering", project.name)
@@ -338,9 +428,9 @@ def render_harvest_project(project, people, tasks, entries, quants={}):
     # r += f"\nLast update: %s" % get_days_ago(project.updated_at)
     if project.notes:
         r += f"\nNotes:\n{project.notes}"
-    if entries.time_entries:
+    if entries:
         r += h5("Time entries")
-    for entry in entries.time_entries:
+    for entry in entries:
         entry = SimpleNamespace(**entry)
         r += f"\nUser: {entry.user['name']if entry.user else ''} Task: {entry.task['name'] if entry.task else ''}"
         r += f"\n- {entry.spent_date} {entry.hours} hours"
@@ -348,25 +438,23 @@ def render_harvest_project(project, people, tasks, entries, quants={}):
             r += f" ({entry.notes})"
         quant = quants.get(entry.user["id"], {})
         quant["name"] = entry.user["name"]
-        entries = quant.get("entries", [])
-        entries.append(
+        person_entries = quant.get("entries", [])
+        person_entries.append(
             {
                 "project": project.name,
                 "date": entry.spent_date,
                 "hours": entry.hours,
             }
         )
-        quant["entries"] = entries
+        quant["entries"] = person_entries
         quants[entry.user["id"]] = quant
 
-    if people.user_assignments:
+    if people:
         r += "\n" + h5("Assignments")
-    for assign in people.user_assignments:
-        assign = SimpleNamespace(**assign)
-        r += f"\n- {assign.user['name']}"
-    if tasks.task_assignments:
+    for assign in people:
+        r += f"\n- {assign['user']['name']}"
+    if tasks:
         r += "\n" + h5("Tasks")
-    for task in tasks.task_assignments:
-        task = SimpleNamespace(**task)
-        r += f"\n- {task.task['name']}"
+    for task in tasks:
+        r += f"\n- {task['task']['name']}"
     return r
@@ -1,4 +1,5 @@
-import datetime, os, requests, time
+import datetime, math, os, requests, time
+from concurrent.futures import ThreadPoolExecutor
 from django.utils import timezone
 from atlassian import Jira  # type: ignore
 from atlassian import Confluence  # type: ignore
@@ -18,8 +19,34 @@ JIRA_QUANT_FIELDS = [
     "aggregatetimeestimate",
     "aggregatetimeoriginalestimate",
 ]
+# the fields render_jira_issue and cache_jira_issue actually read
+JIRA_RENDER_FIELDS = [
+    "status",
+    "summary",
+    "project",
+    "creator",
+    "created",
+    "updated",
+    "priority",
+    "issuetype",
+    "statuscategorychangeddate",
+    "assignee",
+    "parent",
+    "issuelinks",
+    "versions",
+    "fixVersions",
+    "closed",
+    "resolution",
+    "resolutiondate",
+    "description",
+    "comment",
+]
 MAX_DESCRIPTION_LENGTH = 16000
 OBSOLETE_CLOSED_ISSUE_DAYS = 180
+JQL_PAGE_SIZE = 50
+JQL_MAX_PAGES = 20  # sanity limit, 1000 issues per query, or per epic in a batch
+JQL_MAX_WORKERS = 8  # concurrent page fetches, well under Atlassian rate limits
+JQL_PARENT_BATCH = 50  # epics per "parent IN (...)" query
 
 
 @plugins.hookimpl
@@ -402,27 +429,47 @@ def get_project_custom_fields(task, jira, all_fields):
     return custom_fields
 
 
-def fetch_issues_with_jql(jira, jql, cutoff_date=None, max_pages=20):
-    concatenated = {}
-    latest_date = timezone.now()
-    page = 0
-    # sanity limit to 1000 of each type of issue at least for now
-    while page < max_pages:
+def get_jira_fields(custom_fields):
+    return JIRA_RENDER_FIELDS + JIRA_QUANT_FIELDS + [f["id"] for f in custom_fields]
+
+
+# narrow the query server-side rather than paging until we pass the cutoff
+def jql_updated_since(jql, cutoff_date):
+    clause = 'updated >= "%s"' % cutoff_date.strftime("%Y/%m/%d %H:%M")
+    query, order_by, ordering = jql.partition(" ORDER BY ")
+    return f"{query} AND {clause}{order_by}{ordering}"
+
+
+def fetch_issues_with_jql(
+    jira, jql, cutoff_date=None, max_pages=JQL_MAX_PAGES, fields="*all"
+):
+    if cutoff_date:
+        jql = jql_updated_since(jql, cutoff_date)
+
+    def fetch_page(page):
         log("Getting jql page", page)
-        start = 50 * page
-        response = jira.jql(jql, start=start)
-        if concatenated and "issues" in concatenated:
+        start = JQL_PAGE_SIZE * page
+        return jira.jql(jql, fields=fields, start=start, limit=JQL_PAGE_SIZE)
+
+    concatenated = fetch_page(0)
+    total = concatenated.get("total")
+    if total is None:  # no total to plan with, so page sequentially
+        page = 1
+        response = concatenated
+        while len(response["issues"]) >= JQL_PAGE_SIZE and page < max_pages:
+            response = fetch_page(page)
             concatenated["issues"] += response["issues"]
-        else:
-            concatenated = response
-        if not response["issues"]:
-            break
-        latest = response["issues"][-1]
-        latest_date = datetime.datetime.fromisoformat(latest["fields"]["updated"])
-        log("latest", latest_date, "cutoff", cutoff_date, len(concatenated["issues"]))
-        if cutoff_date and latest_date < cutoff_date:
-            break
-        page += 1
+            page += 1
+        return concatenated
+
+    pages = min(math.ceil(total / JQL_PAGE_SIZE), max_pages)
+    if pages > 1:
+        with ThreadPoolExecutor(max_workers=JQL_MAX_WORKERS) as executor:
+            for response in executor.map(fetch_page, range(1, pages)):
+                concatenated["issues"] += response["issues"]
+    log("Got", len(concatenated["issues"]), "of", total, "issues")
+    if len(concatenated["issues"]) < total:
+        log("Page limit reached, skipping", total - len(concatenated["issues"]))
     return concatenated
 
 
@@ -434,6 +481,7 @@ def get_jira_issues(task, jira):
     structured = {
         "custom_fields": [{"id": cf["id"], "name": cf["name"]} for cf in custom_fields]
     }
+    fields = get_jira_fields(custom_fields)
 
     base_jql = ""
     jira_projects = task.get_project_value("jira")
@@ -454,7 +502,7 @@ def get_jira_issues(task, jira):
         log("Getting", category, "issues, jql", jql)
         res += h3("Jira Issues: %s" % category)
         cutoff = done_cutoff if category == "Done" else None
-        results = fetch_issues_with_jql(jira, jql, cutoff_date=cutoff)
+        results = fetch_issues_with_jql(jira, jql, cutoff_date=cutoff, fields=fields)
         raw_data[category] = results
         for issue in results["issues"]:
             res += render_jira_issue(issue, custom_fields, max_description)
@@ -463,14 +511,17 @@ def get_jira_issues(task, jira):
             if issue["fields"]["issuetype"]["name"] == "Epic":
                 epics.append(issue["key"])
 
-    # for each epic, ensure we've fetched all of its individual issues
-    for epic in epics:
-        got = [i["key"] for i in structured["issues"] if i.get("parent") == epic]
-        jql = base_jql + f"parent = {epic} "
+    # for each batch of epics, ensure we've fetched all of their individual issues
+    for i in range(0, len(epics), JQL_PARENT_BATCH):
+        batch = epics[i : i + JQL_PARENT_BATCH]
+        issues = structured.get("issues", [])
+        got = [issue["key"] for issue in issues if issue.get("parent") in batch]
+        jql = base_jql + f"parent IN ({','.join(batch)}) "
         if len(got) > 0:
             jql += f"AND key NOT IN ({','.join(got)})"
-        log("Getting epic issues, epic", epic, "jql", jql)
-        response = fetch_issues_with_jql(jira, jql)
+        log("Getting epic issues, epics", len(batch), "jql", jql)
+        max_pages = JQL_MAX_PAGES * len(batch)  # the same limit as one epic at a time
+        response = fetch_issues_with_jql(jira, jql, max_pages=max_pages, fields=fields)
         log("Got", len(response["issues"]), "issues")
         for issue in response["issues"]:
             if not issue["key"] in keys:
@@ -510,6 +561,7 @@ def get_jira_issues_by_sprint_and_epic(task):
         base_jql = "project IN (%s)" % ",".join(jira_projects) + " AND "
 
     r = ""
+    fields = get_jira_fields(custom_fields)
     active_issues = [i for i in issue_data if issue_in_slog(i, active_sprints)]
     epic_keys = [i["key"] for i in active_issues if i.get("issueType") == "Epic"]
     epic_keys += [i["parent"] for i in active_issues if i.get("parent_type") == "Epic"]
@@ -518,19 +570,24 @@ def get_jira_issues_by_sprint_and_epic(task):
         r += h3("Active Epics")
         jql = base_jql + "key IN (%s)" % ",".join(epic_keys)
         log("Getting epics, jql", jql)
-        response = fetch_issues_with_jql(jira, jql)
-        for epic in response["issues"]:
+        epics = fetch_issues_with_jql(jira, jql, fields=fields)["issues"]
+
+        # one query for all the sprint issues under these epics, grouped locally
+        epic_issues = {}
+        issue_keys = [i["key"] for i in active_issues if i.get("parent") in epic_keys]
+        if issue_keys:
+            jql = base_jql + "key IN (%s)" % ",".join(issue_keys)
+            log("Getting epic issues, jql", jql)
+            response = fetch_issues_with_jql(jira, jql, fields=fields)
+            for issue in response["issues"]:
+                parent = issue["fields"].get("parent") or {}
+                epic_issues.setdefault(parent.get("key"), []).append(issue)
+
+        for epic in epics:
             r += h4(f"Epic: {epic['key']}")
             r += render_jira_issue(epic, custom_fields)
             cache_jira_issue(epic, structured, custom_fields)
-            sprint_epic_issues = [
-                i for i in active_issues if i.get("parent") == epic["key"]
-            ]
-            issue_keys = [i["key"] for i in sprint_epic_issues]
-            jql = base_jql + "key IN (%s)" % ",".join(issue_keys)
-            log("Getting epic issues, epic", epic["key"], "jql", jql)
-            response = fetch_issues_with_jql(jira, jql)
-            for issue in response["issues"]:
+            for issue in epic_issues.get(epic["key"], []):
                 r += render_jira_issue(issue, custom_fields)
                 cache_jira_issue(issue, structured, custom_fields)
 
@@ -541,7 +598,7 @@ def get_jira_issues_by_sprint_and_epic(task):
         issue_keys = [i["key"] for i in non_epic]
         jql = base_jql + "key IN (%s)" % ",".join(issue_keys)
         log("Getting non epic issues", "jql", jql)
-        response = fetch_issues_with_jql(jira, jql)
+        response = fetch_issues_with_jql(jira, jql, fields=fields)
         for issue in response["issues"]:
             r += render_jira_issue(issue, custom_fields)
             cache_jira_issue(issue, structured, custom_fields)
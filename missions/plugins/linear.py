@@ -1,9 +1,18 @@
-import os
+import asyncio, os
+from django.core.cache import cache
 from gql import gql, Client
 from gql.transport.aiohttp import AIOHTTPTransport
 from ..util import *
 from missions import plugins
 
+LINEAR_PAGE_SIZE = 100
+MAX_LINEAR_PAGES = 10  # per team, so at most 1000 issues each
+LINEAR_SCHEMA_CACHE_SECONDS = 60 * 60 * 24
+LINEAR_SCHEMA_KEY = "linear_introspection"
+
+# the introspected schema, the same whatever the token, once fetched or read from cache
+linear_introspection: dict | None = None
+
 
 @plugins.hookimpl
 def run_api(task):
@@ -41,9 +50,7 @@ def get_linear_teams(integration):
     except Exception as ex:
         log(f"Failed to get Linear token: {ex}")
         return []
-    headers = {"Authorization": "Bearer %s" % token, "Content-Type": "application/json"}
-    transport = AIOHTTPTransport(url=LINEAR_API, headers=headers)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    client = get_linear_client(token)
     # Get teams
     query = gql(
         """
@@ -57,22 +64,83 @@ query Teams {
 }
     """
     )
-    result = client.execute(query)
+    result = run_linear(client, lambda session: session.execute(query))
     return result["teams"]["nodes"]
 
 
+# a fresh client per use, so no tokens are kept around; only the schema is shared
+def get_linear_client(token):
+    headers = {"Authorization": "Bearer %s" % token, "Content-Type": "application/json"}
+    transport = AIOHTTPTransport(url=LINEAR_API, headers=headers)
+    introspection = get_linear_introspection()
+    if introspection:
+        return Client(transport=transport, introspection=introspection)
+    return Client(transport=transport, fetch_schema_from_transport=True)
+
+
+def get_linear_introspection():
+    global linear_introspection
+    if not linear_introspection:
+        try:
+            linear_introspection = cache.get(LINEAR_SCHEMA_KEY)
+        except Exception:
+            log("Error reading cached Linear schema")
+    return linear_introspection
+
+
+# run a coroutine function against a connected session, keeping the schema the first time
+def run_linear(client, work):
+    async def run():
+        global linear_introspection
+        async with client as session:
+            if client.fetch_schema_from_transport and client.introspection:
+                linear_introspection = client.introspection
+                try:
+                    cache.set(
+                        LINEAR_SCHEMA_KEY,
+                        client.introspection,
+                        LINEAR_SCHEMA_CACHE_SECONDS,
+                    )
+                except Exception:
+                    log("Error caching Linear schema")
+            return await work(session)
+
+    return asyncio.run(run())
+
+
+# follow pageInfo cursors for a connection
+async def fetch_linear_pages(session, query, key, variables=None, max_pages=None):
+    nodes = []
+    variables = variables or {}
+    for page in range(max_pages or MAX_LINEAR_PAGES):
+        result = await session.execute(query, variable_values=variables)
+        connection = result[key]
+        nodes += connection["nodes"]
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        variables = {**variables, "after": connection["pageInfo"]["endCursor"]}
+    return nodes
+
+
+def get_issue_filter(team_id, since=None):
+    filter = {"team": {"id": {"eq": team_id}}}
+    if since:
+        filter["updatedAt"] = {"gt": since.isoformat()}
+    return filter
+
+
 def get_linear_issues(task, linear):
     if hasattr(linear, "is_test") and linear.is_test:
         return linear.get_issues()
-    headers = {
-        "Authorization": "Bearer %s" % linear,
-        "Content-Type": "application/json",
-    }
-    transport = AIOHTTPTransport(url=LINEAR_API, headers=headers)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    client = get_linear_client(linear)
+
+    # for time series, optionally fetch only issues updated since the previous run
+    since = None
+    if task.flags.get("updated_since_previous") == "true" and task.is_time_series():
+        since = task.previous().created_at
 
     # Get teams and members
-    query = gql(
+    teams_query = gql(
         """
 query Teams {
   organization {
@@ -111,33 +179,14 @@ query Teams {
 }
     """
     )
-    result = client.execute(query)
-
-    res = h2("Linear Organization")
-    res += f"\nName: {result['organization']['name']}"
-    res += f"\nSlug: {result['organization']['urlKey']}"
-    res += "\n" + h3("Linear Teams")
-    teams = result["organization"]["teams"]["nodes"]
-    for team in teams:
-        res += f"\nTeam Name: {team['name']}" if team.get("name") else ""
-        res += (
-            f"\nDescription: {team['description']}" if team.get("description") else ""
-        )
-        for member in team["members"]["nodes"]:
-            if member.get("active"):
-                res += f"\n{member['name']}"
-                res += (
-                    f" ({member['displayName']})" if member.get("displayName") else ""
-                )
-                res += f" - joined {get_days_ago(member, 'createdAt')}"
-    task.response = res
-    task.save()
-
-    # Get projects
-    query = gql(
+    projects_query = gql(
         """
-query Projects {
-  projects {
+query Projects($after: String) {
+  projects(first: %s, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
     nodes {
       id
       name
@@ -153,22 +202,16 @@ query Projects {
   }
 }
     """
+        % LINEAR_PAGE_SIZE
     )
-    result = client.execute(query)
-    res += h2("Linear Projects")
-    for project in result["projects"]["nodes"]:
-        res += h3(f"{project['name']}")
-        res += f"{project['description']}" if project.get("description") else ""
-        res += f"\nCreated: {get_days_ago(project, 'createdAt')}"
-        edit_days_ago = get_edit_days_ago(project, "updatedAt", "createdAt")
-        res += f" Updated: {edit_days_ago}\n\n" if edit_days_ago else "\n"
-    task.response = res
-    task.save()
-
-    query = gql(
+    issues_query = gql(
         """
-query Issues {
-  issues(orderBy: updatedAt) {
+query Issues($filter: IssueFilter, $after: String) {
+  issues(filter: $filter, first: %s, after: $after, orderBy: updatedAt) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
     nodes {
       identifier
       url
@@ -218,14 +261,57 @@ query Issues {
   }
 }
     """
+        % LINEAR_PAGE_SIZE
     )
-    result = client.execute(query)
+
+    # teams first, then projects and every team's issue pages concurrently
+    async def fetch_all(session):
+        result = await session.execute(teams_query)
+        teams = result["organization"]["teams"]["nodes"]
+        fetches = [fetch_linear_pages(session, projects_query, "projects")]
+        for team in teams:
+            variables = {"filter": get_issue_filter(team["id"], since)}
+            fetches.append(
+                fetch_linear_pages(session, issues_query, "issues", variables)
+            )
+        pages = await asyncio.gather(*fetches)
+        return result, pages[0], [i for team in pages[1:] for i in team]
+
+    result, projects, all_issues = run_linear(client, fetch_all)
+
+    res = h2("Linear Organization")
+    res += f"\nName: {result['organization']['name']}"
+    res += f"\nSlug: {result['organization']['urlKey']}"
+    res += "\n" + h3("Linear Teams")
+    teams = result["organization"]["teams"]["nodes"]
+    for team in teams:
+        res += f"\nTeam Name: {team['name']}" if team.get("name") else ""
+        res += (
+            f"\nDescription: {team['description']}" if team.get("description") else ""
+        )
+        for member in team["members"]["nodes"]:
+            if member.get("active"):
+                res += f"\n{member['name']}"
+                res += (
+                    f" ({member['displayName']})" if member.get("displayName") else ""
+                )
+                res += f" - joined {get_days_ago(member, 'createdAt')}"
+
+    res += h2("Linear Projects")
+    for project in projects:
+        res += h3(f"{project['name']}")
+        res += f"{project['description']}" if project.get("description") else ""
+        res += f"\nCreated: {get_days_ago(project, 'createdAt')}"
+        edit_days_ago = get_edit_days_ago(project, "updatedAt", "createdAt")
+        res += f" Updated: {edit_days_ago}\n\n" if edit_days_ago else "\n"
+
     points = {}
 
     res += h2("Linear Issues")
-    all_issues = result["issues"]["nodes"]
+    all_issues.sort(key=lambda i: i["updatedAt"], reverse=True)
     recent = [i for i in all_issues if not is_obsolete(i)]
-    res += f"{team['issueCount']} total issues, {len(recent)} recent"
+    total = sum([team.get("issueCount") or 0 for team in teams])
+    res += f"{total} total issues, {len(recent)} recent"
     active = [i for i in recent if not i["state"]["type"] in ("completed", "canceled")]
     res += "\n" + h3(f"Active Issues ({len(active)} total)")
     res += render_issues(active, points)
@@ -2,15 +2,25 @@ import json
 import os
 import time
 
+import httpx
 from openai import AzureOpenAI, OpenAI
 
 from missions import plugins
 from missions.models import TaskCategory
 
 from ..functions import get_openai_functions_for
-from ..util import AZURE_MODELS, OPENAI_MODELS, get_provider_llm, get_sized_prompt, log
+from ..retrieval import get_question_inputs
+from ..util import (
+    AZURE_MODELS,
+    OPENAI_MODELS,
+    get_provider_llm,
+    get_sized_prompt,
+    log,
+    split_cacheable,
+)
 
 COMPLETED_STATUSES = ["completed", "failed", "cancelled", "expired"]
+BATCH_COMPLETION_WINDOW = "24h"
 
 
 @plugins.hookimpl
@@ -31,10 +41,10 @@ def show_llm(task, input):
 
 @plugins.hookimpl
 def ask_llm(task):
-    if task.get_llm() in OPENAI_MODELS:
+    if task.get_llm() in OPENAI_MODELS or task.is_test():
         run = ask_openai(task)
         if task.category == TaskCategory.LLM_QUESTION:
-            return run  # just a followup question
+            return task.response  # just a followup question
 
         if run.status == "requires_action":
             log("Updating function")
@@ -49,6 +59,73 @@ def ask_llm(task):
     return None
 
 
+@plugins.hookimpl
+def batch_llm_request(task, input):
+    llm = get_provider_llm(task.get_llm())
+    if task.get_llm() not in OPENAI_MODELS or llm.endswith("-azure"):
+        return None
+    final_prompt = get_openai_prompt(task, input)
+    body = {"model": llm, "messages": [{"role": "user", "content": final_prompt}]}
+    if not llm.startswith("o1-"):
+        body |= {"temperature": 0.3, "frequency_penalty": 0.2, "presence_penalty": 0.2}
+    return {
+        "custom_id": "%s" % task.id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+    }
+
+
+@plugins.hookimpl
+def submit_llm_batch(tasks):
+    if tasks[0].get_llm() not in OPENAI_MODELS:
+        return None
+    openai = get_client(tasks[0])
+    lines = [json.dumps(t.extras["batch_request"]) for t in tasks]
+    upload = openai.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+    )
+    body = {
+        "input_file_id": upload.id,
+        "endpoint": "/v1/chat/completions",
+        "completion_window": BATCH_COMPLETION_WINDOW,
+    }
+    batch = openai.post("/batches", body=body, cast_to=httpx.Response).json()
+    log("Submitted OpenAI batch", batch["id"], "requests", len(lines))
+    return batch["id"]
+
+
+@plugins.hookimpl
+def get_llm_batch_results(task, batch_id):
+    if task.get_llm() not in OPENAI_MODELS:
+        return None
+    openai = get_client(task)
+    batch = openai.get("/batches/%s" % batch_id, cast_to=httpx.Response).json()
+    log("OpenAI batch", batch_id, "status", batch["status"])
+    if batch["status"] not in COMPLETED_STATUSES:
+        return None
+    results = {}
+    for key in ["output_file_id", "error_file_id"]:
+        if not batch.get(key):
+            continue
+        content = openai.files.content(batch[key]).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            response = row.get("response") or {}
+            if row.get("error") or response.get("status_code") != 200:
+                error = row.get("error") or response.get("body", {}).get("error")
+                results[row["custom_id"]] = {"error": "%s" % error}
+                continue
+            completion = response["body"]
+            results[row["custom_id"]] = {
+                "response": completion["choices"][0]["message"]["content"],
+                "usage": completion.get("usage"),
+            }
+    return results
+
+
 def get_client(obj=None, llm=None):
     if not obj:
         return OpenAI()
@@ -101,6 +178,15 @@ def run_openai(task, instructions=None):
 
 
 def ask_openai(task):
+    inputs = []
+    if task.category == TaskCategory.LLM_QUESTION:
+        inputs = get_question_inputs(task)
+    if inputs:
+        # just the final report and the data relevant to the question, in one message
+        report = task.parent.response if task.parent else ""
+        texts = [report] + ["## %s\n\n%s" % (t.name, t.response) for t in inputs]
+        data_prompt = get_sized_prompt(task, "\n\n---\n\n".join(texts))
+        task.extras["final_prompt_length"] = len(data_prompt)
     if task.is_test():
         log("Not asking, using test model")
         task.response = "Test TDTest response"
@@ -108,8 +194,13 @@ def ask_openai(task):
 
     openai = get_client(task)
     thread_id = task.get_thread_id()
-    # get all the data from previous fetch tasks, add as messages if not already there
-    for subtask in task.prerequisite_tasks():
+    if inputs:
+        log("asking with retrieved data, prompt_length", len(data_prompt))
+        openai.beta.threads.messages.create(
+            thread_id=thread_id, role="user", content=data_prompt
+        )
+    # otherwise all the data from previous fetch tasks, as messages if not already there
+    for subtask in [] if inputs else task.prerequisite_tasks():
         if not subtask.get_message_id():
             prompt = get_sized_prompt(subtask, subtask.response or "")
             log("asking prev task", subtask, "prompt_length", len(prompt))
@@ -141,11 +232,22 @@ def ask_openai(task):
     return run
 
 
-def chat_openai(task, input, tool_key=None):
-    if tool_key:
-        return chat_openai_json(task, input, tool_key)
+# prompt tokens served from OpenAI's automatic prefix cache, if reported
+def record_cached_tokens(task, usage):
+    if not usage:
+        return
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    details = usage.get("prompt_tokens_details") or {}
+    task.extras["cache_read_tokens"] = details.get("cached_tokens", 0) or 0
+    task.extras["uncached_input_tokens"] = usage.get("prompt_tokens", 0) - (
+        task.extras["cache_read_tokens"]
+    )
+
+
+def get_openai_prompt(task, input):
     input = (input or "").strip()
-    sized_input = get_sized_prompt(task, input)
+    sized_input = get_sized_prompt(task, input, cacheable=True)
     task_prompt = (task.prompt or "").strip()
     prefix = """
 
@@ -165,10 +267,22 @@ Information to analyze and report on
 
 """
     )
-    final_prompt = prefix + task_prompt + divider + sized_input
-    log("final prompt length", len(final_prompt))
+    # key context before the instructions, so sibling tasks, whose instructions
+    # differ, share a prefix OpenAI can cache
+    (context, data) = split_cacheable(sized_input)
+    if context:
+        context = context.strip() + "\n\n---\n"
+    final_prompt = context + prefix + task_prompt + divider + data
     task.extras["task_prompt"] = task_prompt
     task.extras["final_prompt"] = final_prompt
+    return final_prompt
+
+
+def chat_openai(task, input, tool_key=None):
+    if tool_key:
+        return chat_openai_json(task, input, tool_key)
+    final_prompt = get_openai_prompt(task, input)
+    log("final prompt length", len(final_prompt))
 
     openai = get_client(task)
     llm = get_provider_llm(task.get_llm())
@@ -181,6 +295,7 @@ Information to analyze and report on
                 {"role": "user", "content": final_prompt},
             ],
         )
+        record_cached_tokens(task, completion.usage)
         task.response = completion.choices[0].message.content
     elif azure:
         log("Using Azure OpenAI")
@@ -194,6 +309,7 @@ Information to analyze and report on
             presence_penalty=0.2,
             stream=False,
         )
+        record_cached_tokens(task, completion.usage)
         task.response = completion.choices[0].message.content
     else:
         completion = openai.chat.completions.create(
@@ -205,11 +321,15 @@ Information to analyze and report on
             frequency_penalty=0.2,
             presence_penalty=0.2,
             stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
         )
         counter = 0
         task.response = ""
         for chunk in completion:
             counter += 1
+            if not chunk.choices:  # the final chunk, with usage only
+                record_cached_tokens(task, getattr(chunk, "usage", None))
+                continue
             chunk_message = chunk.choices[0].delta
             if chunk_message.content:
                 task.response += chunk_message.content
@@ -222,32 +342,8 @@ Information to analyze and report on
 
 
 def chat_openai_json(task, input, tool_key=None):
-    input = (input or "").strip()
-    # OpenAI function calls currently appear to have this limit
-    sized_input = get_sized_prompt(task, input)
-    task_prompt = (task.prompt or "").strip()
-    prefix = """
-
-Instructions
-------------
-
-"""
-    divider = (
-        "\n\n---\n\n"
-        if task.is_time_series()
-        else """
-
----
-
-Information to analyze and report on
-------------------------------------
-
-"""
-    )
-    final_prompt = prefix + task_prompt + divider + sized_input
+    final_prompt = get_openai_prompt(task, input)
     log("final JSON prompt length", len(final_prompt))
-    task.extras["task_prompt"] = task_prompt
-    task.extras["final_prompt"] = final_prompt
 
     llm = get_provider_llm(task.get_llm(), use_azure_mini=False)
     if llm.startswith("o1-"):
@@ -293,6 +389,7 @@ Information to analyze and report on
         tools=tools,
         tool_choice=tool_choice,
     )
+    record_cached_tokens(task, completion.usage)
     response_message = completion.choices[0].message
     tool_calls = response_message.tool_calls
     if tool_calls:
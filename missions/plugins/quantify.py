@@ -1,16 +1,33 @@
+import numpy as np
 import yaml
 from datetime import timedelta
-from django.utils.dateparse import parse_date
+from ..devs import CommitStore
+from ..metrics import *
+from ..models import Metric
 from ..util import *
 from missions import plugins
 
 
+# quantifiers that only record metrics and render, saving nothing, so safe to rerun
+METRIC_QUANTIFIERS = [
+    "quantify_dev_activity",
+    "quantify_workflow_runs",
+    "quantify_github_issues",
+    "quantify_hours",
+]
+
+
 @plugins.hookimpl
 def quantify(task):
     # risk quantification is a slightly special case
     if task.url == QUANTIFY_RISK_URL:
         return quantify_project_risks(task)
+    quantifier = get_quantifier(task)
+    return quantifier(task) if quantifier else None
+
 
+# the quantifier for the first prerequisite that calls for one
+def get_quantifier(task):
     # first prereq is always the direct parent
     prereqs = task.prerequisite_tasks()
     if not prereqs or len(prereqs) == 0:
@@ -19,20 +36,20 @@ def quantify(task):
         url = prereq.url
         prereq.refresh_from_db()
         if url and url.endswith("commits"):
-            return quantify_dev_activity(task)
+            return quantify_dev_activity
         elif url and url.endswith("actions"):
-            return quantify_workflow_runs(task)
+            return quantify_workflow_runs
         elif url and FIGMA_API in url:
-            return quantify_figma(task)
+            return quantify_figma
         elif url and (url.startswith(HARVEST_API) or url.startswith(FORECAST_API)):
-            return quantify_hours(task)
+            return quantify_hours
         elif url and url.startswith(GITHUB_PREFIX) and "issues" in url:
-            return quantify_github_issues(task)
+            return quantify_github_issues
         elif url and url.startswith(GITHUB_PREFIX) and "pulls" in url:
-            return quantify_pr_ratings(task)
+            return quantify_pr_ratings
         elif url and url.startswith(JIRA_API) and "quantify" in task.url:
-            return quantify_jira(task)
-    return
+            return quantify_jira
+    return None
 
 
 @plugins.hookimpl
@@ -42,31 +59,62 @@ def run_aggregate(task, tasks, url_key):
         return quantify_hours(task, tasks)
 
 
+DEV_METRICS = [
+    "commits",
+    "changes",
+    "files",
+    "branches",
+    "prs_opened",
+    "prs_merged",
+    "prs_closed",
+]
+
+
+# previous dev summaries from the metrics table if recorded, otherwise from the JSON
+def get_previous_summaries(task):
+    prev_mission = task.mission.previous
+    if prev_mission:
+        repo = task.get_repo() or ""
+        prev = Metric.objects.for_mission(prev_mission.id, DEV_METRICS, repo)
+        if prev:
+            return {
+                dev: SimpleNamespace(**{m: int(vals.get(m, 0)) for m in DEV_METRICS})
+                for dev, vals in prev.items()
+            }
+
+    prev_devs = CommitStore()
+    prev_task = task.previous()
+    if prev_task:
+        prev_devs = CommitStore.from_tasks(prev_task.prerequisite_tasks())
+    if not prev_devs and prev_mission:
+        prev_devs = CommitStore.from_tasks(prev_mission.commit_tasks())
+    if task.mission.flags.get("combine_by_name"):
+        prev_devs = prev_devs.by_name()
+    return prev_devs.summaries()
+
+
 def quantify_dev_activity(task):
     md = ""
-    devs = {}
-    prev_devs = {}
 
     # always run a quantified task for a final report if there are any commit tasks
     tasks = task.prerequisite_tasks()
-    devs = concatenate_dev_data(tasks)
-    prev_task = task.previous()
-    if prev_task:
-        prev_devs = concatenate_dev_data(prev_task.prerequisite_tasks())
-    if not prev_devs and task.mission.previous:
-        prev_devs = concatenate_dev_data(task.mission.previous.commit_tasks())
+    devs = CommitStore.from_tasks(tasks)
 
     if devs:
         if task.mission.flags.get("combine_by_name"):
             log("Combining by names")
-            devs = combine_devs_by_name(devs)
+            devs = devs.by_name()
+        summaries = devs.summaries()
+        task.save_metrics(
+            [
+                (metric, name, "", getattr(summaries[name], metric))
+                for name in summaries
+                for metric in DEV_METRICS
+            ]
+        )
+        prev_summaries = get_previous_summaries(task) if task.is_time_series() else {}
         # sort by total changes
-        for name in devs:
-            commits = devs[name].get("commits", [])
-            commits = [c for c in commits if c["type"] == "normal"]
-            devs[name]["total"] = sum([c["changes"] for c in commits])
-
-        devs_desc = sorted(devs, key=lambda x: devs[x]["total"], reverse=True)
+        devs_desc = sorted(summaries, key=lambda x: summaries[x].changes, reverse=True)
 
         days = task.parent.commit_days() if task.parent else task.commit_days()
         md += "\n## Quantified Commit Activity Over %s Days\n" % days
@@ -74,10 +122,10 @@ def quantify_dev_activity(task):
         md += "| Developer | Avatar | Branches | PRs | Commits | Files | Changes |\n"
         md += "| --------- | ------ | -------- | --- | ------- | ----- | ------- |\n"
         for name in devs_desc:
-            dev = get_dev_summary(devs[name])
+            dev = summaries[name]
             md += f"| **{dev.link}** | {dev.avatar} | {dev.branches} | {dev.prs} | {dev.commits} | {dev.files} | {dev.changes} |\n"
-            if prev_devs and name in prev_devs and task.is_time_series():
-                dev_prev = get_dev_summary(prev_devs[name])
+            if name in prev_summaries:
+                dev_prev = prev_summaries[name]
                 diff = get_dev_diff(dev, dev_prev)
                 if diff:
                     md += f"| vs. last report | | {diff.branches} | {diff.prs} | {diff.commits} | {diff.files} | {diff.changes} |\n"
@@ -97,6 +145,7 @@ def quantify_workflow_runs(task):
     md += "\n<div markdown='1' class='table-container workflow-quant-table'>\n"
     md += "| Workflow | Runs | Complete | Success | Failure | Success % | Runs Since Failure | \n"
     md += "| -------- | ---- | -------- | ------- | ------- | --------- | ------------------ | \n"
+    metrics = []
     for key in keys:
         if key in ["workflows", "runs"]:
             continue
@@ -108,21 +157,40 @@ def quantify_workflow_runs(task):
         total = len(runs)
         if total == 0:
             continue
-        complete = [r for r in runs if r["status"] == "completed"]
-        complete = [r for r in runs if r["conclusion"] in ["success", "failure"]]
-        success = len([r for r in complete if r["conclusion"] == "success"])
-        failure = len([r for r in complete if r["conclusion"] == "failure"])
+        # runs are newest first, so the streak is the count before the first failure
+        outcomes = [r["conclusion"] for r in runs]
+        outcomes = [o for o in outcomes if o in ["success", "failure"]]
+        counts = tally(outcomes, ["success", "failure"])
+        success, failure = counts["success"], counts["failure"]
         perc = 100 * success / (success + failure) if success + failure > 0 else 0
-        last_failure = next(
-            (idx for (idx, d) in enumerate(complete) if d["conclusion"] == "failure"),
-            len(complete),
-        )
-        md += f"| **{name}** | {total} | {len(complete)} | {success} | {failure} | {perc:.0f}% | {last_failure} |\n"
+        last_failure = runs_since(outcomes, "failure")
+        metrics += [
+            ("workflow_runs", name, "", total),
+            ("workflow_complete", name, "", len(outcomes)),
+            ("workflow_success", name, "", success),
+            ("workflow_failure", name, "", failure),
+            ("workflow_runs_since_failure", name, "", last_failure),
+        ]
+        md += f"| **{name}** | {total} | {len(outcomes)} | {success} | {failure} | {perc:.0f}% | {last_failure} |\n"
     md += "</div>\n"
+    task.save_metrics(metrics)
     task.response = md
     return task.response
 
 
+# opened, closed etc. per window of days, one sort per timestamp rather than a parse per row
+def get_issue_activity(issues, created, closed, is_closed, now=None):
+    opened = Timeline(issues, created, now)
+    windows = get_windows(get_days_since(opened.items[-1], created) or 0)
+    closed = Timeline([i for i in issues if is_closed(i)], closed, now)
+    return {
+        "windows": windows,
+        "opened": opened.counts(windows),
+        "closed": closed.counts(windows),
+        "opened_timeline": opened,
+    }
+
+
 def quantify_github_issues(task):
     task.response = ""
     dep = task.parent
@@ -130,43 +198,65 @@ def quantify_github_issues(task):
     issues = dep.structured_data.get("issues", [])
     if not issues:
         return log("No issues found for GitHub quant task")
-    issues = sorted(issues, key=lambda x: x.get("created"), reverse=True)
-    oldest = get_days_since(issues[-1], "created")
+    activity = get_issue_activity(
+        issues, "created", "closed", lambda i: i["state"] == "closed", task.completed_at
+    )
+    windows = activity["windows"]
+    opened = activity["opened_timeline"]
+    comments = opened.sums(windows, lambda i: i["comments"])
+    labels = opened.matches(windows, lambda i: not i.get("labels", []))
+    milestones = opened.distinct(windows, lambda i: i.get("milestone", ""))
+    metrics = [
+        ("issues_total", "", "all", counts["closed_issues"] + counts["open_issues"]),
+        ("issues_closed", "", "all", counts["closed_issues"]),
+    ]
+    for idx, row in enumerate(windows):
+        metrics += [
+            ("issues_opened", "", f"{row}d", activity["opened"][idx]),
+            ("issues_closed", "", f"{row}d", activity["closed"][idx]),
+            ("issues_comments", "", f"{row}d", comments[idx]),
+            ("issues_unlabeled", "", f"{row}d", labels[idx]),
+            ("issues_milestones", "", f"{row}d", milestones[idx]),
+        ]
+    task.save_metrics(metrics)
 
     md = f"\n### Recent GitHub Issues Activity\n"
     md += "\n<div markdown='1' class='table-container'>\n"
     md += "| Timespan | Opened | Closed | Comments | Labeled | Milestones | \n"
     md += "| -------- | ------ | ------ | -------- | ------- | ---------- | \n"
-
-    rows = [7, 14, 30, 0]
-    if oldest > 365:
-        rows = [7, 30, 90, 365, 0]
-    elif oldest > 90:
-        rows = [7, 30, 90, 0]
-    elif oldest < 30:
-        rows = [7, 14, 0]
-    for row in rows:
-        if row == 0:
-            md += f"| All Time | {counts['closed_issues'] + counts['open_issues']} | {counts['closed_issues']} | - | - | - |\n"
-        else:
-            opened = [i for i in issues if get_days_since(i, "created") <= row]
-            comments = sum([i["comments"] for i in opened], 0)
-            labels = sum([0 if i.get("labels", []) else 1 for i in opened], 0)
-            milestones = len(set([i.get("milestone", "") for i in opened]))
-            closed = [
-                i
-                for i in issues
-                if i["state"] == "closed"
-                and (get_days_since(i, "closed") or 9999) <= row
-            ]
-            name = f"{row} Days" if row < 365 else "1 Year"
-            md += f"| {name} | {len(opened)} | {len(closed)} | {comments} | {labels} | {milestones} |\n"
+    for idx, row in enumerate(windows):
+        name = get_window_name(row)
+        md += f"| {name} | {activity['opened'][idx]} | {activity['closed'][idx]} | {comments[idx]:g} | {labels[idx]:g} | {milestones[idx]:g} |\n"
+    md += f"| All Time | {counts['closed_issues'] + counts['open_issues']} | {counts['closed_issues']} | - | - | - |\n"
     md += "</div>\n"
     md += "\n<sub>Like all software activity quantification, these numbers are imperfect but sometimes useful. Comments, Labels, and Milestones refer to those issues opened in the timespan in question.</sub>\n"
     task.response = md
     return task.response
 
 
+HOURS_WEEKS = 2  # how many full weeks before the current one to tabulate
+
+
+# running sums over a difference array: +hours at each start, -hours after each end
+def get_day_matrix(rows, days, people, starts, ends, hours):
+    starts = np.clip(starts, 0, days)
+    ends = np.clip(ends + 1, 0, days)
+    keep = starts < ends
+    diffs = np.zeros((rows, days + 1))
+    np.add.at(diffs, (people[keep], starts[keep]), hours[keep])
+    np.add.at(diffs, (people[keep], ends[keep]), -hours[keep])
+    return np.cumsum(diffs, axis=1)[:, :days]
+
+
+def get_day_offsets(dates, first_day):
+    dates = np.array(dates, dtype="datetime64[D]")
+    return (dates - np.datetime64(first_day, "D")).astype(int)
+
+
+def format_hours(hours):
+    return f"{round(float(hours), 2) + 0.0:g}"  # + 0.0 avoids "-0"
+
+
 # get, diff Harvest/Forecast hours
 def quantify_hours(task, taskset=None):
     if not taskset:
@@ -178,74 +268,99 @@ def quantify_hours(task, taskset=None):
     if not harvest_tasks:
         raise Exception("No Forecast fetch tasks/data found")
 
-    people = []
+    # as of completion, so a backfill tabulates the same weeks
+    today = (task.completed_at or datetime.datetime.now()).date()
+    first_day = today - timedelta(days=today.weekday() + 7 * HOURS_WEEKS)
+    days = 7 * HOURS_WEEKS
+
+    names = []
+    forecast_rows = {}
+    allocs = {"people": [], "starts": [], "ends": [], "hours": []}
     for forecast_task in forecast_tasks:
         forecast_data = forecast_task.structured_data
         for id in forecast_data.keys():
             vals = forecast_data[id]
-            person = {"name": vals["name"], "forecast": id, "allocs": {}, "entries": {}}
-            existing = [p for p in people if p["forecast"] == id]
-            if existing:
-                person = existing[0]
-            elif [p for p in people if p["name"] == vals["name"]]:
-                raise Exception("Duplicate Forecast names, further refinement required")
+            if id not in forecast_rows:
+                if vals["name"] in names:
+                    raise Exception(
+                        "Duplicate Forecast names, further refinement required"
+                    )
+                forecast_rows[id] = len(names)
+                names.append(vals["name"])
             for alloc in vals.get("allocations", []):
-                now = parse_date(alloc["start"])
-                end = parse_date(alloc["end"])
-                while now <= end:
-                    key = now.strftime("%Y-%m-%d")
-                    hours = round(person["allocs"].get(key, 0.0) + alloc["hours"], 2)
-                    person["allocs"][key] = hours
-                    now = now + timedelta(days=1)
-            people.append(person)
+                allocs["people"].append(forecast_rows[id])
+                allocs["starts"].append(alloc["start"])
+                allocs["ends"].append(alloc["end"])
+                allocs["hours"].append(alloc["hours"])
 
+    rows_by_name = {name: idx for idx, name in enumerate(names)}
+    entries = {"people": [], "dates": [], "hours": []}
     for harvest_task in harvest_tasks:
         harvest_data = harvest_task.structured_data
         for id in harvest_data.keys():
             vals = harvest_data[id]
-            person = {"name": vals["name"], "harvest": id, "allocs": {}, "entries": {}}
-            existing = [p for p in people if p["name"] == vals["name"]]
-            if existing:
-                person = existing[0]
-                person["harvest"] = id
+            if vals["name"] not in rows_by_name:
+                rows_by_name[vals["name"]] = len(names)
+                names.append(vals["name"])
             for entry in vals["entries"]:
-                key = entry["date"]
-                hours = round(person["entries"].get(key, 0.0) + entry["hours"], 2)
-                person["entries"][key] = hours
-            if not existing:
-                people.append(person)
-    today = datetime.datetime.today().date()
+                entries["people"].append(rows_by_name[vals["name"]])
+                entries["dates"].append(entry["date"])
+                entries["hours"].append(entry["hours"])
+
+    # person x day arrays over the weeks we show
+    allocated = get_day_matrix(
+        len(names),
+        days,
+        np.array(allocs["people"], dtype=int),
+        get_day_offsets(allocs["starts"], first_day),
+        get_day_offsets(allocs["ends"], first_day),
+        np.array(allocs["hours"], dtype=float),
+    )
+    entry_days = get_day_offsets(entries["dates"], first_day)
+    logged = get_day_matrix(
+        len(names),
+        days,
+        np.array(entries["people"], dtype=int),
+        entry_days,
+        entry_days,
+        np.array(entries["hours"], dtype=float),
+    )
+    allocated = allocated.reshape(len(names), HOURS_WEEKS, 7)
+    logged = logged.reshape(len(names), HOURS_WEEKS, 7)
+    # assume weekend allocations 0
+    if task.flags.get("weekend_allocations") != "true":
+        allocated[:, :, 5:] = 0
+    allocated_totals = allocated.sum(axis=2)
+    logged_totals = logged.sum(axis=2)
+    diffs = allocated_totals - logged_totals
+    any_hours = ((allocated > 0) | (logged > 0)).any(axis=2)
+    metrics = []
+    for idx, week in zip(*np.nonzero(any_hours)):
+        period = (first_day + timedelta(days=7 * int(week))).isoformat()
+        metrics += [
+            ("hours_allocated", names[idx], period, allocated_totals[idx, week]),
+            ("hours_logged", names[idx], period, logged_totals[idx, week]),
+        ]
+    task.save_metrics(metrics)
 
     html = ""
-    for week in range(0, 2):
-        start_day = today - timedelta(days=today.weekday() + 7 + ((1 - week) * 7))
+    for week in range(0, HOURS_WEEKS):
+        start_day = first_day + timedelta(days=7 * week)
         html += f"<h3>Hours Allocated / Logged For Week Of {start_day}</h3>"
         html += "<div class='harvest-forecast-table table-container'>"
         html += "<table>"
         html += "<thead><tr><th>Person</th><th>Mon</th><th>Tue</th><th>Wed</th><th>Thu</th><th>Fri</th><th>Sat</th><th>Sun</th><th>Total</th><th>Diff</th></tr></thead>"
         html += "<tbody>"
-        for person in people:
-            any_hours = False
-            row = f"<tr><td><strong>{person['name']}</strong></td>"
-            tot_all = 0
-            tot_ent = 0
-            for diff in range(0, 7):
-                day = start_day + timedelta(days=diff)
-                key = day.strftime("%Y-%m-%d")
-                all = person["allocs"].get(key, 0)
-                # assume weekend allocations 0
-                if diff in [5, 6] and task.flags.get("weekend_allocations") != "true":
-                    all = 0
-                ent = person["entries"].get(key, 0)
-                entry = f"{all}/{ent}"
-                row += f"<td>{entry.replace('0/0', '--')}</td>"
-                tot_all += all
-                tot_ent += ent
-                tot_diff = round(tot_all - tot_ent, 2)
-                any_hours = any_hours or all > 0 or ent > 0
-            row += f"<td><strong>{round(tot_all, 2)}/{round(tot_ent, 2)}</strong></td>"
-            row += f"<td><strong>{round(tot_diff, 2)}</strong></td></tr>"
-            html += row if any_hours else ""
+        for idx in np.flatnonzero(any_hours[:, week]):
+            row = f"<tr><td><strong>{names[idx]}</strong></td>"
+            for all, ent in zip(allocated[idx, week], logged[idx, week]):
+                entry = f"{format_hours(all)}/{format_hours(ent)}"
+                row += f"<td>{'--' if entry == '0/0' else entry}</td>"
+            tot_all = format_hours(allocated_totals[idx, week])
+            tot_ent = format_hours(logged_totals[idx, week])
+            row += f"<td><strong>{tot_all}/{tot_ent}</strong></td>"
+            row += f"<td><strong>{format_hours(diffs[idx, week])}</strong></td></tr>"
+            html += row
         html += "</tbody>"
         html += "</table>"
         html += "</div>"
@@ -483,10 +598,34 @@ def quantify_jira(task):
     for row in rows:
         md += "| %s |\n" % " | ".join([str(row.get(c[0], "")) for c in columns])
     md += "</div>\n"
+    if task.flags.get("issue_activity") == "true":
+        md += render_jira_activity(issues)
     task.response = md
     return task.response
 
 
+# done issues count as closed when their status category last changed
+def render_jira_activity(issues):
+    activity = get_issue_activity(
+        issues,
+        "created",
+        "statusCategoryChanged",
+        lambda i: i.get("statusCategory") == "Done",
+    )
+    windows = activity["windows"]
+    opened = activity["opened_timeline"]
+    bugs = opened.matches(windows, lambda i: i.get("issueType") == "Bug")
+    md = "\n### Recent Jira Issues Activity\n"
+    md += "\n<div markdown='1' class='table-container jira-quant-table'>\n"
+    md += "| Timespan | Opened | Closed | Bugs Opened |\n"
+    md += "| -------- | ------ | ------ | ----------- |\n"
+    for idx, row in enumerate(windows):
+        name = get_window_name(row)
+        md += f"| {name} | {activity['opened'][idx]} | {activity['closed'][idx]} | {bugs[idx]:g} |\n"
+    md += "</div>\n"
+    return md
+
+
 def quantify_project_risks(task):
     if not task.parent:
         raise Exception("No parent found for risk quantification task")
@@ -1,8 +1,16 @@
 import datetime, os
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
 from slack_sdk import WebClient
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
 from ..util import *
 from missions import plugins
 
+SLACK_MAX_WORKERS = 4  # conversations.history is Tier 3, ~50 calls a minute
+SLACK_PAGE_SIZE = 200  # Slack recommends no more than 200 per page
+MAX_SLACK_PAGES = 10
+SLACK_USERS_CACHE_SECONDS = 60 * 60
+
 
 @plugins.hookimpl
 def run_api(task):
@@ -28,7 +36,24 @@ def get_slack(task, integration=None):
         access_token = os.environ.get("SLACK_API_TOKEN")
     if not access_token:
         raise Exception("No Slack token found")
-    return WebClient(token=secret.value)
+    client = WebClient(token=access_token)
+    client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=2))
+    return client
+
+
+# follow response_metadata.next_cursor, collecting the given key from each page
+def fetch_slack_pages(method, key, **kwargs):
+    results = []
+    cursor = None
+    for page in range(MAX_SLACK_PAGES):
+        if cursor:
+            kwargs["cursor"] = cursor
+        response = method(limit=SLACK_PAGE_SIZE, **kwargs)
+        results += response[key]
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            break
+    return results
 
 
 def get_slack_channels(integration):
@@ -39,60 +64,102 @@ def get_slack_channels(integration):
             {"id": "tdtest3", "name": "TDTest Slack Channel 3"},
         ]
     slack = get_slack(None, integration)
-    channels = slack.conversations_list()
-    return [
-        {"id": channel["id"], "name": channel["name"]}
-        for channel in channels["channels"]
-    ]
+    channels = fetch_slack_pages(slack.conversations_list, "channels")
+    return [{"id": channel["id"], "name": channel["name"]} for channel in channels]
 
 
 def get_slack_chatter(task, slack):
     task.response = "Today is %s\n\n" % datetime.datetime.now().strftime("%Y-%m-%d")
-    (users, user_string) = get_slack_users(slack)
+    (users, user_string) = get_mission_slack_users(task, slack)
     task.response += h2("Slack Channels")
-    channels = slack.conversations_list()
+    channels = fetch_slack_pages(slack.conversations_list, "channels")
     exclude = task.get_project_value("slack_exclude", [])
     include = task.get_project_value("slack_include", [])
-    for channel in channels["channels"]:
-        if include and not channel["name"] in include and not channel["id"] in include:
-            continue
-        task.response += h3(f"Channel: {channel['name']}")
-        task.response += f"Created: {channel['created']} updated {channel['updated']}\n"
-        task.response += f"Archived: {channel['is_archived']}\n"
-        task.response += f"Topic: {channel['topic']['value']}\n"
-        task.response += f"Purpose: {channel['purpose']['value']}\n"
-        if channel["name"] in exclude or channel["id"] in exclude:
-            continue
-        task.response += h4(f"Recent Conversation: {channel['name']}")
-        task.response += render_recent_conversation(task, slack, users, channel["id"])
-    task.response += user_string
-
+    if include:
+        channels = [c for c in channels if c["name"] in include or c["id"] in include]
+    to_fetch = [c for c in channels if not is_excluded(c, exclude)]
 
-def render_recent_conversation(task, slack, users, channel_id):
-    response = ""
+    # time series only need what's new since the newest message we saw last time
     cutoff_days = task.cadence_days() * 2 if task.is_time_series() else 30
     cutoff = datetime.datetime.now() - datetime.timedelta(days=cutoff_days)
-    history = slack.conversations_history(
-        channel=channel_id, oldest=cutoff.timestamp(), limit=999
-    )
+    previous = task.previous() if task.is_time_series() else None
+    previous_ts = previous.structured_data.get("latest_ts", {}) if previous else {}
+
+    def fetch(channel):
+        oldest = max(cutoff.timestamp(), float(previous_ts.get(channel["id"], 0)))
+        return fetch_slack_pages(
+            slack.conversations_history,
+            "messages",
+            channel=channel["id"],
+            oldest=oldest,
+        )
+
+    with ThreadPoolExecutor(max_workers=SLACK_MAX_WORKERS) as executor:
+        histories = dict(
+            zip([c["id"] for c in to_fetch], executor.map(fetch, to_fetch))
+        )
+
+    latest_ts = dict(previous_ts)
+    r = []
+    for channel in channels:
+        r.append(h3(f"Channel: {channel['name']}"))
+        r.append(f"Created: {channel['created']} updated {channel['updated']}\n")
+        r.append(f"Archived: {channel['is_archived']}\n")
+        r.append(f"Topic: {channel['topic']['value']}\n")
+        r.append(f"Purpose: {channel['purpose']['value']}\n")
+        if channel["id"] not in histories:
+            continue
+        messages = histories[channel["id"]]
+        if messages:
+            latest_ts[channel["id"]] = max([m["ts"] for m in messages], key=float)
+        r.append(h4(f"Recent Conversation: {channel['name']}"))
+        r.append(render_recent_conversation(messages, users))
+    task.response += "".join(r) + user_string
+    task.structured_data["latest_ts"] = latest_ts
+
+
+def is_excluded(channel, exclude):
+    return channel["name"] in exclude or channel["id"] in exclude
+
+
+def render_recent_conversation(messages, users):
+    lines = []
     current = 0
-    for message in history["messages"][::-1]:
+    for message in reversed(messages):
         ts = int(float(message["ts"]))
         if ts - current > 3000:
-            response += "\n" + h5(f"{datetime.datetime.fromtimestamp(ts)}")
+            lines.append("\n" + h5(f"{datetime.datetime.fromtimestamp(ts)}"))
             current = ts
-        user_id = message.get("user", "n/a")
-        user = users[user_id] if user_id in users else user_id
         if "text" in message:
-            response += f"{user}: {message['text']}\n"
-    return response
+            user_id = message.get("user", "n/a")
+            lines.append(f"{users.get(user_id, user_id)}: {message['text']}\n")
+    return "".join(lines)
+
+
+# the user list is the same for every Slack task in a mission on the same workspace,
+# so fetch it once per workspace
+def get_mission_slack_users(task, slack):
+    workspace = slack.auth_test()["team_id"]
+    cache_key = "slack_users_%s_%s" % (task.mission_id, workspace)
+    try:
+        cached = cache.get(cache_key)
+        if cached:
+            return cached
+    except Exception:
+        log("Error reading cached Slack users")
+    slack_users = get_slack_users(slack)
+    try:
+        cache.set(cache_key, slack_users, SLACK_USERS_CACHE_SECONDS)
+    except Exception:
+        log("Error caching Slack users")
+    return slack_users
 
 
 def get_slack_users(slack):
     slack_users = {}
-    users = slack.users_list()
+    users = fetch_slack_pages(slack.users_list, "members")
     r = h2("Slack Users")
-    for user in users["members"]:
+    for user in users:
         r += h3(f"User: {user['name']}")
         r += f"ID: {user['id']}\n"
         slack_users[user["id"]] = user["name"]
@@ -0,0 +1,108 @@
+from ..tracing import hook_span, record_llm_output
+from missions import plugins
+
+# Hookwrappers that record a span around every hook call, registered when tracing
+
+
+@plugins.hookimpl(wrapper=True)
+def run_scrape(task):
+    with hook_span("run_scrape", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_api(task):
+    with hook_span("run_api", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def filter_from_data_tasks(task, data_tasks):
+    with hook_span("filter_from_data_tasks", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def implement_llm_decision(task):
+    with hook_span("implement_llm_decision", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_fetch_for_llm(task):
+    with hook_span("run_fetch_for_llm", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_aggregate(task, tasks, url_key):
+    with hook_span("run_aggregate", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_rating(task):
+    with hook_span("run_rating", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def quantify(task):
+    with hook_span("quantify", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_agent(task):
+    with hook_span("run_agent", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def run_eval(task):
+    with hook_span("run_eval", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def batch_llm_request(task, input):
+    with hook_span("batch_llm_request", task):
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def chat_llm(task, input, tool_key):
+    with hook_span("chat_llm", task) as hook:
+        output = yield
+        record_llm_output(hook, task, output)
+        return output
+
+
+@plugins.hookimpl(wrapper=True)
+def show_llm(task, input):
+    with hook_span("show_llm", task) as hook:
+        output = yield
+        record_llm_output(hook, task, output)
+        return output
+
+
+@plugins.hookimpl(wrapper=True)
+def ask_llm(task):
+    with hook_span("ask_llm", task) as hook:
+        output = yield
+        record_llm_output(hook, task, output)
+        return output
+
+
+@plugins.hookimpl(wrapper=True)
+def submit_llm_batch(tasks):
+    with hook_span("submit_llm_batch", tasks[0]) as hook:
+        if hook is not None:
+            hook.set(batch__size=len(tasks))
+        return (yield)
+
+
+@plugins.hookimpl(wrapper=True)
+def get_llm_batch_results(task, batch_id):
+    with hook_span("get_llm_batch_results", task):
+        return (yield)
@@ -40,7 +40,8 @@ def get_prompt_from_github(key):
         user_agent="PyGitHub/Python|YamLLMs|info@" + settings.BASE_DOMAIN,
     )
     repo = gh.get_repo(settings.GITHUB_PROMPTS_REPO)
-    prompt = get_gh_file(repo, {"name": filename})
+    # prompts live at the top of the repo, so one call, no tree lookup
+    prompt = base64.b64decode(repo.get_contents(filename).content).decode("utf-8")
     cache_minutes = 1 if settings.DEBUG or settings.TESTING else 60
     try:
         cache.set("prompt_%s" % filename, prompt, cache_minutes * 60)
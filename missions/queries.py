@@ -0,0 +1,134 @@
+import json, os, re, time, traceback
+from collections import Counter
+from contextlib import contextmanager
+from django.db import connection
+from .util import *
+
+QUERY_AUDIT = os.getenv("QUERY_AUDIT", "")  # "true" to audit task runs and requests
+TASK_QUERY_BUDGET = 200  # task runs over this many queries are logged
+REQUEST_QUERY_BUDGET = 50  # likewise web requests
+REPEAT_THRESHOLD = 3  # the same query shape this many times is a likely N+1
+MAX_REPEATS = 10  # query shapes kept per audit
+AUDIT_KEY = "query_audits"  # a redis list of the most recent request audits
+MAX_AUDITS = 200
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+OWN_CODE = (os.sep + "missions" + os.sep, os.sep + "web" + os.sep)
+
+
+# the shape of a query, without parameters or IN lists of any length
+def get_fingerprint(sql):
+    return LITERALS.sub("?", IN_LIST.sub("IN (...)", sql))
+
+
+# the innermost frame of our own code, outside this file, that issued a query
+def get_call_site():
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename == __file__:
+            continue
+        if any(d in frame.filename for d in OWN_CODE):
+            return "%s:%s %s" % (
+                frame.filename.split(os.sep)[-1],
+                frame.lineno,
+                frame.name,
+            )
+    return ""
+
+
+class QueryAudit:
+    def __init__(self):
+        self.count = 0
+        self.query_ns = 0
+        self.shapes = Counter()
+        self.exact = Counter()
+        self.sites = {}
+
+    def record(self, execute, sql, params, many, context):
+        start = time.time_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_ns += time.time_ns() - start
+            self.count += 1
+            fingerprint = get_fingerprint(sql)
+            self.shapes[fingerprint] += 1
+            self.exact[(sql, "%s" % (params,))] += 1
+            if fingerprint not in self.sites:  # first time only, stacks are slow
+                self.sites[fingerprint] = get_call_site()
+
+    def repeats(self, threshold=REPEAT_THRESHOLD):
+        return [
+            {"sql": sql[:300], "count": count, "site": self.sites.get(sql, "")}
+            for sql, count in self.shapes.most_common(MAX_REPEATS)
+            if count >= threshold
+        ]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "time_ms": self.query_ns // 1000000,
+            "duplicates": self.count - len(self.exact),  # identical sql and params
+            "repeats": self.repeats(),
+        }
+
+    def describe(self):
+        lines = ["%s queries" % self.count]
+        for r in self.repeats():
+            lines.append("%sx at %s: %s" % (r["count"], r["site"], r["sql"]))
+        return "\n".join(lines)
+
+
+@contextmanager
+def audit_queries():
+    audit = QueryAudit()
+    with connection.execute_wrapper(audit.record):
+        yield audit
+
+
+# per task run, when QUERY_AUDIT or the task's query_audit flag is set
+@contextmanager
+def audit_task(task):
+    if QUERY_AUDIT != "true" and task.flags.get("query_audit") != "true":
+        yield None
+        return
+    with audit_queries() as audit:
+        yield audit
+    if audit.count > TASK_QUERY_BUDGET or audit.repeats():
+        log("Query audit for", task, audit.describe())
+
+
+def record_request(method, path, status, audit):
+    if audit.count > REQUEST_QUERY_BUDGET or audit.repeats():
+        log("Query audit for", method, path, audit.describe())
+    entry = {"method": method, "path": path, "status": status, "at": int(time.time())}
+    try:
+        import django_rq  # type: ignore
+
+        redis = django_rq.get_connection("default")
+        redis.lpush(AUDIT_KEY, json.dumps(entry | audit.summary()))
+        redis.ltrim(AUDIT_KEY, 0, MAX_AUDITS - 1)
+    except Exception as ex:
+        log("Error recording query audit", ex)
+
+
+def get_request_audits():
+    try:
+        import django_rq  # type: ignore
+
+        redis = django_rq.get_connection("default")
+        return [json.loads(a) for a in redis.lrange(AUDIT_KEY, 0, -1)]
+    except Exception as ex:
+        log("Error reading query audits", ex)
+    return []
+
+
+# for tests: fail if a block goes over its query budget or repeats a query shape
+@contextmanager
+def assert_query_budget(budget, threshold=REPEAT_THRESHOLD):
+    with audit_queries() as audit:
+        yield audit
+    if audit.count > budget:
+        raise AssertionError("Over budget of %s: %s" % (budget, audit.describe()))
+    if audit.repeats(threshold):
+        raise AssertionError("Likely N+1: %s" % audit.describe())
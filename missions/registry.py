@@ -0,0 +1,238 @@
+import importlib, threading
+from collections import Counter
+import pluggy
+from .models.base import TaskCategory
+from .util import *
+
+
+# a plugin module, the hooks it implements, and the task URL prefixes or model
+# families, and task categories, it answers those hooks for
+class PluginSpec:
+    def __init__(self, name, hooks, prefixes=[], categories=[]):
+        self.name = name
+        self.hooks = hooks
+        self.prefixes = prefixes
+        self.categories = categories
+
+    def __repr__(self):
+        return self.name
+
+
+# each is imported the first time a hook call might need it
+PLUGINS = [
+    PluginSpec("github", ["run_api"], [GITHUB_PREFIX]),
+    PluginSpec("jira", ["run_api"], [ATLASSIAN_API]),
+    PluginSpec("linear", ["run_api"], [LINEAR_API]),
+    PluginSpec("notion", ["run_api"], [NOTION_API]),
+    PluginSpec("figma", ["run_api"], [FIGMA_API]),
+    PluginSpec("monday", ["run_api"], [MONDAY_API]),
+    PluginSpec("sentry", ["run_api"], [SENTRY_API]),
+    PluginSpec("slack", ["run_api"], [SLACK_API]),
+    PluginSpec("harvest", ["run_api"], [HARVEST_API, FORECAST_API]),
+    PluginSpec(
+        "openai",
+        [
+            "chat_llm",
+            "show_llm",
+            "ask_llm",
+            "batch_llm_request",
+            "submit_llm_batch",
+            "get_llm_batch_results",
+        ],
+        ["gpt-", "o1", "o3", "ft:gpt-"],
+    ),
+    PluginSpec("gemini", ["chat_llm", "ask_llm"], ["gemini"]),
+    PluginSpec(
+        "anthropic",
+        [
+            "chat_llm",
+            "batch_llm_request",
+            "submit_llm_batch",
+            "get_llm_batch_results",
+        ],
+        ["claude"],
+    ),
+    PluginSpec("mistral", ["chat_llm"], ["mistral"]),
+    PluginSpec(
+        "quantify",
+        ["quantify", "run_aggregate"],
+        categories=[TaskCategory.QUANTIFIED_REPORT, TaskCategory.AGGREGATE_REPORTS],
+    ),
+    PluginSpec(
+        "agent",
+        ["run_agent", "run_rating"],
+        categories=[TaskCategory.AGENT_TASK, TaskCategory.LLM_RATING],
+    ),
+    PluginSpec(
+        "fetch",
+        ["implement_llm_decision", "run_fetch_for_llm"],
+        categories=[TaskCategory.LLM_DECISION, TaskCategory.FETCH_FOR_LLM],
+    ),
+    PluginSpec("evals", ["run_eval"], categories=[TaskCategory.LLM_EVALUATION]),
+    PluginSpec("scrape", ["run_scrape"], categories=[TaskCategory.SCRAPE]),
+    PluginSpec("bing", ["run_api"], [BING_API]),
+    PluginSpec("nemotron", ["chat_llm"], ["nvidia/llama"]),
+    # Add other plugins here
+]
+URL_HOOKS = ["run_api"]  # routed by task URL
+LLM_HOOKS = [  # routed by model
+    "chat_llm",
+    "show_llm",
+    "ask_llm",
+    "batch_llm_request",
+    "submit_llm_batch",
+    "get_llm_batch_results",
+]
+FALLBACK_ROUTE = "*"
+
+
+# longest-prefix lookup, one step per character of the key
+class RouteTrie:
+    END = ""  # never a character, so it can mark where a prefix ends
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, prefix, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self.END] = (prefix, value)
+
+    # the (prefix, value) for the longest inserted prefix of key, if any
+    def resolve(self, key):
+        node = self.root
+        found = node.get(self.END)
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(self.END, found)
+        return found
+
+
+# A pluggy plugin manager that imports plugins on demand and routes each hook call
+# straight to the one plugin declared for its URL, model, or category. Whenever a
+# call needs a new plugin, a fresh manager is built with every loaded plugin
+# registered in the order above, so hook precedence is the same as registering
+# them all up front, and calls in flight on other threads keep the old manager.
+# Calls with no route go through pluggy as usual, as do plugins registered here
+# without a declaration, which are always loaded and always get a look in.
+class PluginRegistry:
+    def __init__(self, project_name, hookspecs, plugins=PLUGINS):
+        self.project_name = project_name
+        self.hookspecs = hookspecs
+        self.plugins = plugins
+        self.loaded = {}  # plugin name -> module
+        self.undeclared = []
+        self.lock = threading.Lock()
+        self.tries = {}  # hook name -> RouteTrie
+        self.categories = {}  # (hook name, category) -> plugin
+        for plugin in plugins:
+            self.add_routes(plugin)
+        self.counts = Counter()  # (hook name, route) -> calls
+        self.manager = self.get_manager()
+        self.hook = LazyHookRelay(self)
+
+    def add_routes(self, plugin):
+        for hook_name in plugin.hooks:
+            if plugin.prefixes:
+                trie = self.tries.setdefault(hook_name, RouteTrie())
+                for prefix in plugin.prefixes:
+                    trie.insert(prefix, plugin)
+            for category in plugin.categories:
+                self.categories[(hook_name, category)] = plugin
+
+    def get_manager(self):
+        manager = pluggy.PluginManager(self.project_name)
+        manager.add_hookspecs(self.hookspecs)
+        for plugin in self.plugins:
+            if plugin.name in self.loaded:
+                manager.register(self.loaded[plugin.name], name=plugin.name)
+        for module in self.undeclared:
+            manager.register(module)
+        manager.routed_callers = {}  # (hook name, plugin name) -> subset hook caller
+        return manager
+
+    # for out-of-tree plugins, which are called via pluggy ahead of any route
+    def register(self, module):
+        with self.lock:
+            self.undeclared.append(module)
+            self.manager = self.get_manager()
+
+    # the (route, plugin) declared for this call, from its URL or model, or category
+    def resolve(self, hook_name, kwargs):
+        task = kwargs.get("task") or (kwargs.get("tasks") or [None])[0]
+        if not task:
+            return None
+        key = None
+        if hook_name in URL_HOOKS:
+            key = task.url
+        elif hook_name in LLM_HOOKS:
+            key = task.get_llm()
+        trie = self.tries.get(hook_name)
+        found = trie.resolve(key) if trie and key else None
+        if found:
+            return found
+        plugin = self.categories.get((hook_name, task.category))
+        return ("category %s" % task.category, plugin) if plugin else None
+
+    # the plugins an unrouted call could need: every plugin implementing the hook
+    def get_plugins_for(self, hook_name):
+        declared = [p for p in self.plugins if hook_name in p.hooks]
+        return declared or self.plugins
+
+    def load(self, plugins):
+        if all(p.name in self.loaded for p in plugins):
+            return
+        with self.lock:
+            names = [p.name for p in plugins if p.name not in self.loaded]
+            if not names:
+                return
+            for name in names:
+                log("Loading plugin", name)
+                module = importlib.import_module("missions.plugins.%s" % name)
+                self.loaded[name] = module
+            self.manager = self.get_manager()
+
+    def load_all(self):
+        self.load(self.plugins)
+
+    # a hook caller with just this plugin, plus any hookwrappers and undeclared plugins
+    def get_routed_caller(self, hook_name, plugin):
+        self.load([plugin])
+        manager = self.manager
+        caller = manager.routed_callers.get((hook_name, plugin.name))
+        if caller is None:
+            others = [m for n, m in self.loaded.items() if n != plugin.name]
+            caller = manager.subset_hook_caller(hook_name, remove_plugins=others)
+            manager.routed_callers[(hook_name, plugin.name)] = caller
+        return caller
+
+    def call(self, hook_name, kwargs):
+        found = self.resolve(hook_name, kwargs)
+        if found:
+            (route, plugin) = found
+            self.counts[(hook_name, route)] += 1
+            caller = self.get_routed_caller(hook_name, plugin)
+        else:
+            self.counts[(hook_name, FALLBACK_ROUTE)] += 1
+            self.load(self.get_plugins_for(hook_name))
+            caller = getattr(self.manager.hook, hook_name)
+        return caller(**kwargs)
+
+    # calls per hook and route in this process, busiest first
+    def route_counts(self):
+        return {"%s %s" % key: count for key, count in self.counts.most_common()}
+
+
+# stands in for the plugin manager's hook relay, i.e. pm.hook.chat_llm(...)
+class LazyHookRelay:
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getattr__(self, hook_name):
+        def call(**kwargs):
+            return self.registry.call(hook_name, kwargs)
+
+        return call
@@ -0,0 +1,136 @@
+import hashlib, json, math, re
+from collections import Counter
+from types import SimpleNamespace
+from .blobs import get_blob, put_blob
+from .summaries import ITEM_MARKER
+from .util import *
+
+# BM25 retrieval over a mission's data, so followup questions send the chunks
+# relevant to the question rather than every dataset
+
+RETRIEVAL_TOP_K = 24  # chunks per followup question
+MAX_CHUNK_CHARS = 4000  # longer h4 sections are split on lines
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOKEN_RE = re.compile(r"[a-z0-9_]{2,}")
+STOPWORDS = set(
+    """the and for are but not you all any can had her was one our out has have
+    this that with from they will would there their what which when who how its
+    into than then them these those also been were being more most other some
+    such only own same very just about over after before under again""".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+# (start, end) offsets of a response's h4 sections, long ones split on lines
+def get_chunk_spans(text):
+    starts = [m.start() for m in re.finditer(re.escape(ITEM_MARKER), text)]
+    bounds = [0] + [s for s in starts if s > 0] + [len(text)]
+    spans = []
+    for start, end in zip(bounds, bounds[1:]):
+        while end - start > MAX_CHUNK_CHARS:
+            cut = text.rfind("\n", start + 1, start + MAX_CHUNK_CHARS)
+            cut = cut if cut > start else start + MAX_CHUNK_CHARS
+            spans.append((start, cut))
+            start = cut
+        if text[start:end].strip():
+            spans.append((start, end))
+    return spans
+
+
+def get_retrieval_tasks(mission):
+    return mission.key_context_tasks() + mission.fetch_tasks()
+
+
+# chunks point back into task responses by offset, so the index holds no text
+def build_index(tasks):
+    chunks, lengths, postings = [], [], {}
+    for task in tasks:
+        text = task.response or ""
+        for start, end in get_chunk_spans(text):
+            terms = Counter(tokenize(text[start:end]))
+            idx = len(chunks)
+            chunks.append([task.id, start, end])
+            lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                postings.setdefault(term, []).extend([idx, count])
+    average = sum(lengths) / len(lengths) if lengths else 0
+    return {
+        "chunks": chunks,
+        "lengths": lengths,
+        "average": average,
+        "postings": postings,
+    }
+
+
+# changes whenever a task is added, removed, or rewritten, since offsets would be stale
+def get_index_key(tasks):
+    versions = [
+        "%s:%s:%s" % (t.id, len(t.response or ""), t.edited_at.timestamp())
+        for t in tasks
+    ]
+    return "bm25_%s" % hashlib.sha256(",".join(versions).encode()).hexdigest()
+
+
+# at mission completion, and again whenever the stored index is missing or stale
+def build_mission_index(mission, tasks=None):
+    tasks = get_retrieval_tasks(mission) if tasks is None else tasks
+    index = build_index(tasks)
+    key = get_index_key(tasks)
+    put_blob(key, json.dumps(index, separators=(",", ":")))
+    mission.extras["retrieval_index"] = {"key": key, "chunks": len(index["chunks"])}
+    mission.save()
+    log("Built retrieval index", mission, len(index["chunks"]), "chunks")
+    return index
+
+
+def get_mission_index(mission):
+    tasks = get_retrieval_tasks(mission)
+    key = get_index_key(tasks)
+    if key == mission.extras.get("retrieval_index", {}).get("key"):
+        stored = get_blob(key)
+        if stored:
+            return json.loads(stored)
+    return build_mission_index(mission, tasks)
+
+
+def search(index, query, k=RETRIEVAL_TOP_K):
+    count = len(index["chunks"])
+    scores = Counter()
+    for term in set(tokenize(query)):
+        postings = index["postings"].get(term, [])
+        found = len(postings) // 2
+        if not found:
+            continue
+        idf = math.log(1 + (count - found + 0.5) / (found + 0.5))
+        for i in range(0, len(postings), 2):
+            idx, tf = postings[i], postings[i + 1]
+            norm = 1 - BM25_B + BM25_B * index["lengths"][idx] / index["average"]
+            scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+    return scores.most_common(k)
+
+
+# the most relevant chunks, grouped by task in mission order, as name/response
+# pairs like the tasks they came from; empty if nothing matches
+def get_question_inputs(task, k=RETRIEVAL_TOP_K):
+    if task.flags.get("retrieval") == "false":
+        return []
+    question = task.extras.get("followup_question") or task.prompt or ""
+    index = get_mission_index(task.mission)
+    hits = sorted([idx for idx, score in search(index, question, k)])
+    if not hits:
+        return []
+    chunks = [index["chunks"][idx] for idx in hits]
+    tasks = task.mission.task_set.filter(id__in=set([c[0] for c in chunks]))
+    responses = {t.id: (t.name, t.response or "") for t in tasks}
+    inputs = {}
+    for task_id, start, end in chunks:
+        if task_id in responses:
+            (name, response) = responses[task_id]
+            inputs.setdefault(task_id, SimpleNamespace(name=name, response=""))
+            inputs[task_id].response += response[start:end]
+    log("Retrieved", len(chunks), "chunks from", len(inputs), "tasks for", task)
+    return list(inputs.values())
@@ -3,76 +3,90 @@ from django_rq import job  # type:ignore
 from django.conf import settings
 from missions.apps import get_plugin_manager
 from .models import TaskStatus, TaskCategory, Task, Mission
+from .queries import audit_task
+from .snapshots import fetch_with_snapshot
 from .admin_jobs import *
+from .summaries import is_map_reduce, summarize_to_fit
+from .tracing import trace_task
 from .util import *
 
 MAX_RERUNS = 3
+AGGREGATE_CHUNK_SIZE = 200  # rows per fetch when streaming reports to aggregate
 
 
 @job("default", timeout=3000)
 def run(task):
-    start = int(time.time())
-    try:
-        match task.category:
-            # collect-data tasks
-            case TaskCategory.SCRAPE:
-                run_scrape(task)
-            case TaskCategory.API:
-                run_api(task)
-            case TaskCategory.FILTER:
-                run_filter(task)
-            # Simple / one-off LLM-based tasks
-            case TaskCategory.LLM_REPORT:  # report on a single chain of data sources
-                run_llm_report(task)
-            case TaskCategory.LLM_RATING:  # rate an entity such as a pull request
-                run_llm_rating(task)
-            case TaskCategory.LLM_DECISION:  # ask LLM what data to fetch
-                run_llm_decision(task)
-            case TaskCategory.FETCH_FOR_LLM:  # fetch data for LLM analysis
-                run_fetch_for_llm(task)
-            # Aggregate tasks across multiple missions
-            case TaskCategory.AGGREGATE_REPORTS:
-                aggregate_reports(task)
-            # Recursive LLM-based agent tasks
-            case TaskCategory.AGENT_TASK:
-                run_agent(task)
-            # Programmatic quantified reports
-            case TaskCategory.QUANTIFIED_REPORT:
-                run_quantified_report(task)
-            # Post-report tasks
-            case TaskCategory.POST_MISSION:  # run a task after the main report
-                run_post_mission(task)
-            case TaskCategory.LLM_QUESTION:  # followup question from a user
-                run_llm_question(task)
-            case TaskCategory.LLM_EVALUATION:  # evaluate a previous LLM response
-                run_llm_evaluation(task)
-            case TaskCategory.FINALIZE_MISSION:  # final report for a mission
-                run_final_report(task)
-            # Other tasks: currently, data tasks populated by a call to our API
-            case TaskCategory.OTHER:
-                run_other(task)
-            case _:
-                raise Exception("Task category not yet implemented", task)
-    except Exception as ex:
-        log("Task error at %s seconds" % int(time.time() - start))
-        traceback.print_exc()
-        task.status = TaskStatus.FAILED
-        task.add_error(ex)
-
-    # mark empty tasks as empty unless already marked complete or failed
-    if not task.response and not task.structured_data:
-        if task.status not in [TaskStatus.FAILED, TaskStatus.COMPLETE]:
-            task.status = TaskStatus.EMPTY
-
-    log("Task complete", task, "%s seconds" % int(time.time() - start))
-    task.extras["time_taken"] = f"{int(time.time())} elapsed {int(time.time()) - start}"
-    # mark as complete if not marked as failed or empty
-    task.mark_complete() if task.status == TaskStatus.IN_PROCESS else task.save()
+    with trace_task(task), audit_task(task) as audit:
+        start = int(time.time())
+        try:
+            match task.category:
+                # collect-data tasks
+                case TaskCategory.SCRAPE:
+                    run_scrape(task)
+                case TaskCategory.API:
+                    run_api(task)
+                case TaskCategory.FILTER:
+                    run_filter(task)
+                # Simple / one-off LLM-based tasks
+                case TaskCategory.LLM_REPORT:  # report on a single chain of data sources
+                    run_llm_report(task)
+                case TaskCategory.LLM_RATING:  # rate an entity such as a pull request
+                    run_llm_rating(task)
+                case TaskCategory.LLM_DECISION:  # ask LLM what data to fetch
+                    run_llm_decision(task)
+                case TaskCategory.FETCH_FOR_LLM:  # fetch data for LLM analysis
+                    run_fetch_for_llm(task)
+                # Aggregate tasks across multiple missions
+                case TaskCategory.AGGREGATE_REPORTS:
+                    aggregate_reports(task)
+                # Recursive LLM-based agent tasks
+                case TaskCategory.AGENT_TASK:
+                    run_agent(task)
+                # Programmatic quantified reports
+                case TaskCategory.QUANTIFIED_REPORT:
+                    run_quantified_report(task)
+                # Post-report tasks
+                case TaskCategory.POST_MISSION:  # run a task after the main report
+                    run_post_mission(task)
+                case TaskCategory.LLM_QUESTION:  # followup question from a user
+                    run_llm_question(task)
+                case TaskCategory.LLM_EVALUATION:  # evaluate a previous LLM response
+                    run_llm_evaluation(task)
+                case TaskCategory.FINALIZE_MISSION:  # final report for a mission
+                    run_final_report(task)
+                # Other tasks: currently, data tasks populated by a call to our API
+                case TaskCategory.OTHER:
+                    run_other(task)
+                case _:
+                    raise Exception("Task category not yet implemented", task)
+        except Exception as ex:
+            log("Task error at %s seconds" % int(time.time() - start))
+            traceback.print_exc()
+            task.status = TaskStatus.FAILED
+            task.add_error(ex)
+
+        # mark empty tasks as empty unless already marked complete or failed, or waiting
+        if not task.response and not task.structured_data:
+            if task.status not in [
+                TaskStatus.FAILED,
+                TaskStatus.COMPLETE,
+                TaskStatus.WAITING,
+            ]:
+                task.status = TaskStatus.EMPTY
+
+        log("Task complete", task, "%s seconds" % int(time.time() - start))
+        task.extras[
+            "time_taken"
+        ] = f"{int(time.time())} elapsed {int(time.time()) - start}"
+        if audit:
+            task.extras["queries"] = audit.summary()
+        # mark as complete if not marked as failed or empty
+        task.mark_complete() if task.status == TaskStatus.IN_PROCESS else task.save()
 
 
 def run_scrape(task):
     pm = get_plugin_manager()
-    completion = pm.hook.run_scrape(task=task)
+    completion = fetch_with_snapshot(task, lambda: pm.hook.run_scrape(task=task))
     if not completion:
         raise Exception("No implementation for scrape task available: %s" % task)
 
@@ -82,14 +96,17 @@ def run_api(task):
         task.response = "Test API response to %s" % task.name
         return
     pm = get_plugin_manager()
-    completion = pm.hook.run_api(task=task)
+    completion = fetch_with_snapshot(task, lambda: pm.hook.run_api(task=task))
     if not completion:
         raise Exception("No implementation for API task is available: %s" % task)
 
 
 # Actually run an LLM report based on data from previous task(s)
 def run_llm_report(task):
-    input_data = task.assemble_prerequisite_inputs()
+    map_reduce = is_map_reduce(task)
+    input_data = task.assemble_prerequisite_inputs(truncate=not map_reduce)
+    if map_reduce:
+        input_data = summarize_to_fit(task, input_data)
 
     if task.is_vision():
         show_llm(task, input_data)
@@ -110,9 +127,28 @@ def run_llm_report(task):
             % task.created_at.strftime("%Y-%m-%d")
         )
 
+    if is_batch_mode(task) and queue_for_batch(task, input_data):
+        return
     task.response = chat_llm(task, input_data)
 
 
+# cadence missions can trade latency for cost via provider batch APIs
+def is_batch_mode(task):
+    return task.mission.flags.get("batch_llm") == "true" and not task.is_test()
+
+
+# park the task until the mission's batch is submitted and its results land
+def queue_for_batch(task, input):
+    pm = get_plugin_manager()
+    request = pm.hook.batch_llm_request(task=task, input=input)
+    if not request:
+        log("No batch API for", task.get_llm(), "so chatting now")
+        return False
+    task.extras["batch_request"] = request
+    task.status = TaskStatus.WAITING
+    return True
+
+
 # Chat with an LLM using the appropriate provided plugin if any
 def chat_llm(task, input, tool_key=""):
     if not task.prompt:
@@ -215,15 +251,15 @@ def aggregate_reports(task):
     # for each of those missions, get the corresponding tasks and aggregate their responses
     log("aggregating tasks since", task.cadence_days())
     missions = get_customer_missions_since(task).exclude(id=task.mission_id)
-    mission_ids = [m.id for m in missions]
+    missions = list(missions.values_list("id", "previous_id"))
+    mission_ids = [id for (id, previous_id) in missions]
     log("initial mission_ids to aggregate", mission_ids)
     tasks = Task.objects.filter(mission_id__in=mission_ids).filter(
         status=TaskStatus.COMPLETE
     )
-    log("initial tasks to aggregate", tasks)
 
     # exclude any mission marked as previous to a more recent mission - we only want the latest
-    previous_ids = [m.previous_id for m in missions if m.previous_id]
+    previous_ids = [previous_id for (id, previous_id) in missions if previous_id]
     log("missions marked as previous", previous_ids)
     tasks = tasks.exclude(mission_id__in=previous_ids)
 
@@ -240,28 +276,35 @@ def aggregate_reports(task):
 
         # otherwise default to aggregating LLM reports
         tasks = tasks.filter(category=TaskCategory.LLM_REPORT)
-        log("potential reports to aggregate", tasks)
         if url_key:
             # note task parents must have correct URL suffix to be aggregated in turn
             tasks = tasks.filter(parent__url__endswith=url_key)
 
     tasks = tasks.exclude(parent__category=TaskCategory.AGGREGATE_REPORTS)
     tasks = tasks.order_by("mission_id", "created_at")
-    log("aggregate tasks", tasks)
 
-    # concatenate the responses
-    r = ""
+    # concatenate the responses, streaming just the columns we need
+    reports = tasks.select_related("mission").only(
+        "id", "name", "response", "mission_id", "mission__name"
+    )
+    parts = []
     mission_id = None
-    for t in tasks:
+    for t in reports.iterator(chunk_size=AGGREGATE_CHUNK_SIZE):
         if t.mission_id != mission_id:
             mission_id = t.mission_id
-            r += f"\n---\n## {t.mission.name}\n\n"
-        r += f"### {t.name}\n\n"
-        r += t.response or ""
-    task.response = r
+            parts.append(f"\n---\n## {t.mission.name}\n\n")
+        parts.append(f"### {t.name}\n\n")
+        parts.append(t.response or "")
+    task.response = "".join(parts)
+    if is_map_reduce(task):
+        task.response = summarize_to_fit(task, task.response)
 
     if task.url and task.url.endswith("commits"):
-        all_devs = concatenate_dev_data(tasks)
+        from .devs import CommitStore  # deferred, it imports numpy
+
+        fields = ["parent_id", "structured_data", "url", "depends_on_urls"]
+        dev_tasks = tasks.only("id", "mission_id", "category", *fields)
+        all_devs = CommitStore.from_tasks(dev_tasks.iterator()).to_devs()
         task.structured_data["devs"] = all_devs
         task.save()
 
@@ -403,6 +446,8 @@ def run_final_report(task):
         input_tasks = task.aggregate_dependencies()
     inputs = [t.response or "" for t in input_tasks]
     prompt = "\n\n---\n".join(inputs)
+    if is_map_reduce(task):
+        prompt = summarize_to_fit(task, prompt)
     task.response = chat_llm(task, prompt)
 
     # don't overwrite in edge case of rerunning when many final tasks
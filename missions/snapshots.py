@@ -0,0 +1,157 @@
+import datetime, hashlib, json, secrets, time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from django.core.cache import cache
+from .models import TaskStatus
+from .util import *
+
+# Fetch results shared across missions: API and scrape tasks for the same source,
+# parameters, and window reuse a fresh snapshot instead of fetching again, and
+# concurrent fetches of the same thing wait for the first instead of duplicating it
+
+SNAPSHOT_SECONDS = 60 * 60  # how long a fetch stays fresh by default
+CLOSED_WINDOW_SECONDS = 60 * 60 * 24 * 7  # windows in the past don't change
+SNAPSHOT_KEY = "snapshot_%s"
+SNAPSHOT_LOCK_KEY = "snapshot_lock_%s"
+LOCK_SECONDS = 60 * 20  # longest we expect a single fetch to take
+WAIT_SECONDS = 60 * 10  # longest to wait on someone else's fetch
+POLL_SECONDS = 2
+
+
+def normalize_url(url):
+    parts = urlsplit((url or "").strip())
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+# customers never share snapshots, since their integrations see different data,
+# nor do time series with different previous tasks, since incremental fetches
+# (Slack since latest_ts, Linear since the previous run) start from those
+def get_snapshot_key(task):
+    customer = task.get_customer()
+    previous = task.previous() if task.mission.previous_id else None
+    params = {
+        "url": normalize_url(task.url),
+        "category": task.category,
+        "flags": task.flags,
+        "days": task.commit_days(),
+        "customer": customer.id if customer else None,
+        "previous": previous.id if previous else None,
+    }
+    params = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+def get_freshness(task):
+    if task.flags.get("snapshot_seconds"):
+        return int(task.flags["snapshot_seconds"])
+    if task.is_fixed_window():
+        end = task.window_end()
+        now = datetime.datetime.now(end.tzinfo)
+        if end < now:
+            return CLOSED_WINDOW_SECONDS
+    return SNAPSHOT_SECONDS
+
+
+def uses_snapshots(task):
+    return bool(task.url) and task.flags.get("snapshot") != "false"
+
+
+def get_snapshot(key):
+    try:
+        return cache.get(SNAPSHOT_KEY % key)
+    except Exception as ex:
+        log("Error reading snapshot", ex)
+        return None
+
+
+def save_snapshot(key, task):
+    if task.status == TaskStatus.FAILED or not (task.response or task.structured_data):
+        return
+    snapshot = {
+        "response": task.response,
+        "structured_data": task.structured_data,
+        "task_id": task.id,
+        "fetched_at": int(time.time()),
+    }
+    try:
+        cache.set(SNAPSHOT_KEY % key, snapshot, get_freshness(task))
+    except Exception as ex:
+        log("Error saving snapshot", ex)
+
+
+def apply_snapshot(task, key, snapshot):
+    log("Reusing snapshot from task", snapshot["task_id"], "for", task)
+    task.response = snapshot["response"]
+    task.structured_data = snapshot["structured_data"]
+    task.extras["snapshot"] = {
+        "key": key,
+        "task_id": snapshot["task_id"],
+        "fetched_at": snapshot["fetched_at"],
+    }
+    task.save()
+    return task
+
+
+def acquire_lock(key):
+    import django_rq  # type: ignore
+
+    token = secrets.token_hex(8)
+    redis = django_rq.get_connection("default")
+    if redis.set(SNAPSHOT_LOCK_KEY % key, token, nx=True, ex=LOCK_SECONDS):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    import django_rq  # type: ignore
+
+    redis = django_rq.get_connection("default")
+    lock = SNAPSHOT_LOCK_KEY % key
+    if (redis.get(lock) or b"").decode() == token:
+        redis.delete(lock)
+
+
+def is_locked(key):
+    import django_rq  # type: ignore
+
+    return django_rq.get_connection("default").exists(SNAPSHOT_LOCK_KEY % key)
+
+
+# fetch via the given function unless a fresh snapshot exists or another worker is
+# fetching the same thing already, in which case wait for theirs
+def fetch_with_snapshot(task, fetch):
+    if not uses_snapshots(task):
+        return fetch()
+    key = get_snapshot_key(task)
+    snapshot = get_snapshot(key)
+    if snapshot:
+        return apply_snapshot(task, key, snapshot)
+
+    token = None
+    waited = 0
+    while waited < WAIT_SECONDS:
+        try:
+            token = acquire_lock(key)
+            if token or not is_locked(key):
+                break
+        except Exception as ex:
+            log("Error locking snapshot, fetching anyway", ex)
+            break
+        time.sleep(POLL_SECONDS)
+        waited += POLL_SECONDS
+        snapshot = get_snapshot(key)
+        if snapshot:
+            return apply_snapshot(task, key, snapshot)
+
+    try:
+        completion = fetch()
+        if completion:
+            save_snapshot(key, task)
+        return completion
+    finally:
+        if token:
+            try:
+                release_lock(key, token)
+            except Exception as ex:
+                log("Error releasing snapshot lock", ex)
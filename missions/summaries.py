@@ -0,0 +1,148 @@
+import copy, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from missions.apps import get_plugin_manager
+from .models import Task
+from .util import *
+
+ITEM_MARKER = "<!--DAI4-->"
+SECTION_DIVIDER = "\n---\n"
+SUMMARY_LLM = GPT_4O_MINI  # cheaper model for the map step, override with summary_llm
+SUMMARY_CHUNK_TOKENS = 12000  # input per chunk summary
+SUMMARY_MAX_WORKERS = 4
+MAX_SUMMARY_LEVELS = 3  # reduce passes before falling back to truncation
+SUMMARY_CACHE_SECONDS = 60 * 60 * 24 * 14
+SUMMARY_PROMPT = """Summarize the following excerpt of a larger dataset for someone who will write a report from many such summaries.
+Keep names, numbers, dates, links, and anything unusual or concerning. Omit boilerplate.
+Reply with the summary only."""
+
+
+def is_map_reduce(task):
+    return (
+        task.flags.get("map_reduce") == "true"
+        or task.mission.flags.get("map_reduce") == "true"
+    )
+
+
+# opt-in alternative to truncation: summarize chunks concurrently, then summaries of those
+def summarize_to_fit(task, text):
+    llm = task.get_llm()
+    limit = get_token_limit_for(llm)
+    stats = {"levels": 0, "chunks": 0, "cached": 0}
+    while is_too_long(text, llm) and stats["levels"] < MAX_SUMMARY_LEVELS:
+        pieces = split_items(text) if stats["levels"] == 0 else split_sections(text)
+        chunks = get_chunks(task, pieces)
+        summaries = summarize_chunks(task, chunks, stats)
+        text = SECTION_DIVIDER.join(summaries)
+        stats["levels"] += 1
+        stats["chunks"] += len(chunks)
+        log("Map-reduce level", stats["levels"], "chunks", len(chunks), "limit", limit)
+    task.extras["map_reduce"] = stats
+    return text
+
+
+# individual items, or the datasets/reports themselves if there are no item markers
+def split_items(text):
+    pieces = text.split(ITEM_MARKER)
+    return pieces if len(pieces) > 1 else split_sections(text)
+
+
+def split_sections(text):
+    return [p for p in text.split(SECTION_DIVIDER) if p.strip()]
+
+
+# greedily pack consecutive pieces into chunks that fit the summary model
+def get_chunks(task, pieces):
+    llm = get_summary_llm(task)
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece, tokens in zip(pieces, count_many(pieces, llm)):
+        if current and current_tokens + tokens > SUMMARY_CHUNK_TOKENS:
+            chunks.append(ITEM_MARKER.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(ITEM_MARKER.join(current))
+    return chunks
+
+
+def summarize_chunks(task, chunks, stats):
+    summary_task = get_summary_task(task)
+    test = task.is_test()
+    summaries = [None] * len(chunks)
+    todo = []
+    for idx, chunk in enumerate(chunks):
+        summaries[idx] = get_cached_summary(summary_task, chunk)
+        if summaries[idx] is None:
+            todo.append(idx)
+    stats["cached"] += len(chunks) - len(todo)
+    with ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS) as executor:
+        done = executor.map(lambda i: summarize(summary_task, chunks[i], test), todo)
+        for idx, summary in zip(todo, done):
+            summaries[idx] = summary
+            cache_summary(summary_task, chunks[idx], summary)
+    return summaries
+
+
+def summarize(summary_task, chunk, test=False):
+    if test:
+        return "Test TDTest summary of %s characters" % len(chunk)
+    task = copy_task(summary_task)  # one per thread, since plugins write to the task
+    task.extras = {}
+    pm = get_plugin_manager()
+    completion = pm.hook.chat_llm(task=task, input=chunk, tool_key="")
+    if not completion:
+        raise Exception("No implementation for LLM chat available: %s" % task)
+    return completion
+
+
+def get_summary_llm(task):
+    return task.flags.get(
+        "summary_llm", task.mission.flags.get("summary_llm", SUMMARY_LLM)
+    )
+
+
+# a separate copy of a task, mutable fields and all, that's never saved, since
+# the chat plugins write to the task they're given and save it
+def copy_task(task):
+    values = {
+        f.attname: copy.deepcopy(getattr(task, f.attname))
+        for f in Task._meta.concrete_fields
+        if not f.primary_key
+    }
+    unsaved = Task(**values)
+    unsaved.mission = task.mission  # cached, so no query
+    unsaved.save = lambda *args, **kwargs: None
+    return unsaved
+
+
+def get_summary_task(task):
+    summary_task = copy_task(task)
+    summary_task.llm = get_summary_llm(task)
+    summary_task.prompt = SUMMARY_PROMPT
+    summary_task.flags = summary_task.flags | {"time_series": "false"}
+    summary_task.extras = {}
+    return summary_task
+
+
+def get_summary_key(summary_task, chunk):
+    content = "%s\n%s\n%s" % (summary_task.llm, summary_task.prompt, chunk)
+    return "summary_%s" % hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_cached_summary(summary_task, chunk):
+    try:
+        return cache.get(get_summary_key(summary_task, chunk))
+    except Exception:
+        log("Error reading cached summary")
+        return None
+
+
+def cache_summary(summary_task, chunk, summary):
+    try:
+        cache.set(get_summary_key(summary_task, chunk), summary, SUMMARY_CACHE_SECONDS)
+    except Exception:
+        log("Error caching summary")
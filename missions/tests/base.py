@@ -0,0 +1,17 @@
+import tempfile
+from unittest import mock
+from django.test import TestCase
+
+from .. import blobs
+
+
+# tests that fetch or finalize missions store blobs, so each test gets its own
+# blob directory, removed afterwards, rather than the shared one in /tmp
+class BlobDirTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(blobs, "BLOB_DIR", directory.name)
+        patch.start()
+        self.addCleanup(patch.stop)
@@ -0,0 +1,174 @@
+import json, os, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from ..models import *
+from ..hub import continue_mission, poll_batches
+from .base import BlobDirTestCase
+
+
+# just enough of the OpenAI and Anthropic batch APIs to run batches locally
+class StubBatchHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, body, content_type="application/json", status=200):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        if self.path in self.server.failing:
+            error = {"type": "error", "error": {"message": "Batch rejected"}}
+            self.respond(error, status=400)
+        elif self.path == "/v1/files":
+            lines = [l for l in body.splitlines() if l.startswith('{"custom_id"')]
+            self.server.requests = [json.loads(l) for l in lines]
+            self.respond({"id": "file-in", "object": "file", "purpose": "batch"})
+        elif self.path == "/v1/batches":
+            self.server.batch = json.loads(body)
+            self.respond({"id": "batch-1", "status": "validating"})
+        elif self.path == "/v1/messages/batches":
+            self.server.requests = json.loads(body)["requests"]
+            self.respond({"id": "msgbatch-1", "processing_status": "in_progress"})
+
+    def do_GET(self):
+        if self.path == "/v1/batches/batch-1":
+            if not self.server.ready:
+                return self.respond({"id": "batch-1", "status": "in_progress"})
+            done = {"status": "completed", "output_file_id": "file-out"}
+            self.respond({"id": "batch-1"} | done)
+        elif self.path == "/v1/files/file-out/content":
+            lines = []
+            for request in self.server.requests:
+                content = "Batch response to %s" % request["body"]["model"]
+                body = {"choices": [{"message": {"content": content}}], "usage": {}}
+                response = {"status_code": 200, "body": body}
+                lines.append({"custom_id": request["custom_id"], "response": response})
+            self.respond("\n".join(json.dumps(l) for l in lines).encode(), "text/plain")
+        elif self.path == "/v1/messages/batches/msgbatch-1":
+            status = "ended" if self.server.ready else "in_progress"
+            results = "http://127.0.0.1:%s%s/results" % (
+                self.server.server_port,
+                self.path,
+            )
+            batch = {"id": "msgbatch-1", "processing_status": status}
+            self.respond(batch | {"results_url": results})
+        elif self.path == "/v1/messages/batches/msgbatch-1/results":
+            lines = []
+            for request in self.server.requests:
+                text = "Batch response to %s" % request["params"]["model"]
+                message = {"content": [{"type": "text", "text": text}], "usage": {}}
+                result = {"type": "succeeded", "message": message}
+                lines.append({"custom_id": request["custom_id"], "result": result})
+            self.respond("\n".join(json.dumps(l) for l in lines).encode(), "text/plain")
+
+
+class BatchTests(BlobDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBatchHandler)
+        self.server.ready = False
+        self.server.failing = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:%s" % self.server.server_port
+        env = {
+            "OPENAI_BASE_URL": base_url + "/v1",
+            "OPENAI_API_KEY": "test",
+            "ANTHROPIC_BASE_URL": base_url,
+            "ANTHROPIC_API_KEY": "test",
+        }
+        self.env = mock.patch.dict(os.environ, env)
+        self.env.start()
+        patch = mock.patch("missions.hub.PACING_SECONDS", 0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_batch_mission(self, llms):
+        mission_info = MissionInfo.objects.create(
+            name="Batch mission info",
+            base_llm=llms[0],
+            flags={"batch_llm": "true", "no_new_final": "true"},
+        )
+        mission = mission_info.create_mission()
+        fetch = Task.objects.create(
+            mission=mission,
+            name="Fetch",
+            category=TaskCategory.OTHER,
+            status=TaskStatus.COMPLETE,
+            response="Fetched data",
+        )
+        for llm in llms:
+            Task.objects.create(
+                mission=mission,
+                name="Report by %s" % llm,
+                parent=fetch,
+                llm=llm,
+                category=TaskCategory.LLM_REPORT,
+                prompt="Report on this data",
+            )
+        return mission
+
+    # from running the mission's report tasks to resuming it with the results
+    def run_batch_mission(self, llm, batch_id):
+        mission = self.create_batch_mission([llm])
+        continue_mission(mission)
+        mission.refresh_from_db()
+        report = mission.task_set.get(category=TaskCategory.LLM_REPORT)
+        self.assertEqual(mission.status, Mission.MissionStatus.WAITING)
+        self.assertEqual(mission.extras["batches"], [batch_id])
+        self.assertEqual(report.status, TaskStatus.WAITING)
+        self.assertEqual(report.extras["batch_id"], batch_id)
+        self.assertTrue("batch_request" not in report.extras)
+        self.assertEqual(self.server.requests[0]["custom_id"], "%s" % report.id)
+        self.assertTrue("Fetched data" in json.dumps(self.server.requests[0]))
+
+        poll_batches()  # still in progress
+        report.refresh_from_db()
+        self.assertEqual(report.status, TaskStatus.WAITING)
+
+        self.server.ready = True
+        poll_batches()
+        report.refresh_from_db()
+        mission.refresh_from_db()
+        self.assertEqual(report.status, TaskStatus.COMPLETE)
+        self.assertEqual(report.response, "Batch response to %s" % llm)
+        self.assertEqual(mission.status, Mission.MissionStatus.COMPLETE)
+
+    def test_openai_batch_mission(self):
+        self.run_batch_mission(GPT_4O_MINI, "batch-1")
+        self.assertEqual(self.server.batch["input_file_id"], "file-in")
+
+    def test_anthropic_batch_mission(self):
+        self.run_batch_mission(CLAUDE_HAIKU, "msgbatch-1")
+        self.assertEqual(self.server.requests[0]["params"]["model"], CLAUDE_HAIKU)
+
+    def test_failed_submission(self):
+        self.server.failing = ["/v1/messages/batches"]
+        mission = self.create_batch_mission([GPT_4O_MINI, CLAUDE_HAIKU])
+        continue_mission(mission)
+        mission.refresh_from_db()
+        openai = mission.task_set.get(llm=GPT_4O_MINI)
+        claude = mission.task_set.get(llm=CLAUDE_HAIKU)
+        self.assertEqual(mission.status, Mission.MissionStatus.WAITING)
+        self.assertEqual(mission.extras["batches"], ["batch-1"])
+        self.assertEqual(openai.status, TaskStatus.WAITING)
+        self.assertEqual(claude.status, TaskStatus.FAILED)
+        self.assertTrue("batch_request" not in claude.extras)
+        self.assertTrue("Batch rejected" in json.dumps(claude.extras["errors"]))
+
+        self.server.ready = True
+        poll_batches()
+        openai.refresh_from_db()
+        mission.refresh_from_db()
+        self.assertEqual(openai.status, TaskStatus.COMPLETE)
+        self.assertNotEqual(mission.status, Mission.MissionStatus.WAITING)
@@ -0,0 +1,41 @@
+import json, os
+
+from ..bench import *
+from ..models import *
+from ..plugins.bench import get_bench_items
+from .base import BlobDirTestCase
+
+# BENCH_SIZES=10,1000,10000 to run the full suite, as the benchmark command does
+SIZES = [int(s) for s in os.getenv("BENCH_SIZES", "10").split(",")]
+
+
+class BenchmarkTests(BlobDirTestCase):
+    def test_synthetic_items(self):
+        items = get_bench_items("commits", 25)
+        self.assertEqual(len(items), 25)
+        self.assertEqual(items[0]["sha"], get_bench_items("commits", 25)[0]["sha"])
+        self.assertTrue("sha" not in get_bench_items("pulls", 1)[0])
+
+    def test_benchmark(self):
+        results = run_benchmarks(SIZES)
+        for result in results["results"]:
+            self.assertEqual(result["status"], "Complete")
+            self.assertEqual(result["tasks"], 7)  # 3 fetches, 3 reports, 1 final
+            self.assertTrue(result["queries"] > 0)
+            self.assertTrue(result["input_tokens"] > 0)
+            phases = result["phases"]
+            self.assertEqual(phases["API"]["tasks"], 3)
+            self.assertEqual(phases["LLM Report"]["tasks"], 3)
+            self.assertTrue(phases["LLM Report"]["output_tokens"] > 0)
+            self.assertTrue(phases["Finalize Mission"]["input_tokens"] > 0)
+
+        self.assertFalse(
+            [r for r in compare_benchmarks(results, results) if r["regression"]]
+        )
+        baseline = json.loads(json.dumps(results))
+        baseline["results"][0]["queries"] = results["results"][0]["queries"] // 2
+        baseline["results"][0]["wall_seconds"] = 0  # within the noise
+        regressions = [
+            r for r in compare_benchmarks(results, baseline) if r["regression"]
+        ]
+        self.assertEqual([r["metric"] for r in regressions], ["queries"])
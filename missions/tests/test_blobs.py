@@ -0,0 +1,42 @@
+import os, time
+from unittest import mock
+
+from .. import blobs
+from ..blobs import *
+from .base import BlobDirTestCase
+
+
+class BlobStoreTests(BlobDirTestCase):
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.object(blobs, "BLOB_STORE", "disk")
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_disk_store(self):
+        sha = "a" * 40
+        self.assertEqual(get_blob(sha), None)
+        put_blob(sha, "print('hello')\n" * 1000)
+        self.assertEqual(get_blob(sha), "print('hello')\n" * 1000)
+        self.assertTrue(os.path.getsize(get_blob_path(sha)) < 1000)  # compressed
+        put_blob("diff_b_c", "a diff")  # not a SHA, so hashed for its file name
+        self.assertEqual(
+            get_blobs([sha, "diff_b_c", "b" * 40, None]).keys(), {sha, "diff_b_c"}
+        )
+
+        with mock.patch.object(blobs, "BLOB_STORE", "off"):
+            self.assertEqual(get_blob(sha), None)
+
+    def test_eviction(self):
+        keys = ["%040x" % i for i in range(10)]
+        for idx, key in enumerate(keys):
+            put_blob(key, os.urandom(500).hex())  # incompressible enough
+            then = time.time() - 100 + idx
+            os.utime(get_blob_path(key), (then, then))
+        get_blob(keys[0])  # recently used, so kept
+        total = sum([os.path.getsize(get_blob_path(k)) for k in keys])
+        self.assertEqual(evict_disk_blobs(total), 0)
+        self.assertTrue(evict_disk_blobs(total // 2) >= 5)
+        self.assertNotEqual(get_blob(keys[0]), None)
+        self.assertEqual(get_blob(keys[1]), None)
+        self.assertNotEqual(get_blob(keys[9]), None)
@@ -7,10 +7,12 @@ from ..models import *
 from ..hub import fulfil_mission
 from ..util import TEST_MODEL, email_ops
 from web.views import get_customer, allow_access, accessible_mission
+from .base import BlobDirTestCase
 
 
-class DependencyFlowTest(TestCase):
+class DependencyFlowTest(BlobDirTestCase):
     def setUp(self):
+        super().setUp()
         customer = Customer.objects.create(
             name="TDTest customer",
             email_suffix="example.com",
@@ -1,16 +1,25 @@
 from datetime import timedelta
+from unittest import mock
 from django.utils import timezone
 from django.test import TestCase
 from django.test.client import RequestFactory
 
 from ..models import *
 from ..hub import fulfil_mission, run_task
-from ..util import TEST_MODEL
+from ..util import *
+from ..registry import PluginRegistry
+from .. import hookspecs, plugins
+from ..plugins.agent import get_dataset_catalog, get_previous_catalog
+from ..plugins.anthropic import get_claude_content
+from ..plugins.openai import get_openai_prompt
+from ..retrieval import build_mission_index, get_chunk_spans, get_question_inputs
 from web.views import create_task
+from .base import BlobDirTestCase
 
 
-class SimpleMissionTest(TestCase):
+class SimpleMissionTest(BlobDirTestCase):
     def setUp(self):
+        super().setUp()
         mission_info = MissionInfo.objects.create(
             name="TDTest mission info",
             base_llm=TEST_MODEL,
@@ -45,8 +54,9 @@ class SimpleMissionTest(TestCase):
 
 
 # just check variants work
-class MissionTests(TestCase):
+class MissionTests(BlobDirTestCase):
     def setUp(self):
+        super().setUp()
         self.mission_info = MissionInfo.objects.create(
             name="TDTest mission info",
             base_llm=TEST_MODEL,
@@ -108,6 +118,73 @@ class MissionTests(TestCase):
         self.assertTrue(previous[1] == t5)
         self.assertTrue(previous[2] == t6)
 
+    def test_cacheable_key_context(self):
+        mission = self.mission_info.create_mission()
+        t1 = Task.objects.create(
+            mission=mission,
+            name="Fetch",
+            category=TaskCategory.API,
+            response="Test fetch response",
+        )
+        Task.objects.create(
+            mission=mission,
+            name="Context",
+            category=TaskCategory.LLM_REPORT,
+            reporting=Reporting.KEY_CONTEXT,
+            response="Test key context",
+        )
+        t3 = Task.objects.create(
+            mission=mission,
+            parent=t1,
+            category=TaskCategory.LLM_REPORT,
+        )
+        input_data = t3.assemble_prerequisite_inputs(truncate=False)
+        (context, data) = split_cacheable(input_data)
+        self.assertTrue("Test key context" in context)
+        self.assertTrue("Test fetch response" in data)
+        self.assertTrue("Test fetch response" not in context)
+        content = get_claude_content("Test prompt", input_data)
+        self.assertEqual(len(content), 3)
+        self.assertTrue("Test key context" in content[0]["text"])
+        self.assertTrue("cache_control" in content[0])
+        self.assertTrue("Test prompt" in content[1]["text"])
+        self.assertTrue("cache_control" not in content[1])
+        self.assertTrue("cache_control" not in content[2])
+
+        final_prompt = get_openai_prompt(t3, input_data)
+        self.assertTrue(CACHE_BREAK not in final_prompt)
+        self.assertTrue(
+            final_prompt.index("Test key context") < final_prompt.index("Instructions")
+        )
+
+        # providers that don't split on the marker never see it
+        self.assertTrue(CACHE_BREAK not in get_sized_prompt(t3, input_data))
+        sized = get_sized_prompt(t3, input_data, cacheable=True)
+        self.assertTrue(CACHE_BREAK in sized)
+
+    def test_dataset_catalog(self):
+        m1 = self.mission_info.create_mission()
+        m2 = self.mission_info.create_mission()
+        m2.previous = m1
+        m2.save()
+        for mission in [m1, m2]:
+            for category in [TaskCategory.API, TaskCategory.LLM_REPORT]:
+                Task.objects.create(
+                    mission=mission,
+                    name="Dataset %s" % mission.id,
+                    category=category,
+                    status=TaskStatus.COMPLETE,
+                    response="x" * 100000,
+                )
+        categories = [TaskCategory.API, TaskCategory.SCRAPE]
+        with self.assertNumQueries(1):
+            catalog = get_dataset_catalog(m2.id, categories)
+        self.assertEqual([t.name for t in catalog], ["Dataset %s" % m2.id])
+        self.assertFalse(hasattr(catalog[0], "response"))
+        previous = get_previous_catalog(m2, categories, 10)
+        self.assertEqual([t.name for t in previous], ["Dataset %s" % m1.id])
+        self.assertEqual(get_previous_catalog(m2, categories, 0), [])
+
     def test_recurring_mission(self):
         self.mission_info.cadence = MissionInfo.Cadence.WEEKLY
         self.mission_info.save()
@@ -278,11 +355,100 @@ class MissionTests(TestCase):
         self.assertTrue(len(f.prerequisite_tasks()) == 3)
         run_task(f.id)
         f.refresh_from_db()
-        self.assertTrue(f.extras.get("final_prompt_length", 0) > 150)
-        self.assertTrue(f.response == "Test Gemini response")
+        self.assertTrue(f.extras.get("final_prompt_length", 0) > 50)
+        self.assertTrue(f.response == "Test TDTest response")
+        self.assertEqual(mission.extras["retrieval_index"]["chunks"], 2)
+
+    def test_retrieval(self):
+        mission = self.mission_info.create_mission()
+        sections = {
+            "Flaky tests": "The integration tests time out on the payments worker.",
+            "Release notes": "Version two ships the new onboarding flow.",
+            "Dependencies": "Bumped the database driver and the HTTP client.",
+        }
+        response = h2("Issues") + "".join([h4(k) + v for k, v in sections.items()])
+        self.assertEqual(len(get_chunk_spans(response)), 4)  # and the heading
+        self.assertEqual(len(get_chunk_spans("line\n" * 2000)), 3)
+        Task.objects.create(
+            mission=mission,
+            name="Issues",
+            category=TaskCategory.API,
+            status=TaskStatus.COMPLETE,
+            response=response,
+        )
+        build_mission_index(mission)
+        question = Task.objects.create(
+            mission=mission,
+            name="TDTest Followup Question",
+            category=TaskCategory.LLM_QUESTION,
+            extras={"followup_question": "Why do the payments tests time out?"},
+        )
+        inputs = get_question_inputs(question, k=1)
+        self.assertEqual(len(inputs), 1)
+        self.assertEqual(inputs[0].name, "Issues")
+        self.assertTrue("payments worker" in inputs[0].response)
+        self.assertTrue("onboarding" not in inputs[0].response)
+        question.extras["followup_question"] = "Anything about kubernetes?"
+        self.assertEqual(get_question_inputs(question), [])
+
+        # rewritten after the index was built, so it's rebuilt rather than misread
+        issues = mission.task_set.get(name="Issues")
+        issues.response = h2("Triage") + "Nothing new.\n" + response
+        issues.save()
+        question.extras["followup_question"] = "Why do the payments tests time out?"
+        inputs = get_question_inputs(question, k=1)
+        section = h4("Flaky tests") + sections["Flaky tests"]
+        self.assertEqual(inputs[0].response.strip(), section.strip())
+
+        # an OpenAI question is routed to OpenAI, and sent only the retrieved data
+        report = Task.objects.create(
+            mission=mission,
+            name="Final Report",
+            category=TaskCategory.FINALIZE_MISSION,
+            status=TaskStatus.COMPLETE,
+            response="The final report.",
+        )
+        question = Task.objects.create(
+            mission=mission,
+            parent=report,
+            name="Followup Question",
+            llm=GPT_4O,
+            category=TaskCategory.LLM_QUESTION,
+            prompt="Why do the payments tests time out?",
+            extras={
+                "followup_question": "Why do the payments tests time out?",
+                "openai_thread_id": "thread_1",
+            },
+        )
+        client = mock.MagicMock()
+        client.beta.threads.messages.create.return_value.id = "msg_1"
+        registry = PluginRegistry("YamLLMs", hookspecs)
+        with mock.patch("missions.plugins.openai.get_client", return_value=client):
+            with mock.patch(
+                "missions.plugins.openai.run_openai",
+                return_value=mock.Mock(status="completed"),
+            ):
+                with mock.patch(
+                    "missions.plugins.openai.get_latest_openai_response",
+                    return_value="Retries are exhausted.",
+                ):
+                    with mock.patch("missions.plugins.openai.time.sleep"):
+                        response = registry.hook.ask_llm(task=question)
+        self.assertEqual(response, "Retries are exhausted.")
+        self.assertEqual(list(registry.loaded), ["openai"])
+        sent = [
+            c.kwargs["content"]
+            for c in client.beta.threads.messages.create.call_args_list
+        ]
+        self.assertEqual(len(sent), 2)  # the retrieved data, then the question
+        self.assertTrue("The final report." in sent[0])
+        self.assertTrue("payments worker" in sent[0])
+        self.assertTrue("onboarding" not in sent[0])
+        self.assertTrue("database driver" not in sent[0])
+        self.assertTrue("payments tests" in sent[1])
 
 
-class MissionConfigTests(TestCase):
+class MissionConfigTests(BlobDirTestCase):
     def test_data_mission(self):
         mi1 = MissionInfo.objects.create(
             name="TDTest data mission",
@@ -350,3 +516,63 @@ class TaskAPITests(TestCase):
         tasks = mission.task_set.all()
         log("tasks", tasks)
         self.assertTrue(len(tasks) == 3)
+
+
+class PluginRegistryTests(TestCase):
+    def test_routing(self):
+        registry = PluginRegistry("YamLLMs", hookspecs)
+        self.assertEqual(registry.loaded, {})
+        jira = Task(url=JIRA_API + "/issues", category=TaskCategory.API)
+        (route, plugin) = registry.resolve("run_api", {"task": jira})
+        self.assertEqual((route, plugin.name), (ATLASSIAN_API, "jira"))
+        claude = Task(llm=CLAUDE_HAIKU, category=TaskCategory.LLM_REPORT)
+        kwargs = {"task": claude, "input": "", "tool_key": ""}
+        self.assertEqual(registry.resolve("chat_llm", kwargs)[1].name, "anthropic")
+        kwargs = {"tasks": [claude], "batch_id": ""}
+        found = registry.resolve("get_llm_batch_results", kwargs)
+        self.assertEqual(found[1].name, "anthropic")
+        question = Task(llm=GPT_4O, category=TaskCategory.LLM_QUESTION)
+        found = registry.resolve("ask_llm", {"task": question})
+        self.assertEqual(found[1].name, "openai")
+        question.llm = GEMINI_1_5_PRO
+        found = registry.resolve("ask_llm", {"task": question})
+        self.assertEqual(found[1].name, "gemini")
+        scrape = Task(category=TaskCategory.SCRAPE)
+        found = registry.resolve("run_scrape", {"task": scrape})
+        self.assertEqual(found[1].name, "scrape")
+        self.assertEqual(registry.resolve("run_agent", {"task": scrape}), None)
+        unrouted = Task(url="https://example.com", category=TaskCategory.API)
+        self.assertEqual(registry.resolve("run_api", {"task": unrouted}), None)
+        self.assertEqual(len(registry.get_plugins_for("run_api")), 10)
+
+        # routed calls load only the plugin they need, and are counted
+        test = Task(llm=TEST_MODEL_MISTRAL, category=TaskCategory.LLM_REPORT)
+        self.assertEqual(registry.hook.chat_llm(task=test, input="", tool_key=""), None)
+        self.assertEqual(list(registry.loaded), ["mistral"])
+        self.assertEqual(registry.route_counts(), {"chat_llm mistral": 1})
+
+        # unrouted calls fall back to pluggy, with every implementation loaded
+        self.assertEqual(registry.hook.run_api(task=unrouted), None)
+        self.assertTrue("bing" in registry.loaded)
+        self.assertTrue("slack" in registry.loaded)
+        self.assertEqual(registry.route_counts()["run_api *"], 1)
+
+    def test_precedence(self):
+        registry = PluginRegistry("YamLLMs", hookspecs)
+        # precedence is registration order, however plugins happen to be loaded
+        registry.load([p for p in registry.plugins if p.name == "gemini"])
+        registry.load([p for p in registry.plugins if p.name == "openai"])
+        impls = registry.manager.hook.ask_llm.get_hookimpls()
+        self.assertEqual([i.plugin_name for i in impls], ["openai", "gemini"])
+
+        # undeclared plugins still get a look in on routed calls
+        class Custom:
+            @plugins.hookimpl
+            def run_api(task):
+                return "Custom response to %s" % task.url
+
+        registry.register(Custom)
+        github = Task(url=GITHUB_PREFIX + "org/repo/foo", category=TaskCategory.API)
+        response = registry.hook.run_api(task=github)
+        self.assertEqual(response, "Custom response to %s" % github.url)
+        self.assertEqual(registry.route_counts(), {"run_api %s" % GITHUB_PREFIX: 1})
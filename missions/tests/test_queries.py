@@ -0,0 +1,84 @@
+from unittest import mock
+from django.test import TestCase
+
+from ..models import *
+from ..queries import *
+from ..run import run
+
+
+class QueryAuditTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Query customer")
+        mission_info = MissionInfo.objects.create(name="Queries", customer=customer)
+        self.mission = mission_info.create_mission()
+        self.tasks = []
+        parent = None
+        for idx in range(8):
+            parent = Task.objects.create(
+                mission=self.mission,
+                name="Chained %s" % idx,
+                parent=parent,
+                category=TaskCategory.LLM_REPORT if parent else TaskCategory.API,
+                status=TaskStatus.COMPLETE,
+                url="https://example.com/%s" % idx,
+            )
+            self.tasks.append(parent)
+
+    def test_fingerprints(self):
+        sql = 'SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "name" = \'x\' LIMIT 21'
+        self.assertEqual(
+            get_fingerprint(sql),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND "name" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            get_fingerprint('"id" IN (%s)'), get_fingerprint('"id" IN (%s, %s)')
+        )
+
+    def test_repeats(self):
+        with audit_queries() as audit:
+            for t in self.tasks:
+                Task.objects.get(id=t.id)
+            Task.objects.get(id=self.tasks[0].id)
+        self.assertEqual(audit.count, 9)
+        self.assertEqual(audit.summary()["duplicates"], 1)
+        repeat = audit.repeats()[0]
+        self.assertEqual(repeat["count"], 9)
+        self.assertTrue(repeat["site"].startswith("test_queries.py"))
+
+        with self.assertRaises(AssertionError):
+            with assert_query_budget(20):
+                [Task.objects.get(id=t.id) for t in self.tasks]
+        with self.assertRaises(AssertionError):
+            with assert_query_budget(1):
+                list(Task.objects.all())
+                list(Mission.objects.all())
+
+    def test_budgets(self):
+        with assert_query_budget(1):
+            self.assertEqual(self.mission.get_repo(), None)
+        self.tasks[0].flags = {"github": "owner/repo"}
+        self.tasks[0].save()
+        with assert_query_budget(1):
+            self.assertEqual(self.mission.get_repo(), "owner/repo")
+
+        with assert_query_budget(2):
+            reports = self.mission.sub_reports()
+        self.assertEqual(len(reports), 7)
+
+        task = Task.objects.get(id=self.tasks[-1].id)
+        with assert_query_budget(2):
+            self.assertEqual(task.get_customer().name, "Query customer")
+            self.assertEqual(task.get_customer().name, "Query customer")
+            self.assertEqual(task.get_project(), None)
+
+    def test_task_audit(self):
+        task = Task.objects.create(
+            mission=self.mission, name="Audited", category=TaskCategory.OTHER
+        )
+        run(task)
+        self.assertTrue("queries" not in task.extras)
+        with mock.patch("missions.queries.QUERY_AUDIT", "true"):
+            run(task)
+        task.refresh_from_db()
+        self.assertEqual(task.extras["queries"]["duplicates"], 0)
+        self.assertEqual(task.extras["queries"]["repeats"], [])
@@ -1,20 +1,36 @@
-import datetime
+import asyncio, base64, datetime
 from types import SimpleNamespace
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.management import call_command
+from graphql import build_schema, introspection_from_schema
+from django.test import TestCase, override_settings
 
 from ..models import *
+from ..devs import CommitStore
+from ..summaries import is_map_reduce, split_items, summarize_chunks
+from ..summaries import get_summary_task, summarize_to_fit
+from ..summaries import ITEM_MARKER, MAX_SUMMARY_LEVELS
+from .. import summaries
 from ..util import get_sized_prompt
+from .. import util as missions_util
 from ..run import run_scrape
-from ..plugins.github import get_gh_issues, get_gh_commits
-from ..plugins.jira import get_jira_issues
+from ..plugins.github import get_gh_issues, get_gh_commits, get_tree_paths, TreeIndex
+from ..plugins.github import get_gh_files, get_file_blob_key, MAX_FETCH_FILE_BYTES
+from ..blobs import get_blob
+from ..plugins.jira import get_jira_issues, fetch_issues_with_jql
+from ..plugins.jira import JQL_MAX_PAGES, JQL_PAGE_SIZE
 from ..plugins.notion import get_notion_pages
 from ..plugins.jira import get_jira_issues
 from ..plugins.figma import get_figma_files
-from ..plugins.slack import get_slack_chatter
-from ..plugins.linear import get_linear_issues
+from ..plugins.slack import get_slack_chatter, get_mission_slack_users
+from ..plugins.linear import get_linear_issues, fetch_linear_pages
+from ..plugins.linear import get_linear_client, run_linear
 from ..plugins.harvest import fetch_harvest_projects
+from ..plugins.quantify import quantify_hours, quantify_github_issues
+from ..plugins.quantify import quantify_workflow_runs
 from ..plugins.text_links import process_text
+from .base import BlobDirTestCase
 
 
 class GHList(list):
@@ -189,8 +205,9 @@ class MockRepo:
         return GHList(objs)
 
 
-class GitHubTest(TestCase):
+class GitHubTest(BlobDirTestCase):
     def setUp(self):
+        super().setUp()
         mission_info = MissionInfo.objects.create(name="TDTest mission info")
         self.task_info = TaskInfo.objects.create(
             mission_info=mission_info,
@@ -223,6 +240,226 @@ class GitHubTest(TestCase):
         )
         self.assertTrue("test.py (+10, -5)" in task.response)
 
+    def test_tree_index(self):
+        entries = [
+            ("README.md", 100, "a1"),
+            ("src", None, "a2"),
+            ("src/main.py", 3000, "a3"),
+            ("src/util.py", 500, "a4"),
+            ("src/logo.png", 9000, "a5"),
+            ("node_modules/lib/index.js", 8000, "a6"),
+            ("srcfile.txt", 20, "a7"),
+            ("empty.txt", 0, "a8"),
+            ("missions/plugins/github.py", 700, "a9"),
+        ]
+        tree = SimpleNamespace(
+            sha="abc123",
+            tree=[SimpleNamespace(path=p, size=z, sha=h) for p, z, h in entries],
+        )
+        self.assertEqual(
+            get_tree_paths(tree),
+            [
+                ("README.md", 100),
+                ("src/main.py", 3000),
+                ("src/util.py", 500),
+                ("srcfile.txt", 20),
+            ],
+        )
+        self.assertEqual(len(get_tree_paths(tree, max_files=2)), 2)
+        index = TreeIndex.from_dict(TreeIndex.from_tree(tree).to_dict())
+        self.assertEqual(index.sha, "abc123")
+        self.assertEqual(
+            index.largest(2), [("src/main.py", 3000), ("src/util.py", 500)]
+        )
+        self.assertEqual(index.under("src"), ["src/main.py", "src/util.py"])
+        self.assertTrue(index.exists("/src/util.py"))
+        self.assertFalse(index.exists("src/missing.py"))
+        self.assertEqual(index.sha_of("src/main.py"), "a3")
+        # not listed, but still there to fetch
+        self.assertTrue(index.exists("src/logo.png"))
+        self.assertTrue(index.exists("empty.txt"))
+        self.assertEqual(index.sha_of("missions/plugins/github.py"), "a9")
+
+    @patch("missions.blobs.BLOB_STORE", "disk")
+    def test_gh_files(self):
+        index = TreeIndex("c1", ["src/main.py", "big.txt"], [10, 10**6], ["b1", "b2"])
+        blobs = {"b1": "print('hi')", "b2": "x" * 10**6}
+        contents = {"src/new.py": SimpleNamespace(sha="b4", content="bmV3")}
+        queries = []
+
+        def graphql_query(query, variables):
+            queries.append(query)
+            if len(queries) > 1:
+                raise Exception("GraphQL unavailable")
+            return {}, {"data": {"repository": {"f0": None, "f1": {"text": "main"}}}}
+
+        def get_git_blob(sha):
+            content = base64.b64encode(blobs[sha].encode()).decode()
+            return SimpleNamespace(content=content)
+
+        repo = SimpleNamespace(
+            full_name="owner/repo",
+            _requester=SimpleNamespace(graphql_query=graphql_query),
+            get_git_blob=get_git_blob,
+            get_contents=lambda path: contents[path],
+        )
+        finfos = [
+            {"url": "https://github.com/owner/repo/blob/main/src/main.py"},
+            {"name": "repo/big.txt"},
+            {"path": "missing.py"},
+            {"path": "src/new.py"},  # not in the index, so fetched directly
+        ]
+        fetched = get_gh_files(repo, finfos, index)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue('object(expression: "c1:big.txt")' in queries[0])
+        self.assertEqual(fetched[0], ("src/main.py", "main"))
+        self.assertEqual(
+            fetched[1], ("big.txt", "x" * MAX_FETCH_FILE_BYTES)
+        )  # blob API
+        self.assertEqual(fetched[2], (None, None))
+        self.assertEqual(fetched[3], ("src/new.py", "new"))
+
+        self.assertEqual(get_gh_files(repo, finfos, index), fetched)  # from store
+        self.assertEqual(len(queries), 1)
+        # stored as cut, so under a key with the cap, never the blob's own SHA
+        self.assertEqual(get_blob("b2"), None)
+        self.assertEqual(get_blob(get_file_blob_key("b2")), "x" * MAX_FETCH_FILE_BYTES)
+        self.assertEqual(get_blob(get_file_blob_key("b4")), "new")
+
+        index.shas[0] = "b3"  # changed, so GraphQL, which fails, then the blob API
+        blobs["b3"] = "print('changed')"
+        fetched = get_gh_files(repo, finfos[:1], index)
+        self.assertEqual(fetched[0], ("src/main.py", "print('changed')"))
+
+    @patch("missions.blobs.BLOB_STORE", "off")
+    def test_gh_files_excluded(self):
+        # listings leave out plugins/ and empty files, but they can still be fetched
+        entries = [("missions/plugins/github.py", 700, "p1"), ("empty.py", 0, "e1")]
+        tree = SimpleNamespace(
+            sha="c2",
+            tree=[SimpleNamespace(path=p, size=z, sha=h) for p, z, h in entries],
+        )
+        index = TreeIndex.from_tree(tree)
+        self.assertEqual(index.paths(), [])
+
+        def graphql_query(query, variables):
+            blob = {"text": "plugin"}  # paths are fetched in sorted order
+            return {}, {"data": {"repository": {"f0": {"text": ""}, "f1": blob}}}
+
+        repo = SimpleNamespace(
+            full_name="owner/repo",
+            _requester=SimpleNamespace(graphql_query=graphql_query),
+        )
+        finfos = [{"path": "missions/plugins/github.py"}, {"path": "empty.py"}]
+        fetched = get_gh_files(repo, finfos, index)
+        self.assertEqual(
+            fetched, [("missions/plugins/github.py", "plugin"), ("empty.py", "")]
+        )
+
+
+class DevDataTest(TestCase):
+    def commit(self, sha, changes, files, branch="main", type="normal", days=1):
+        return {
+            "sha": sha,
+            "days_ago": days,
+            "branch": branch,
+            "changes": changes,
+            "files": files,
+            "type": type,
+        }
+
+    def test_commit_store(self):
+        mission_info = MissionInfo.objects.create(name="TDTest mission info")
+        mission = mission_info.create_mission()
+        fetch = Task.objects.create(
+            mission=mission,
+            category=TaskCategory.API,
+            url=GITHUB_PREFIX + "test/repo/commits",
+            structured_data={
+                "devs": {
+                    "alice": {
+                        "name": "Alice",
+                        "prs_opened": 1,
+                        "commits": [
+                            self.commit("a1", 10, ["x.py", "y.py"]),
+                            self.commit("a2", 5, ["x.py"], branch="feature"),
+                            self.commit("a3", 99, ["z.py"], type="merge"),
+                        ],
+                    },
+                    "bob": {"name": "Bob", "commits": [self.commit("b1", 3, [])]},
+                }
+            },
+        )
+        other = Task.objects.create(
+            mission=mission,
+            category=TaskCategory.API,
+            structured_data={
+                "devs": {
+                    "alice": {
+                        "prs_opened": 2,
+                        "commits": [
+                            self.commit("a1", 10, ["x.py", "y.py"]),
+                            self.commit("a4", 7, ["w.py"], days=30),
+                        ],
+                    },
+                    "alice@example.com": {
+                        "name": "Alice",
+                        "commits": [self.commit("a5", 1, ["x.py"])],
+                    },
+                }
+            },
+        )
+        report = Task.objects.create(
+            mission=mission, category=TaskCategory.LLM_REPORT, parent=fetch
+        )
+
+        store = CommitStore.from_tasks([report, other])
+        self.assertEqual(len(store), 3)
+        summaries = store.summaries()
+        alice = summaries["alice"]
+        self.assertEqual(alice.commits, 3)  # a1 deduped, merge excluded
+        self.assertEqual(alice.changes, 22)
+        self.assertEqual(alice.files, 3)
+        self.assertEqual(alice.branches, 2)
+        self.assertEqual(alice.prs_opened, 3)
+        self.assertEqual(summaries["bob"].files, 0)
+        self.assertEqual(store.summaries(since_days=7)["alice"].changes, 15)
+        self.assertEqual(store.totals(since_days=7)["commits"], 4)
+
+        by_name = store.by_name().summaries()
+        self.assertEqual(sorted(by_name.keys()), ["Alice", "Bob"])
+        self.assertEqual(by_name["Alice"].commits, 4)
+
+        devs = store.to_devs()
+        self.assertEqual(
+            sorted([c["sha"] for c in devs["alice"]["commits"]]),
+            ["a1", "a2", "a3", "a4"],
+        )
+        a1 = [c for c in devs["alice"]["commits"] if c["sha"] == "a1"][0]
+        self.assertEqual(a1["files"], ["x.py", "y.py"])
+        self.assertEqual(CommitStore.from_devs(devs).summaries()["alice"].changes, 22)
+
+        # like prerequisite_tasks, with the fetch both an ancestor and a dependency
+        store = CommitStore.from_tasks([fetch, report, fetch])
+        self.assertEqual(store.summaries()["alice"].prs_opened, 1)
+
+        # dependencies by URL, and key context, count as they do in prerequisite_tasks
+        Task.objects.create(
+            mission=mission,
+            category=TaskCategory.LLM_REPORT,
+            reporting=Reporting.KEY_CONTEXT,
+            structured_data={"devs": {"carol": {"name": "Carol", "commits": []}}},
+        )
+        spanning = Task.objects.create(
+            mission=mission,
+            category=TaskCategory.LLM_REPORT,
+            depends_on_urls=[fetch.url],
+        )
+        store = CommitStore.from_tasks([spanning])
+        self.assertEqual(sorted(store.keys), ["alice", "bob", "carol"])
+        prereqs = [spanning] + spanning.prerequisite_tasks()
+        self.assertEqual(store.to_devs(), CommitStore.from_tasks(prereqs).to_devs())
+
 
 class PromptSizingTest(TestCase):
     def setUp(self):
@@ -249,7 +486,109 @@ class PromptSizingTest(TestCase):
         self.assertTrue(task.extras["truncated"])
         self.assertTrue("truncated_tokens" in task.extras)
         log("truncated", task.extras["truncated_tokens"])
-        self.assertTrue(task.extras["truncated_tokens"] == 12290)
+        # 12290 with tiktoken; estimated when the encoding can't be downloaded
+        self.assertAlmostEqual(task.extras["truncated_tokens"], 12290, delta=120)
+
+    def test_token_estimates(self):
+        self.assertEqual(get_token_family(GPT_4O_MINI), get_token_family(CLAUDE_OPUS))
+        self.assertEqual(get_token_family(GEMINI_1_5_PRO), "gemini")
+        self.assertEqual(estimate_tokens("Hello, world!"), 4)
+        self.assertEqual(estimate_tokens("tokenization"), 3)
+        texts = ["Hello, world!", "", "One two three."]
+        counts = count_many(texts, GEMINI_1_5_FLASH)
+        self.assertEqual(counts, [4, 0, 4])
+        self.assertEqual(token_count_for(texts[2], GEMINI_1_5_FLASH), 4)
+        big = "word " * 2000000
+        texts = truncate_to_fit(["short", big], GEMINI_1_PRO, "\n\n---\n\n")
+        self.assertEqual(texts[0], "short")
+        self.assertTrue(texts[1].endswith("(truncated)\n..."))
+        self.assertFalse(is_too_long("\n\n---\n\n".join(texts), GEMINI_1_PRO))
+
+    @patch.dict("missions.util.encodings", clear=True)
+    @patch.dict("missions.util.encoding_failures", clear=True)
+    def test_encoding_retry(self):
+        encoding = SimpleNamespace(name="test")
+        load = patch("tiktoken.encoding_for_model").start()
+        self.addCleanup(patch.stopall)
+        load.side_effect = Exception("network error")
+        self.assertIsNone(get_encoding("test-family"))
+        load.side_effect = None
+        load.return_value = encoding
+        self.assertIsNone(get_encoding("test-family"))  # not retried right away
+        missions_util.encoding_failures["test-family"] -= ENCODING_RETRY_SECONDS
+        self.assertEqual(get_encoding("test-family"), encoding)
+        self.assertEqual(get_encoding("test-family"), encoding)
+        self.assertEqual(load.call_count, 2)
+
+    def test_map_reduce_chunks(self):
+        mission = self.mission_info.create_mission()
+        task = self.task_info.create_task(mission)
+        task.flags["map_reduce"] = "true"
+        self.assertTrue(is_map_reduce(task))
+        text = "Dataset" + h4("One") + "first item" + h4("Two") + "second item"
+        pieces = split_items(text)
+        self.assertEqual(len(pieces), 3)
+        self.assertEqual(split_items("one\n---\ntwo\n---\n"), ["one", "two"])
+        stats = {"cached": 0}
+        summaries = summarize_chunks(task, pieces, stats)
+        self.assertEqual(len(summaries), 3)
+        self.assertTrue(summaries[1].startswith("Test TDTest summary"))
+        self.assertEqual(stats["cached"], 0)
+        self.assertEqual(task.llm, None)  # the summary model is set on a copy
+
+        # plugin writes and saves stay on the copy
+        task.structured_data = {"items": [1]}
+        summary_task = get_summary_task(task)
+        summary_task.structured_data["items"].append(2)
+        summary_task.save()
+        self.assertEqual(task.structured_data, {"items": [1]})
+        self.assertEqual(Task.objects.filter(mission=mission).count(), 1)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_map_reduce_levels(self):
+        mission = self.mission_info.create_mission()
+        task = Task.objects.create(
+            mission=mission,
+            name="Report",
+            llm=GPT_4_BASE,
+            category=TaskCategory.LLM_REPORT,
+        )
+        items = ["item %s: %s" % (i, "word " * 300) for i in range(200)]
+        text = ITEM_MARKER.join(items)
+        self.assertTrue(is_too_long(text, GPT_4_BASE))
+        calls = []
+
+        # the chat plugins write to and save the task they're given
+        def chat_llm(task, input, tool_key):
+            calls.append(task.llm)
+            task.extras["input_tokens"] = len(input)
+            task.save()
+            return "Summary: " + input[: len(input) // ratio]
+
+        pm = SimpleNamespace(hook=SimpleNamespace(chat_llm=chat_llm))
+        with patch.object(summaries, "get_plugin_manager", return_value=pm):
+            with patch.object(
+                summaries, "summarize_chunks", wraps=summarize_chunks
+            ) as levels:
+                ratio = 4  # each level cuts its input to a quarter
+                fitted = summarize_to_fit(task, text)
+                sizes = [sum(map(len, c.args[1])) for c in levels.call_args_list]
+                self.assertEqual(task.extras["map_reduce"]["levels"], 2)
+                self.assertTrue(sizes[0] > sizes[1] * 3)
+                self.assertFalse(is_too_long(fitted, GPT_4_BASE))
+                self.assertEqual(set(calls), {summaries.SUMMARY_LLM})
+
+                # summaries that don't shrink stop at the level limit
+                ratio = 1
+                levels.reset_mock()
+                summarize_to_fit(task, text.replace("word", "other"))
+                self.assertEqual(levels.call_count, MAX_SUMMARY_LEVELS)
+                stats = task.extras["map_reduce"]
+                self.assertEqual(stats["levels"], MAX_SUMMARY_LEVELS)
+        self.assertEqual(task.llm, GPT_4_BASE)
+        self.assertEqual(Task.objects.filter(mission=mission).count(), 1)
 
 
 class TextLinking(TestCase):
@@ -402,10 +741,11 @@ class JiraTests(TestCase):
             def get_all_fields(self):
                 return []
 
-            def jql(self, jql, start=0):
+            def jql(self, jql, fields="*all", start=0, limit=None):
                 if start > 0:
                     return {"issues": []}
                 return {
+                    "total": 2,
                     "issues": [
                         {
                             "key": "TEST-1",
@@ -450,6 +790,65 @@ class JiraTests(TestCase):
         get_jira_issues(self.task, self.get_mock_jira())
         self.assertTrue("#### TEST-2" in self.task.response)
 
+    def test_jql_paging(self):
+        class PagedJira:
+            calls = []
+
+            def jql(self, jql, fields="*all", start=0, limit=None):
+                self.calls.append((jql, start))
+                keys = range(start, min(start + limit, 120))
+                return {"total": 120, "issues": [{"key": "P-%s" % k} for k in keys]}
+
+        jira = PagedJira()
+        cutoff = datetime.datetime(2024, 5, 1, 12, 30)
+        jql = 'statusCategory = "Done" ORDER BY updatedDate DESC'
+        results = fetch_issues_with_jql(jira, jql, cutoff_date=cutoff, fields=["key"])
+        self.assertEqual([i["key"] for i in results["issues"]][-1], "P-119")
+        self.assertEqual(len(results["issues"]), 120)
+        self.assertEqual(sorted([c[1] for c in jira.calls]), [0, 50, 100])
+        self.assertEqual(
+            jira.calls[0][0],
+            'statusCategory = "Done" AND updated >= "2024/05/01 12:30" ORDER BY updatedDate DESC',
+        )
+
+    def test_epic_children(self):
+        def issue(key, issuetype, parent=None):
+            fields = {
+                "project": {"key": "E", "name": "Epic Project"},
+                "creator": {"displayName": "Test User"},
+                "priority": {"name": "Medium"},
+                "issuetype": {"name": issuetype},
+                "summary": key,
+                "created": "2020-01-01T00:00:00.000Z",
+                "updated": "2021-01-01T00:00:00.000Z",
+                "status": {"name": "To Do", "statusCategory": {"name": "To Do"}},
+                "comment": {"comments": []},
+            }
+            if parent:
+                fields["parent"] = {"key": parent, "fields": {}}
+            return {"key": key, "fields": fields}
+
+        # more children of a batch of epics than one query's page limit
+        epics = [issue("E-%s" % i, "Epic") for i in range(2)]
+        count = JQL_MAX_PAGES * JQL_PAGE_SIZE + 100
+        children = [issue("C-%s" % i, "Task", "E-%s" % (i % 2)) for i in range(count)]
+
+        class EpicJira:
+            def get_all_fields(self):
+                return []
+
+            def jql(self, jql, fields="*all", start=0, limit=None):
+                found = children if "parent IN" in jql else []
+                if 'statusCategory = "To Do"' in jql:
+                    found = epics
+                page = found[start : start + limit]
+                return {"total": len(found), "issues": page}
+
+        get_jira_issues(self.task, EpicJira())
+        keys = [i["key"] for i in self.task.structured_data["issues"]]
+        self.assertEqual(len(keys), count + 2)
+        self.assertTrue("C-%s" % (count - 1) in keys)
+
 
 class OtherTests(TestCase):
     def setUp(self):
@@ -602,7 +1001,10 @@ class OtherTests(TestCase):
 
     def get_mock_slack(self):
         class MockSlack:
-            def users_list(self):
+            def auth_test(self):
+                return {"team_id": "tdteam"}
+
+            def users_list(self, limit=None, cursor=None):
                 return {
                     "members": [
                         {
@@ -620,7 +1022,7 @@ class OtherTests(TestCase):
                     ]
                 }
 
-            def conversations_list(self):
+            def conversations_list(self, limit=None, cursor=None):
                 return {
                     "channels": [
                         {
@@ -644,7 +1046,7 @@ class OtherTests(TestCase):
                     ]
                 }
 
-            def conversations_history(self, channel, oldest, limit):
+            def conversations_history(self, channel, oldest, limit, cursor=None):
                 return {
                     "messages": [
                         {
@@ -669,6 +1071,23 @@ class OtherTests(TestCase):
         get_slack_chatter(task, self.get_mock_slack())
         self.assertTrue("#### Recent Conversation: Channel Zero" in task.response)
         self.assertTrue("Test User 2: Test message 2" in task.response)
+        self.assertEqual(task.structured_data["latest_ts"]["tdtest2"], "123438788")
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_slack_users_per_workspace(self):
+        task = self.get_task(SLACK_API)
+        first = self.get_mock_slack()
+        second = self.get_mock_slack()
+        second.auth_test = lambda: {"team_id": "tdteam2"}
+        second.users_list = lambda limit=None, cursor=None: {
+            "members": [{"id": "tdtest3", "name": "Other User", "profile": {}}]
+        }
+        (users, user_string) = get_mission_slack_users(task, first)
+        self.assertTrue("tdtest1" in users)
+        (users, user_string) = get_mission_slack_users(task, second)
+        self.assertEqual(users, {"tdtest3": "Other User"})
 
     # Linear
 
@@ -686,11 +1105,61 @@ class OtherTests(TestCase):
         get_linear_issues(task, self.get_mock_linear())
         # TODO actually test this by mocking GraphQL
 
+    def test_linear_pagination(self):
+        class MockSession:
+            calls = []
+
+            async def execute(self, query, variable_values=None):
+                self.calls.append(variable_values)
+                after = variable_values.get("after")
+                page = int(after) if after else 0
+                return {
+                    "issues": {
+                        "pageInfo": {"hasNextPage": page < 2, "endCursor": page + 1},
+                        "nodes": [{"id": "%s-%s" % (page, n)} for n in range(3)],
+                    }
+                }
+
+        session = MockSession()
+        variables = {"filter": {"team": {"id": {"eq": "t1"}}}}
+        coro = fetch_linear_pages(session, None, "issues", variables)
+        nodes = asyncio.run(coro)
+        self.assertEqual(len(nodes), 9)
+        self.assertEqual([c.get("after") for c in session.calls], [None, 1, 2])
+        self.assertEqual(session.calls[2]["filter"], variables["filter"])
+
+    @patch("missions.plugins.linear.linear_introspection", None)
+    @patch("missions.plugins.linear.cache")
+    def test_linear_clients(self, cache):
+        cache.get.return_value = None
+        first = get_linear_client("token-1")
+        self.assertTrue(first.fetch_schema_from_transport)
+        schema = build_schema("type Query { teams: Int }")
+        introspection = introspection_from_schema(schema)
+
+        class MockClient:  # connects, fetching the schema
+            fetch_schema_from_transport = True
+
+            async def __aenter__(self):
+                self.introspection = introspection
+                return self
+
+            async def __aexit__(self, *args):
+                pass
+
+        run_linear(MockClient(), lambda session: asyncio.sleep(0))
+        # a new client per token, but the schema isn't fetched again
+        second = get_linear_client("token-2")
+        self.assertIsNot(first, second)
+        self.assertFalse(second.fetch_schema_from_transport)
+        self.assertEqual(cache.set.call_args[0][1], introspection)
+
     # Harvest
 
     def get_mock_harvest(self):
         class MockHarvest:
             is_test = True
+            endpoints = []
 
             def fetch(self, endpoint):
                 key = endpoint.split("?")[0].split("/")[-1]
@@ -733,14 +1202,27 @@ class OtherTests(TestCase):
 
                 if key == "user_assignments":
                     vals = [
-                        {"user": {"name": "Test User 1"}},
-                        {"user": {"name": "Test User 2"}},
+                        {"user": {"name": "Test User 1"}, "project": {"id": "tdtest1"}},
+                        {"user": {"name": "Test User 2"}, "project": {"id": "tdtest2"}},
                     ]
 
                 if key == "task_assignments":
                     vals = [
-                        {"task": {"name": "Test Task 1"}},
-                        {"task": {"name": "Test Task 2"}},
+                        {"task": {"name": "Test Task 1"}, "project": {"id": "tdtest1"}},
+                        {"task": {"name": "Test Task 2"}, "project": {"id": "tdtest2"}},
+                    ]
+
+                if key == "time_entries":
+                    self.endpoints.append(endpoint)
+                    vals = [
+                        {
+                            "project": {"id": "tdtest2"},
+                            "user": {"id": 7, "name": "Test User 2"},
+                            "task": {"name": "Test Task 2"},
+                            "spent_date": "2024-05-01",
+                            "hours": 2.5,
+                            "notes": "",
+                        },
                     ]
 
                 dict = {key: vals}
@@ -750,6 +1232,158 @@ class OtherTests(TestCase):
 
     def test_render_harvest(self):
         task = self.get_task(HARVEST_API)
-        fetch_harvest_projects(task, self.get_mock_harvest())
+        harvest = self.get_mock_harvest()
+        fetch_harvest_projects(task, harvest)
         self.assertTrue("#### Project: Test Project 2" in task.response)
         self.assertTrue("- Test Task 2" in task.response)
+        self.assertTrue("- 2024-05-01 2.5 hours" in task.response)
+        self.assertEqual(task.structured_data[7]["entries"][0]["hours"], 2.5)
+        self.assertTrue("time_entries?from=" in harvest.endpoints[0])
+
+    def test_quantify_hours(self):
+        today = datetime.date.today()
+        monday = today - datetime.timedelta(days=today.weekday() + 14)
+        Task.objects.create(
+            mission=self.mission,
+            category=TaskCategory.API,
+            url=FORECAST_API,
+            structured_data={
+                "11": {
+                    "name": "Test User",
+                    "allocations": [
+                        {
+                            "project": "Test Project",
+                            "start": (monday - datetime.timedelta(days=30)).isoformat(),
+                            "end": (monday + datetime.timedelta(days=8)).isoformat(),
+                            "hours": 8.0,
+                        }
+                    ],
+                }
+            },
+        )
+        Task.objects.create(
+            mission=self.mission,
+            category=TaskCategory.API,
+            url=HARVEST_API,
+            structured_data={
+                "22": {
+                    "name": "Test User",
+                    "entries": [
+                        {
+                            "project": "Test Project",
+                            "date": (monday + datetime.timedelta(days=1)).isoformat(),
+                            "hours": 6.5,
+                        },
+                        {
+                            "project": "Test Project",
+                            "date": (monday + datetime.timedelta(days=9)).isoformat(),
+                            "hours": 1,
+                        },
+                    ],
+                },
+                "33": {"name": "Idle User", "entries": []},
+            },
+        )
+        task = Task.objects.create(
+            mission=self.mission, category=TaskCategory.QUANTIFIED_REPORT
+        )
+        html = quantify_hours(task)
+        week1, week2 = html.split("</table>")[:2]
+        self.assertTrue("<td>8/0</td><td>8/6.5</td><td>8/0</td>" in week1)
+        self.assertTrue(
+            "<strong>40/6.5</strong></td><td><strong>33.5</strong>" in week1
+        )
+        self.assertTrue("<td>8/0</td><td>8/0</td><td>0/1</td><td>--</td>" in week2)
+        self.assertTrue("<strong>16/1</strong></td><td><strong>15</strong>" in week2)
+        self.assertTrue("Idle User" not in html)
+
+    def test_quantify_github_issues(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        ago = lambda days: (now - datetime.timedelta(days=days)).isoformat()
+        issues = [
+            {"created": ago(3), "state": "open", "comments": 2, "labels": []},
+            {"created": ago(10), "state": "closed", "closed": ago(2), "comments": 1},
+            {"created": ago(20), "state": "closed", "closed": ago(12), "comments": 4},
+        ]
+        for issue in issues[1:]:
+            issue["labels"] = ["bug"]
+            issue["milestone"] = "v1"
+        parent = Task.objects.create(
+            mission=self.mission,
+            category=TaskCategory.API,
+            url=GITHUB_PREFIX + "test/repo/issues",
+            structured_data={
+                "issues": issues,
+                "counts": {"open_issues": 5, "closed_issues": 7},
+            },
+        )
+        task = Task.objects.create(
+            mission=self.mission,
+            parent=parent,
+            category=TaskCategory.QUANTIFIED_REPORT,
+        )
+        md = quantify_github_issues(task)
+        self.assertTrue("| 7 Days | 1 | 1 | 2 | 1 | 1 |" in md)
+        self.assertTrue("| 14 Days | 2 | 2 | 3 | 1 | 2 |" in md)
+        self.assertTrue("| All Time | 12 | 7 | - | - | - |" in md)
+        self.assertTrue("30 Days" not in md)
+        values = Metric.objects.for_mission(
+            self.mission.id, ["issues_opened", "issues_closed"], "test/repo", "14d"
+        )
+        self.assertEqual(values[""], {"issues_opened": 2, "issues_closed": 2})
+
+    def test_quantify_workflow_runs(self):
+        outcomes = ["success", "cancelled", "success", "failure", "success"]
+        runs = [{"conclusion": c, "branch": "main"} for c in outcomes]
+        parent = Task.objects.create(
+            mission=self.mission,
+            category=TaskCategory.API,
+            url=GITHUB_PREFIX + "test/repo/actions",
+            structured_data={"1": {"name": "CI", "runs": runs}},
+        )
+        task = Task.objects.create(
+            mission=self.mission,
+            parent=parent,
+            category=TaskCategory.QUANTIFIED_REPORT,
+        )
+        md = quantify_workflow_runs(task)
+        self.assertTrue("| **CI** | 5 | 4 | 3 | 1 | 75% | 2 |" in md)
+        trend = Metric.objects.trend("workflow_success", "test/repo", "CI")
+        self.assertEqual(trend, [(self.mission.id, 3.0)])
+        runs[0]["conclusion"] = "failure"
+        parent.save()
+        quantify_workflow_runs(task)
+        self.assertEqual(Metric.objects.filter(metric="workflow_success").count(), 1)
+        values = Metric.objects.for_mission(
+            self.mission.id, ["workflow_success", "workflow_failure"], "test/repo"
+        )
+        self.assertEqual(values["CI"], {"workflow_success": 2, "workflow_failure": 2})
+
+    def test_backfill_metrics(self):
+        runs = [{"conclusion": "success", "branch": "main"}]
+        tasks = []
+        for url, data in [
+            ("actions", {"1": {"name": "CI", "runs": runs}}),
+            ("pulls", {}),
+        ]:
+            parent = Task.objects.create(
+                mission=self.mission,
+                category=TaskCategory.API,
+                url=GITHUB_PREFIX + "test/repo/" + url,
+                structured_data=data,
+            )
+            tasks.append(
+                Task.objects.create(
+                    mission=self.mission,
+                    parent=parent,
+                    category=TaskCategory.QUANTIFIED_REPORT,
+                    status=TaskStatus.COMPLETE,
+                    response="saved",
+                )
+            )
+        call_command("backfill_metrics", mission_id=self.mission.id)
+        trend = Metric.objects.trend("workflow_success", "test/repo", "CI")
+        self.assertEqual(trend, [(self.mission.id, 1.0)])
+        for task in tasks:  # PR ratings, which would re-render and save, are skipped
+            task.refresh_from_db()
+            self.assertEqual(task.response, "saved")
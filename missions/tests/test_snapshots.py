@@ -0,0 +1,120 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..models import *
+from ..bench import BENCH_PLUGIN
+from ..plugins.bench import BENCH_PREFIX
+from ..registry import PLUGINS, PluginRegistry
+from ..run import run_api
+from ..snapshots import *
+from .. import hookspecs
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry = PluginRegistry("YamLLMs", hookspecs, PLUGINS + [BENCH_PLUGIN])
+        self.patches = [
+            mock.patch("missions.apps.pm", registry),
+            mock.patch("missions.snapshots.acquire_lock", return_value="token"),
+            mock.patch("missions.snapshots.release_lock"),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.mission_info = MissionInfo.objects.create(name="Snapshots")
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def create_task(self, url, **flags):
+        return Task.objects.create(
+            mission=self.mission_info.create_mission(),
+            name="Fetch",
+            category=TaskCategory.API,
+            url=url,
+            llm=BENCH_MODEL,
+            flags=flags,
+        )
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url("HTTPS://GitHub.com/owner/repo/?b=2&a=1#top"),
+            normalize_url("https://github.com/owner/repo?a=1&b=2"),
+        )
+
+    def test_reuse(self):
+        first = self.create_task(BENCH_PREFIX + "issues/5")
+        run_api(first)
+        self.assertTrue("snapshot" not in first.extras)
+
+        second = self.create_task(BENCH_PREFIX + "issues/5/")
+        with mock.patch("missions.plugins.bench.fetch_bench_items") as fetch:
+            run_api(second)
+        fetch.assert_not_called()
+        self.assertEqual(second.extras["snapshot"]["task_id"], first.id)
+        self.assertEqual(second.response, first.response)
+
+        for other in [
+            self.create_task(BENCH_PREFIX + "issues/6"),
+            self.create_task(BENCH_PREFIX + "issues/5", commit_days=3),
+            self.create_task(BENCH_PREFIX + "issues/5", snapshot="false"),
+        ]:
+            run_api(other)
+            self.assertTrue("snapshot" not in other.extras)
+
+    def test_time_series(self):
+        tasks = []
+        for name in ["One", "Two"]:
+            info = MissionInfo.objects.create(name=name)
+            previous = info.create_mission()
+            Task.objects.create(
+                mission=previous,
+                name="Fetch",
+                category=TaskCategory.API,
+                url=BENCH_PREFIX + "issues/5",
+                status=TaskStatus.COMPLETE,
+                structured_data={"latest_ts": {"c1": name}},
+            )
+            mission = info.create_mission()
+            mission.previous = previous
+            mission.save()
+            tasks.append(
+                Task.objects.create(
+                    mission=mission,
+                    name="Fetch",
+                    category=TaskCategory.API,
+                    url=BENCH_PREFIX + "issues/5",
+                    llm=BENCH_MODEL,
+                )
+            )
+        # same source, but each continues from its own previous fetch
+        self.assertNotEqual(get_snapshot_key(tasks[0]), get_snapshot_key(tasks[1]))
+        run_api(tasks[0])
+        run_api(tasks[1])
+        self.assertTrue("snapshot" not in tasks[1].extras)
+
+    @mock.patch("missions.snapshots.POLL_SECONDS", 0)
+    def test_single_flight(self):
+        first = self.create_task(BENCH_PREFIX + "pulls/3")
+        run_api(first)
+        waiting = self.create_task(BENCH_PREFIX + "pulls/3")
+        key = get_snapshot_key(waiting)
+        snapshot = cache.get(SNAPSHOT_KEY % key)
+        cache.clear()
+
+        # someone else holds the lock, and their snapshot lands while we wait
+        def locked(key):
+            cache.set(SNAPSHOT_KEY % key, snapshot)
+            return True
+
+        with mock.patch("missions.snapshots.acquire_lock", return_value=None):
+            with mock.patch("missions.snapshots.is_locked", side_effect=locked):
+                with mock.patch("missions.plugins.bench.fetch_bench_items") as fetch:
+                    run_api(waiting)
+        fetch.assert_not_called()
+        self.assertEqual(waiting.extras["snapshot"]["task_id"], first.id)
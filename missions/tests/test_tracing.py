@@ -0,0 +1,85 @@
+import httpx, os, requests, tempfile, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from requests.adapters import HTTPAdapter
+from django.test import TestCase
+
+from ..models import *
+from ..registry import PluginRegistry
+from ..tracing import *
+from .. import hookspecs, tracing
+from ..plugins import tracing as tracing_hooks
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        data = b"Hello from the stub"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.trace_file = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+        self.registry = PluginRegistry("YamLLMs", hookspecs)
+        self.registry.register(tracing_hooks)
+        self.patches = [
+            mock.patch.object(tracing, "TRACING", "file"),
+            mock.patch.object(tracing, "TRACE_FILE", self.trace_file),
+            mock.patch("missions.apps.pm", self.registry),
+            # instrument_http replaces these, so put the originals back after
+            mock.patch.object(HTTPAdapter, "send", HTTPAdapter.send),
+            mock.patch.object(
+                httpx.HTTPTransport,
+                "handle_request",
+                httpx.HTTPTransport.handle_request,
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_mission_trace(self):
+        instrument_http()
+        mission_info = MissionInfo.objects.create(name="Traced mission info")
+        mission = mission_info.create_mission()
+        task = Task.objects.create(
+            mission=mission,
+            name="Traced task",
+            llm=TEST_MODEL_MISTRAL,
+            category=TaskCategory.LLM_REPORT,
+        )
+        with trace_task(task):
+            self.registry.hook.chat_llm(task=task, input="", tool_key="")
+            Task.objects.filter(mission=mission).count()
+            url = "http://127.0.0.1:%s/data" % self.server.server_port
+            self.assertEqual(requests.get(url).text, "Hello from the stub")
+        requests.get(url)  # outside a task, so not traced
+
+        spans = get_mission_spans(mission.id)
+        self.assertEqual(len(spans), 3)
+        rows = get_waterfall(spans)
+        self.assertEqual(rows[0]["name"], "task LLM Report")
+        self.assertEqual(rows[0]["depth"], 0)
+        self.assertEqual(rows[0]["attributes"]["task.id"], task.id)
+        self.assertTrue(rows[0]["attributes"]["db.queries"] >= 1)
+        self.assertEqual(rows[1]["name"], "hook chat_llm")
+        self.assertEqual(rows[1]["plugin"], "mistral")
+        self.assertEqual(rows[1]["depth"], 1)
+        self.assertEqual(rows[1]["attributes"]["gen_ai.request.model"], "mistral-test")
+        self.assertEqual(rows[2]["name"], "HTTP GET 127.0.0.1")
+        self.assertEqual(rows[2]["attributes"]["http.status_code"], 200)
+        self.assertEqual(rows[2]["attributes"]["http.response.bytes"], 19)
+        self.assertTrue(all(0 <= row["offset"] <= 100 for row in rows))
@@ -0,0 +1,72 @@
+import datetime, os, tempfile
+from django.test import TestCase
+from ..models import *
+from ..transfer import *
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.mission_info = MissionInfo.objects.create(name="Transfer")
+        self.previous = self.mission_info.create_mission()
+        self.mission = self.mission_info.create_mission()
+        self.mission.previous = self.previous
+        self.mission.save()
+        # a parent created after its child, so the reference points forward
+        self.child = Task.objects.create(
+            mission=self.mission, name="Report", category=TaskCategory.OTHER
+        )
+        self.parent = Task.objects.create(
+            mission=self.mission,
+            name="Fetch",
+            category=TaskCategory.API,
+            response="fetched",
+        )
+        self.child.parent = self.parent
+        self.child.save()
+        RawData.objects.create(task=self.parent, name="raw", data={"items": [1, 2]})
+        Metric.objects.create(
+            mission=self.mission, task=self.child, metric="commits", value=3
+        )
+        self.created_at = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+        Mission.objects.filter(id=self.mission.id).update(created_at=self.created_at)
+        self.directory = tempfile.mkdtemp()
+
+    def test_round_trip(self):
+        file = os.path.join(self.directory, "export.ndjson.gz")
+        counts = export_ndjson(file, get_export_querysets(), chunk_size=1)
+        self.assertEqual(counts, {"mission": 2, "task": 2, "rawdata": 1, "metric": 1})
+        counts = import_ndjson(file, batch_size=1)
+        self.assertEqual(counts, {"mission": 2, "task": 2, "rawdata": 1, "metric": 1})
+
+        mission = Mission.objects.exclude(id__in=[self.previous.id, self.mission.id])
+        mission = mission.get(previous__isnull=False)
+        self.assertNotEqual(mission.previous_id, self.previous.id)
+        self.assertEqual(mission.mission_info, self.mission_info)
+        self.assertEqual(mission.created_at, self.created_at)
+        child = mission.task_set.get(name="Report")
+        parent = mission.task_set.get(name="Fetch")
+        self.assertEqual(child.parent, parent)
+        self.assertEqual(parent.response, "fetched")
+        self.assertEqual(RawData.objects.get(task=parent).data, {"items": [1, 2]})
+        self.assertEqual(Metric.objects.get(mission=mission).task, child)
+
+    def test_filters_and_skip_heavy(self):
+        file = os.path.join(self.directory, "export.ndjson")
+        querysets = get_export_querysets(mission_ids=[self.mission.id])
+        counts = export_ndjson(file, querysets, skip_heavy=True)
+        self.assertEqual(counts, {"mission": 1, "task": 2, "rawdata": 1, "metric": 1})
+        with open(file) as f:
+            self.assertNotIn("fetched", f.read())
+
+        # the previous mission wasn't exported, so the link is dropped
+        counts = import_ndjson(file, dry_run=True)
+        self.assertEqual(counts["task"], 2)
+        self.assertEqual(Task.objects.count(), 2)
+        import_ndjson(file)
+        mission = Mission.objects.order_by("-id").first()
+        self.assertIsNone(mission.previous)
+        self.assertEqual(mission.task_set.get(name="Fetch").response, None)
+
+        since = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        counts = export_ndjson(file, get_export_querysets(since=since))
+        self.assertEqual(counts["mission"], 1)  # not the backdated one, or its copy
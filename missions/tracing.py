@@ -0,0 +1,318 @@
+import contextvars, json, os, secrets, time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from django.db import connection
+from .util import *
+
+TRACING = os.getenv("TRACING", "")  # "redis" or "file", off otherwise
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_KEY = "trace_%s"  # per mission, a redis list of OTLP export requests
+TRACE_SECONDS = 60 * 60 * 24 * 14
+TRACE_SCOPE = "yamllms"
+SLOW_QUERY_MS = 100  # slower ORM queries get their own spans, the rest are summed
+LLM_HOOKS = ["chat_llm", "show_llm", "ask_llm"]
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+current = contextvars.ContextVar("current_span", default=None)
+
+
+def is_tracing():
+    return TRACING in ["redis", "file"]
+
+
+class Span:
+    def __init__(self, name, trace_id, parent=None, kind=SPAN_KIND_INTERNAL):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else ""
+        self.root = parent.root if parent else self
+        self.kind = kind
+        self.attributes = {}
+        self.error = None
+        self.start = time.time_ns()
+        self.end = None
+        self.spans = []  # for a root span, every finished span under it
+        self.queries = 0
+        self.query_ns = 0
+
+    def set(self, **attributes):
+        self.attributes.update({k.replace("__", "."): v for k, v in attributes.items()})
+
+    def to_otlp(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": "%s" % self.start,
+            "endTimeUnixNano": "%s" % self.end,
+            "attributes": [to_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": (
+                {"code": STATUS_ERROR, "message": self.error}
+                if self.error
+                else {"code": STATUS_OK}
+            ),
+        }
+
+
+def to_otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": "%s" % value}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": "%s" % value}}
+
+
+def from_otlp_attributes(attributes):
+    values = {}
+    for attribute in attributes:
+        value = attribute["value"]
+        if "intValue" in value:
+            values[attribute["key"]] = int(value["intValue"])
+        else:
+            values[attribute["key"]] = list(value.values())[0]
+    return values
+
+
+# a child of the current span; spans are only recorded within a traced task
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    parent = current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent, kind)
+    child.set(**attributes)
+    token = current.set(child)
+    try:
+        yield child
+    except Exception as ex:
+        child.error = "%s" % ex
+        raise
+    finally:
+        child.end = time.time_ns()
+        current.reset(token)
+        child.root.spans.append(child)
+
+
+# the root span for running a task, one trace per mission, exported when done
+@contextmanager
+def trace_task(task):
+    if not is_tracing() or current.get() is not None:
+        yield None
+        return
+    root = Span("task %s" % task.get_category_display(), "%032x" % task.mission_id)
+    root.set(
+        task__id=task.id,
+        task__name=task.name,
+        task__category=task.category,
+        task__url=task.url or "",
+        mission__id=task.mission_id,
+    )
+    token = current.set(root)
+    try:
+        with connection.execute_wrapper(record_query):
+            yield root
+    except Exception as ex:
+        root.error = "%s" % ex
+        raise
+    finally:
+        root.end = time.time_ns()
+        root.set(task__status=task.status, db__queries=root.queries)
+        root.set(db__time_ms=root.query_ns // 1000000)
+        current.reset(token)
+        export(task.mission_id, root.spans + [root])
+
+
+def record_query(execute, sql, params, many, context):
+    start = time.time_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.time_ns() - start
+        active = current.get()
+        if active:
+            active.root.queries += 1
+            active.root.query_ns += elapsed
+            if elapsed > SLOW_QUERY_MS * 1000000:
+                slow = Span("db.query", active.trace_id, active, SPAN_KIND_CLIENT)
+                slow.set(db__statement=sql[:500])
+                (slow.start, slow.end) = (start, start + elapsed)
+                active.root.spans.append(slow)
+
+
+# around every hook call, via the wrappers in plugins/tracing.py
+@contextmanager
+def hook_span(hook_name, task):
+    from missions.apps import get_plugin_manager  # the registry imports plugins
+
+    with span("hook %s" % hook_name) as hook:
+        if hook is None:
+            yield None
+            return
+        found = get_plugin_manager().resolve(hook_name, {"task": task})
+        hook.set(hook=hook_name, plugin=found[1].name if found else "*")
+        if task:
+            hook.set(task__id=task.id)
+        if hook_name in LLM_HOOKS:
+            hook.set(gen_ai__request__model=task.get_llm())
+        yield hook
+        if hook_name in LLM_HOOKS:
+            hook.set(gen_ai__usage__input_tokens=task.extras.get("input_tokens", 0))
+
+
+def record_llm_output(hook, task, output):
+    if hook is not None and isinstance(output, str):
+        tokens = token_count_for(output, task.get_llm())
+        hook.set(gen_ai__usage__output_tokens=tokens)
+
+
+def export(mission_id, spans):
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [to_otlp_attribute("service.name", "yamllms")]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": TRACE_SCOPE},
+                        "spans": [s.to_otlp() for s in spans],
+                    }
+                ],
+            }
+        ]
+    }
+    line = json.dumps(request)
+    try:
+        if TRACING == "redis":
+            import django_rq  # type: ignore
+
+            redis = django_rq.get_connection("default")
+            redis.rpush(TRACE_KEY % mission_id, line)
+            redis.expire(TRACE_KEY % mission_id, TRACE_SECONDS)
+        else:
+            with open(TRACE_FILE, "a") as f:
+                f.write(line + "\n")
+    except Exception as ex:
+        log("Error exporting trace spans", ex)
+
+
+def get_mission_spans(mission_id):
+    trace_id = "%032x" % mission_id
+    lines = []
+    try:
+        if TRACING == "redis":
+            import django_rq  # type: ignore
+
+            redis = django_rq.get_connection("default")
+            lines = redis.lrange(TRACE_KEY % mission_id, 0, -1)
+        elif os.path.exists(TRACE_FILE):
+            with open(TRACE_FILE) as f:
+                lines = [l for l in f if trace_id in l]
+    except Exception as ex:
+        log("Error reading trace spans", ex)
+    spans = []
+    for line in lines:
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans += [s for s in scope["spans"] if s["traceId"] == trace_id]
+    return spans
+
+
+# rows for a waterfall chart: offset and width as percentages of the whole trace
+def get_waterfall(spans):
+    if not spans:
+        return []
+    start = min(int(s["startTimeUnixNano"]) for s in spans)
+    end = max(int(s["endTimeUnixNano"]) for s in spans)
+    total = max(end - start, 1)
+    parents = {s["spanId"]: s["parentSpanId"] for s in spans}
+    rows = []
+    for s in sorted(spans, key=lambda s: int(s["startTimeUnixNano"])):
+        span_start = int(s["startTimeUnixNano"])
+        span_end = int(s["endTimeUnixNano"])
+        depth = 0
+        parent = s["parentSpanId"]
+        while parent and parent in parents:
+            depth += 1
+            parent = parents[parent]
+        attributes = from_otlp_attributes(s["attributes"])
+        rows.append(
+            {
+                "name": s["name"],
+                "plugin": attributes.get("plugin", ""),
+                "task_id": attributes.get("task.id", ""),
+                "depth": depth,
+                "indent": depth * 1.5,
+                "offset": round(100 * (span_start - start) / total, 2),
+                "width": max(round(100 * (span_end - span_start) / total, 2), 0.2),
+                "seconds": round((span_end - span_start) / 1e9, 3),
+                "attributes": attributes,
+                "error": s["status"].get("message", ""),
+            }
+        )
+    return rows
+
+
+# HTTP client spans for requests (GitHub, Jira, etc.) and httpx (the LLM SDKs)
+def instrument_http():
+    import httpx
+    from requests.adapters import HTTPAdapter
+
+    if getattr(HTTPAdapter.send, "traced", False):
+        return
+
+    send = HTTPAdapter.send
+
+    def traced_send(self, request, **kwargs):
+        with http_span(request.method, request.url) as s:
+            response = send(self, request, **kwargs)
+            if s is not None:
+                retries = getattr(getattr(response.raw, "retries", None), "history", [])
+                s.set(http__retries=len(retries or []))
+                record_response(s, response.status_code, response.headers)
+            return response
+
+    traced_send.traced = True
+    HTTPAdapter.send = traced_send
+
+    handle_request = httpx.HTTPTransport.handle_request
+
+    def traced_handle_request(self, request):
+        with http_span(request.method, "%s" % request.url) as s:
+            response = handle_request(self, request)
+            if s is not None:
+                record_response(s, response.status_code, response.headers)
+            return response
+
+    httpx.HTTPTransport.handle_request = traced_handle_request
+
+
+def http_span(method, url):
+    parts = urlsplit(url)
+    return span(
+        "HTTP %s %s" % (method, parts.hostname),
+        SPAN_KIND_CLIENT,
+        http__method=method,
+        server__address=parts.hostname or "",
+        url__path=parts.path,
+    )
+
+
+def record_response(s, status_code, headers):
+    s.set(http__status_code=status_code)
+    size = headers.get("content-length")
+    if size and size.isdigit():
+        s.set(http__response__bytes=int(size))
+    if status_code >= 400:
+        s.error = "HTTP %s" % status_code
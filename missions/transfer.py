@@ -0,0 +1,193 @@
+import gzip, json
+from collections import Counter
+from contextlib import contextmanager
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from .models import *
+from .util import *
+
+# Streaming export/import of missions and their data as newline-delimited JSON,
+# one record per line, parents before children, so neither side holds it all
+
+EXPORT_CHUNK_SIZE = 1000  # rows per database round trip when exporting
+RAW_CHUNK_SIZE = 100  # raw data rows can be megabytes each
+IMPORT_BATCH_SIZE = 500  # rows per bulk_create
+HEAVY_FIELDS = ["prompt", "response", "rendered", "structured_data", "data"]
+TRANSFER_MODELS = {  # in dependency order
+    "mission": Mission,
+    "task": Task,
+    "rawdata": RawData,
+    "metric": Metric,
+}
+TRANSFER_NAMES = {model: name for name, model in TRANSFER_MODELS.items()}
+
+
+def open_ndjson(filename, mode):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t", encoding="utf-8")
+    return open(filename, mode, encoding="utf-8")
+
+
+def get_export_querysets(mission_ids=None, since=None):
+    missions = Mission.objects.all()
+    if mission_ids:
+        missions = missions.filter(id__in=mission_ids)
+    if since:
+        missions = missions.filter(created_at__gte=since)
+    return {
+        "mission": missions,
+        "task": Task.objects.filter(mission__in=missions),
+        "rawdata": RawData.objects.filter(task__mission__in=missions),
+        "metric": Metric.objects.filter(mission__in=missions),
+    }
+
+
+def get_export_fields(model, skip_heavy=False):
+    fields = model._meta.concrete_fields
+    return [f.attname for f in fields if not (skip_heavy and f.name in HEAVY_FIELDS)]
+
+
+# rows as dicts rather than model instances, streamed in chunks (server-side cursors
+# on Postgres); skip_heavy leaves out prompts, responses, and raw data altogether
+def export_records(querysets, skip_heavy=False, chunk_size=EXPORT_CHUNK_SIZE):
+    for name, model in TRANSFER_MODELS.items():
+        fields = get_export_fields(model, skip_heavy)
+        size = min(chunk_size, RAW_CHUNK_SIZE) if model is RawData else chunk_size
+        rows = querysets[name].order_by("id").values(*fields)
+        for row in rows.iterator(chunk_size=size):
+            yield {"model": name, "id": row.pop("id"), "fields": row}
+
+
+def export_ndjson(filename, querysets, skip_heavy=False, chunk_size=EXPORT_CHUNK_SIZE):
+    counts = Counter()
+    with open_ndjson(filename, "w") as f:
+        for record in export_records(querysets, skip_heavy, chunk_size):
+            f.write(json.dumps(record, cls=DjangoJSONEncoder, separators=(",", ":")))
+            f.write("\n")
+            counts[record["model"]] += 1
+    return counts
+
+
+# bulk_create would otherwise stamp every imported row with the current time
+@contextmanager
+def preserve_timestamps(model):
+    fields = [
+        f
+        for f in model._meta.concrete_fields
+        if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)
+    ]
+    previous = [(f.auto_now, f.auto_now_add) for f in fields]
+    for field in fields:
+        (field.auto_now, field.auto_now_add) = (False, False)
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, previous):
+            (field.auto_now, field.auto_now_add) = (auto_now, auto_now_add)
+
+
+# Records get new ids on import. Foreign keys to exported records are remapped via
+# old-to-new id maps, kept only for models something points at; references within
+# a model, like task parents, are set once all of that model is in, since they can
+# point forward; templates are kept if they exist here, and dropped otherwise.
+class BulkImporter:
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.ids = {}  # per referenced model, old id to new
+        for model in TRANSFER_MODELS.values():
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model in TRANSFER_NAMES:
+                    self.ids[TRANSFER_NAMES[field.related_model]] = {}
+        self.existing = {}  # ids of templates and other records not exported
+        self.current = None
+        self.buffer = []  # (old id, instance, self references) to create
+        self.pending = []  # (new id, field, old id) self references to set
+        self.counts = Counter()
+
+    def add(self, record):
+        name = record["model"]
+        if name not in TRANSFER_MODELS:
+            raise Exception("Unknown model in import: %s" % name)
+        if name != self.current:
+            self.finish_model()
+            self.current = name
+        model = TRANSFER_MODELS[name]
+        (values, references) = ({}, {})
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.attname not in record["fields"]:
+                continue
+            value = record["fields"][field.attname]
+            if not field.is_relation:
+                values[field.attname] = field.to_python(value)
+                continue
+            if value is None:
+                pass
+            elif field.related_model is model:
+                references[field] = value
+                value = None
+            elif field.related_model in TRANSFER_NAMES:
+                value = self.ids[TRANSFER_NAMES[field.related_model]].get(value)
+            elif value not in self.get_existing(field.related_model):
+                value = None
+            if value is None and not field.null:
+                self.counts["skipped %s" % name] += 1  # its parent wasn't imported
+                return
+            values[field.attname] = value
+        self.buffer.append((record["id"], model(**values), references))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def get_existing(self, model):
+        if model not in self.existing:
+            self.existing[model] = set(model.objects.values_list("id", flat=True))
+        return self.existing[model]
+
+    def flush(self):
+        if not self.buffer:
+            return
+        model = TRANSFER_MODELS[self.current]
+        if not self.dry_run:
+            with preserve_timestamps(model):
+                model.objects.bulk_create([b[1] for b in self.buffer])
+        ids = self.ids.get(self.current)
+        for old_id, instance, references in self.buffer:
+            new_id = old_id if self.dry_run else instance.id
+            if ids is not None:
+                ids[old_id] = new_id
+            for field, value in references.items():
+                self.pending.append((new_id, field, value))
+        self.counts[self.current] += len(self.buffer)
+        self.buffer = []
+
+    def finish_model(self):
+        self.flush()
+        if not self.pending or self.dry_run:
+            self.pending = []
+            return
+        model = TRANSFER_MODELS[self.current]
+        ids = self.ids.get(self.current, {})
+        fields = set([p[1] for p in self.pending])
+        for field in fields:
+            updates = []
+            for new_id, pending_field, value in self.pending:
+                if pending_field == field and value in ids:
+                    updates.append(model(**{"id": new_id, field.attname: ids[value]}))
+                if len(updates) >= self.batch_size:
+                    model.objects.bulk_update(updates, [field.name])
+                    updates = []
+            if updates:
+                model.objects.bulk_update(updates, [field.name])
+        self.pending = []
+
+
+# all or nothing, so a failed import leaves no half-linked records behind
+def import_ndjson(filename, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    importer = BulkImporter(batch_size, dry_run)
+    with transaction.atomic():
+        with open_ndjson(filename, "r") as f:
+            for line in f:
+                if line.strip():
+                    importer.add(json.loads(line))
+        importer.finish_model()
+    return importer.counts
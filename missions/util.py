@@ -1,13 +1,13 @@
 import datetime
 import json
 import logging
+import re
+import time
 from types import SimpleNamespace
+from typing import Any
 
-import stripe
-import tiktoken
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from google.generativeai.generative_models import GenerativeModel  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -34,9 +34,11 @@ FORECAST_API = "https://api.forecastapp.com"
 GOOGLE_CHAT_API = "https://chat.googleapis.com"
 MONDAY_API = "https://api.monday.com/v2"
 SENTRY_API = "https://sentry.io/api/0"
+BING_API = "https://api.bing.microsoft.com/"
 
 YAML_DIVIDER = "\n\n---\n\n"
 FINAL_TASK_DIVIDER = "\n\n---\n\n"
+CACHE_BREAK = "<!--DAI-CACHE-->"  # ends the part of an input shared by sibling tasks
 
 # custom URLs for individual task types
 BASE_PREFIX = "https://" + settings.BASE_DOMAIN
@@ -112,6 +114,8 @@ CLAUDE_MODELS = [
 NEMOTRON_70B = "nvidia/llama-3.1-nemotron-70b-instruct"
 NEMOTRON_MODELS = [NEMOTRON_70B]
 
+BENCH_MODEL = "bench-llm"  # fake LLM with configurable latency, see plugins/bench.py
+
 # note these include prompt and response, and we add some buffer
 TOKEN_LIMITS = {
     TEST_MODEL: 16384,
@@ -138,6 +142,7 @@ TOKEN_LIMITS = {
     CLAUDE_HAIKU: 192000,
     CLAUDE_HAIKU_LATEST: 192000,
     NEMOTRON_70B: 120000,
+    BENCH_MODEL: 120000,
 }
 MAX_THREADED_MSG_LENGTH = 28768  # actually 32K but we want to be safe and not have one message overwhelm the context
 MINIMUM_RESERVED_TOKENS = 8192
@@ -240,6 +245,9 @@ EXCLUDE_FROM_TREE = [
     ".woff2",
 ]
 
+# one pass over each path instead of a substring test per exclusion
+EXCLUDE_FROM_TREE_RE = re.compile("|".join(re.escape(e) for e in EXCLUDE_FROM_TREE))
+
 ALL_INTEGRATIONS = [
     "github",
     "linear",
@@ -352,7 +360,10 @@ def get_token_limit_for(llm):
 
 # Used to not overload the contet window with massive data
 # TODO flags to handle excessive inputs in ways other than truncating
-def get_sized_prompt(task, prompt, truncate_to=None):
+# cacheable keeps the CACHE_BREAK marker for providers that split on it
+def get_sized_prompt(task, prompt, truncate_to=None, cacheable=False):
+    if not cacheable:
+        prompt = prompt.replace(CACHE_BREAK, "")
     llm = task.get_llm()
     tokens = token_count_for(prompt, llm)
     task.extras["input_length"] = len(prompt)
@@ -360,41 +371,112 @@ def get_sized_prompt(task, prompt, truncate_to=None):
     task.extras["truncated"] = False
     max_input_tokens = get_token_limit_for(llm)
     if tokens > max_input_tokens:
-        encoding = encoding_for(llm)
         fraction = max_input_tokens / tokens
         prompt = prompt[: int(fraction * len(prompt))]
         prompt = prompt.rpartition(" ")[0] + "\n\n---\n\n Input truncated."
-        truncated_tokens = encoding.encode_ordinary(prompt)
         task.extras["truncated_length"] = len(prompt)
-        task.extras["truncated_tokens"] = len(truncated_tokens)
+        task.extras["truncated_tokens"] = token_count_for(prompt, llm)
         task.extras["truncated"] = True
     task.save()
     return prompt
 
 
-def encoding_for(llm):
-    llm_encoding = llm
-    # TODO different token counters for different models
-    for prefix in ["gpt-4", "o1-", "mistral", "gemini", "claude", "nvidia/llama"]:
+# models we count with a local tiktoken encoding, approximate for non-OpenAI models
+ENCODED_FAMILIES = ["gpt-4", "o1-", "mistral", "claude", "nvidia/llama"]
+# models without a local tokenizer, whose counts are estimated
+ESTIMATED_FAMILIES = ["gemini", BENCH_MODEL]
+ENCODING_RETRY_SECONDS = 300  # before trying again to load an encoding that failed
+ESTIMATE_PATTERN = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+ESTIMATE_WORD_CHARS = 5  # alphanumeric characters per token within a long word
+
+
+# the tokenizer family for a model, so encoders are shared across model versions
+def get_token_family(llm):
+    for prefix in ESTIMATED_FAMILIES:
         if llm.startswith(prefix):
-            llm_encoding = "gpt-4"
-    return tiktoken.encoding_for_model(llm_encoding)
+            return prefix
+    for prefix in ENCODED_FAMILIES:
+        if llm.startswith(prefix):
+            return "gpt-4"
+    return llm
 
 
-def token_count_for(text, llm="gpt-4"):
-    if llm.startswith("gemini"):
-        model = GenerativeModel(llm)
-        count = model.count_tokens(text)
-        return count.total_tokens
+encodings: dict[str, Any] = {}  # per family, once loaded
+encoding_failures: dict[str, float] = {}  # per family, when loading last failed
+
+
+# built once per family; None if it can't be loaded, in which case we estimate
+# until it's worth retrying, since loading can fail on a transient network error
+def get_encoding(family):
+    if family in encodings:
+        return encodings[family]
+    if time.time() - encoding_failures.get(family, 0) < ENCODING_RETRY_SECONDS:
+        return None
+    try:
+        import tiktoken  # deferred, it's slow to import
+
+        encodings[family] = tiktoken.encoding_for_model(family)
+        return encodings[family]
+    except Exception as ex:
+        log("Error loading token encoding for", family, ex)
+        encoding_failures[family] = time.time()
+        return None
+
+
+def encoding_for(llm):
+    return get_encoding(get_token_family(llm))
 
-    encoding = encoding_for(llm)
+
+# offline estimate: words split into short pieces, each symbol or non-ASCII char a token
+def estimate_tokens(text):
+    pieces = ESTIMATE_PATTERN.findall(text or "")
+    return sum([1 + (len(p) - 1) // ESTIMATE_WORD_CHARS for p in pieces])
+
+
+# token counts for many texts at once, never over the network
+def count_many(texts, llm="gpt-4"):
+    family = get_token_family(llm)
+    if family in ESTIMATED_FAMILIES:
+        return [estimate_tokens(t) for t in texts]
+    encoding = get_encoding(family)
+    if encoding is None:
+        return [estimate_tokens(t) for t in texts]
     try:
-        tokens = encoding.encode_ordinary(text)
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
     except Exception as ex:
-        # there's a tiktoken bug, fake it by having tokens be half the prompt
+        # there's a tiktoken bug, fall back to estimating
         log("Failed to encode prompt", ex)
-        tokens = text[: len(" %s " % text) // 2]
-    return len(tokens)
+        return [estimate_tokens(t) for t in texts]
+
+
+def token_count_for(text, llm="gpt-4"):
+    return count_many([text], llm)[0]
+
+
+# take the longest text, cut it in half, and repeat until the joined texts fit,
+# counting each text once up front and then only the one that was cut
+def truncate_to_fit(texts, llm, divider, reserved=""):
+    texts = list(texts)
+    counts = count_many(texts + [divider, reserved], llm)
+    (divider_tokens, reserved_tokens) = counts[-2:]
+    counts = counts[:-2]
+    limit = get_token_limit_for(llm) - reserved_tokens
+    limit -= divider_tokens * max(len(texts) - 1, 0)
+    while texts and sum(counts) > limit:
+        lengths = [len(t) for t in texts]
+        max_idx = lengths.index(max(lengths))
+        long_text = texts[max_idx]
+        if len(long_text) < 2:
+            break
+        texts[max_idx] = long_text[: len(long_text) // 2] + "\n\n(truncated)\n..."
+        counts[max_idx] = token_count_for(texts[max_idx], llm)
+    return texts
+
+
+# the shared, cacheable start of an input (e.g. key context), and the rest
+def split_cacheable(input):
+    (context, found, data) = (input or "").partition(CACHE_BREAK)
+    return (context, data) if found else ("", input or "")
 
 
 def is_too_long(text, llm):
@@ -510,90 +592,6 @@ def get_file_intro(name, data):
     return r
 
 
-def combine_devs(d1, d2):
-    commits = d1.get("commits", [])
-    opened = d1.get("prs_opened", 0) + d2.get("prs_opened", 0)
-    merged = d1.get("prs_merged", 0) + d2.get("prs_merged", 0)
-    closed = d1.get("prs_closed", 0) + d2.get("prs_closed", 0)
-    d1 = d1 | d2
-    new_commits = d2.get("commits", [])
-    existing_ids = [c["sha"] for c in commits]
-    for c in new_commits:
-        if c["sha"] not in existing_ids:
-            commits.append(c)
-    d1["commits"] = commits
-    d1["prs_opened"] = opened
-    d1["prs_closed"] = closed
-    d1["prs_merged"] = merged
-    return d1
-
-
-def concatenate_dev_data(tasks):
-    log("Concatenating dev data", tasks)
-    all_devs = {}
-    tasks_with_devs = set()
-
-    for t in tasks:
-        for dep in [t] + t.prerequisite_tasks():
-            devs = dep.structured_data.get("devs", {})
-            if devs:
-                tasks_with_devs.add(dep)
-
-    for t in list(tasks_with_devs):
-        devs = t.structured_data.get("devs", {})
-        for key in devs:
-            if key not in all_devs:
-                all_devs[key] = devs[key]
-            else:
-                dev = all_devs[key]
-                new_dev = devs[key]
-                all_devs[key] = combine_devs(dev, new_dev)
-    return all_devs
-
-
-def combine_devs_by_name(devs):
-    names = set()
-    for key in devs:
-        dev = devs[key]
-        if "name" in dev:
-            names.add(dev["name"])
-        else:
-            log("No name found for", key, dev)
-    devs_by_name = {}
-    for name in names:
-        combined = {}
-        for key in devs:
-            dev = devs[key]
-            if "name" in dev and dev["name"] == name:
-                combined = combine_devs(combined, dev)
-        devs_by_name[name] = combined
-    return devs_by_name
-
-
-def get_dev_data_totals(task, since_days):
-    devs = task.structured_data.get("devs", {})
-    all_files = set()
-    all_commits = []
-    for dev in devs:
-        commits = devs[dev].get("commits", [])
-        all_commits += [
-            c for c in commits if c["type"] == "normal" and c["days_ago"] <= since_days
-        ]
-        for file in devs[dev].get("files", []):
-            all_files.add(file)
-    total_changes = sum([c["changes"] for c in all_commits])
-    total_prs_opened = sum([c.get("prs_opened", 0) for c in all_commits])
-    total_prs_merged = sum([c.get("prs_merged", 0) for c in all_commits])
-    return {
-        "devs": len(devs),
-        "commits": len(all_commits),
-        "changes": total_changes,
-        "files": len(all_files),
-        "opened": total_prs_opened,
-        "merged": total_prs_merged,
-    }
-
-
 def get_jira_projects_from(jira, task=None):
     if not jira:
         jira = task.get_integration("jira")
@@ -730,28 +728,6 @@ def order_sub_reports(tasks):
     return sorted(tasks, key=lambda x: x.dynamic_order)
 
 
-def get_dev_summary(dev):
-    commits = dev.get("commits", [])
-    commits = [c for c in commits if c["type"] == "normal"]
-    files = set()
-    [files.update(c["files"]) for c in commits]
-    vals = {
-        "name": dev.get("name"),
-        "link": dev.get("link", ""),
-        "avatar": dev.get("avatar", ""),
-        "commits": len(commits),
-        "changes": sum([c["changes"] for c in commits]),
-        "files": len(files),
-        "branches": len(set([c["branch"] for c in commits])),
-        "pr_branches": len(dev.get("pr_branches", [])),
-        "prs_opened": dev.get("prs_opened", 0),
-        "prs_merged": dev.get("prs_merged", 0),
-        "prs_closed": dev.get("prs_closed", 0),
-        "prs": f"{dev.get('prs_opened', 0)}/{dev.get('prs_merged', 0)}/{dev.get('prs_closed', 0)}",
-    }
-    return SimpleNamespace(**vals)
-
-
 def get_dev_diff(dev, prev):
     vals = {
         "commits": dev.commits - prev.commits,
@@ -903,6 +879,8 @@ def stripe_url_for_project(project, url_type):
         logger.warning(f"Project {project.id} has no Stripe subscription ID")
         return ""
 
+    import stripe  # deferred, only the config views need it
+
     try:
         stripe.api_key = settings.STRIPE_SECRET_KEY
         url_type = "subscription_%s" % url_type
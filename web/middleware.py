@@ -0,0 +1,20 @@
+from django.core.exceptions import MiddlewareNotUsed
+
+from missions import queries
+
+
+# per web request query counts and likely N+1s, when QUERY_AUDIT is set
+class QueryAuditMiddleware:
+    def __init__(self, get_response):
+        if queries.QUERY_AUDIT != "true":
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with queries.audit_queries() as audit:
+            response = self.get_response(request)
+        response["X-Query-Count"] = "%s" % audit.count
+        queries.record_request(
+            request.method, request.path, response.status_code, audit
+        )
+        return response
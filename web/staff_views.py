@@ -6,8 +6,9 @@ from django.template import loader
 
 from missions.models import *
 from missions.admin_jobs import email_mission
-from missions.plugins.figma import get_figma_projects
-from missions.plugins.jira import get_jira_projects
+from missions.apps import get_plugin_manager
+from missions.queries import get_request_audits
+from missions.tracing import get_mission_spans, get_waterfall
 
 
 def email_report(request):
@@ -36,7 +37,10 @@ def mission(request, mission_id):
     if not request.user.is_staff:
         return redirect("index")
     template = loader.get_template("staff/mission.html")
-    context = {"mission": Mission.objects.get(id=mission_id)}
+    context = {
+        "mission": Mission.objects.get(id=mission_id),
+        "waterfall": get_waterfall(get_mission_spans(mission_id)),
+    }
     return HttpResponse(template.render(context, request))
 
 
@@ -51,6 +55,17 @@ def task(request, task_id):
     return HttpResponse(template.render(context, request))
 
 
+def queries(request):
+    if not request.user.is_staff:
+        return redirect("index")
+    audits = get_request_audits()
+    if request.GET.get("repeats"):
+        audits = [a for a in audits if a["repeats"]]
+    context = {"audits": audits, "routes": get_plugin_manager().route_counts()}
+    template = loader.get_template("staff/queries.html")
+    return HttpResponse(template.render(context, request))
+
+
 def raw_data(request, raw_data_id):
     if not request.user.is_staff:
         return redirect("index")
@@ -86,6 +101,9 @@ def customer(request, customer_id):
 def customer_integrations(request, customer_id, vendor):
     if not request.user.is_staff:
         return redirect("index")
+    from missions.plugins.figma import get_figma_projects
+    from missions.plugins.jira import get_jira_projects
+
     customer = Customer.objects.get(id=customer_id)
     integrations = list(customer.integration_set.filter(vendor=vendor))
     for integration in integrations:
@@ -8,6 +8,7 @@ staff_patterns = [
     path("mission/<int:mission_id>/", staff_views.mission, name="mission"),
     path("task/<int:task_id>/", staff_views.task, name="task"),
     path("raw_data/<int:raw_data_id>/", staff_views.raw_data, name="raw_data"),
+    path("queries/", staff_views.queries, name="queries"),
     path("mission_info/<int:id>/", staff_views.mission_info, name="mission_info"),
     path("cache_bust", staff_views.cache_bust, name="cache_bust"),
 ]
@@ -138,7 +138,7 @@ def index(request):
 @conditional_ratelimit(key="ip", rate="60/h")
 def reports(request, page_length=40):
     mission_list = Mission.objects.filter(
-        status__gte=Mission.MissionStatus.COMPLETE,
+        status=Mission.MissionStatus.COMPLETE,
         mission_info__customer__isnull=True,
         visibility=Visibility.PUBLIC,
     ).order_by("-created_at")